@@ -0,0 +1,4 @@
+import os
+
+# Settings exige a chave mesmo sem chamadas externas nos testes
+os.environ.setdefault('OPENAI_API_KEY', 'test')
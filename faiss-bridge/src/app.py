@@ -1,15 +1,42 @@
-from fastapi import FastAPI  # type: ignore[import-not-found]
+from fastapi import FastAPI, HTTPException  # type: ignore[import-not-found]
+from fastapi.responses import Response, StreamingResponse  # type: ignore[import-not-found]
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore[import-not-found]
-from typing import Any, Dict, List
+import os, json, time, asyncio, threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, NamedTuple, Tuple
 from pydantic import BaseModel
 from .config import settings  # type: ignore[attr-defined]
-from .store import store  # type: ignore[attr-defined]
+from .store import store, tenants, VectorStore, SEARCH_MODES  # type: ignore[attr-defined]
 from .utils import logger  # type: ignore[attr-defined]
-from openai import OpenAI  # type: ignore[import-not-found]
+from .cache import QueryCache, normalize_query  # type: ignore[attr-defined]
+from .batcher import MicroBatcher  # type: ignore[attr-defined]
+from .rerank import load_reranker, rerank_many  # type: ignore[attr-defined]
+from .metrics import REGISTRY, CONTENT_TYPE, Sampler, profile_path  # type: ignore[attr-defined]
+from openai import AsyncOpenAI  # type: ignore[import-not-found]
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+# perguntas repetidas são comuns no chat: evita o round trip de embedding
+query_cache = QueryCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL_S, settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL_S)
+reranker = load_reranker(settings.RERANKER)
 
-app = FastAPI(title='faiss-bridge')  # type: ignore[call-arg]
+# /metrics: latência por etapa (histogramas) e contadores por endpoint
+REQUEST_SECONDS = REGISTRY.histogram('bridge_request_seconds', 'Latência total do request HTTP', ('endpoint',))
+REQUESTS = REGISTRY.counter('bridge_requests_total', 'Requests HTTP por endpoint e status', ('endpoint', 'status'))
+EMBED_SECONDS = REGISTRY.histogram('bridge_embed_seconds', 'Chamada à API de embeddings (só queries fora do cache)')
+EMBED_INPUTS = REGISTRY.counter('bridge_embed_inputs_total', 'Queries enviadas à API de embeddings')
+SEARCH_SECONDS = REGISTRY.histogram('bridge_search_seconds', 'Busca da 1ª etapa por lote de queries', ('mode',))
+RERANK_SECONDS = REGISTRY.histogram('bridge_rerank_seconds', 'Rerank por lote de queries')
+SERIALIZE_SECONDS = REGISTRY.histogram('bridge_serialize_seconds', 'Serialização JSON da resposta', ('endpoint',))
+QUERIES = REGISTRY.counter('bridge_queries_total', 'Queries buscadas por modo', ('mode',))
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+	# novos snapshots do indexer entram sem reiniciar o processo
+	tenants.watch(settings.INDEX_POLL_S)
+	yield
+	tenants.stop()
+
+app = FastAPI(title='faiss-bridge', lifespan=lifespan)  # type: ignore[call-arg]
 
 origins = [o.strip() for o in settings.ALLOWED_ORIGINS.split(',')] if settings.ALLOWED_ORIGINS != '*' else ['*']
 app.add_middleware(  # type: ignore[attr-defined]
@@ -20,25 +47,321 @@ app.add_middleware(  # type: ignore[attr-defined]
 	allow_headers=["*"],
 )
 
-class QueryIn(BaseModel):  # type: ignore[misc]
+ENDPOINTS = {'/search': 'search', '/search/batch': 'search_batch', '/health': 'health', '/metrics': 'metrics', '/cache/stats': 'cache_stats'}
+
+class MetricsMiddleware:
+	"""ASGI puro (sem BaseHTTPMiddleware): latência e status por endpoint, inclusive respostas em stream."""
+	def __init__(self, app: Any):
+		self.app = app
+
+	async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+		if scope['type'] != 'http':
+			return await self.app(scope, receive, send)
+		endpoint = ENDPOINTS.get(scope['path'], 'other')  # labels limitados: paths desconhecidos não viram séries novas
+		status = [500]
+		async def send_status(message: Dict[str, Any]):
+			if message['type'] == 'http.response.start':
+				status[0] = message['status']
+			await send(message)
+		t0 = time.perf_counter()
+		try:
+			await self.app(scope, receive, send_status)
+		finally:
+			REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint)
+			REQUESTS.inc(1, endpoint, str(status[0]))
+
+class ProfileMiddleware:
+	"""Com PROFILE_DIR: requests com o header `X-Profile: 1` rodam sob o Sampler e a
+	pilha amostrada vai para PROFILE_DIR/*.folded (caminho no header de resposta).
+
+	Amostra todas as threads do processo, então requests simultâneos aparecem
+	juntos; um profile por vez. Sem PROFILE_DIR o middleware nem é instalado.
+	"""
+	def __init__(self, app: Any, directory: str, interval_ms: float):
+		self.app = app
+		self.directory = directory
+		self.interval = interval_ms / 1000
+		self.busy = threading.Lock()
+
+	async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+		if scope['type'] != 'http' or (b'x-profile', b'1') not in scope['headers'] or not self.busy.acquire(blocking=False):
+			return await self.app(scope, receive, send)
+		sampler = Sampler(self.interval).start()
+		name = ENDPOINTS.get(scope['path'], 'other')
+		path = profile_path(self.directory, name)
+		async def send_path(message: Dict[str, Any]):
+			if message['type'] == 'http.response.start':
+				message['headers'] = list(message.get('headers', [])) + [(b'x-profile-file', path.encode())]
+			await send(message)
+		try:
+			await self.app(scope, receive, send_path)
+		finally:
+			sampler.stop()
+			self.busy.release()
+			await asyncio.to_thread(sampler.write, path)
+			logger.info(f"Profile {name}: {sampler.samples} amostras em {path}")
+
+app.add_middleware(MetricsMiddleware)  # type: ignore[attr-defined]
+if settings.PROFILE_DIR:
+	app.add_middleware(ProfileMiddleware, directory=settings.PROFILE_DIR, interval_ms=settings.PROFILE_INTERVAL_MS)  # type: ignore[attr-defined]
+
+class Filters(BaseModel):  # type: ignore[misc]
+	tenant: str | None = None  # shard em TENANTS_DIR/<tenant>, ou filtro no índice padrão
+	source: str | None = None  # 'site' | 'doc'
+	url_prefix: str | None = None
+	mode: str | None = None  # vector | hybrid | lexical; None = SEARCH_MODE
+	rerank: bool | None = None  # 2ª etapa com o RERANKER; None = RERANK_DEFAULT
+	timings: bool = False  # inclui o tempo de cada etapa na resposta
+
+	def search_mode(self) -> str:
+		mode = self.mode or settings.SEARCH_MODE
+		if mode not in SEARCH_MODES:
+			raise HTTPException(status_code=422, detail=f"mode deve ser um de {', '.join(SEARCH_MODES)}")
+		return mode
+
+	def use_rerank(self) -> bool:
+		if self.rerank and reranker is None:
+			raise HTTPException(status_code=422, detail='rerank indisponível: configure RERANKER')
+		return reranker is not None and (self.rerank if self.rerank is not None else settings.RERANK_DEFAULT)
+
+class QueryIn(Filters):  # type: ignore[misc]
 	query: str
 	top_k: int = 5
 
+class BatchIn(Filters):  # type: ignore[misc]
+	queries: List[str] = []
+	vectors: List[List[float]] = []  # embeddings já calculados (no lugar de queries)
+	top_k: int = 5
+	stream: bool | None = None  # NDJSON; None = automático a partir de SEARCH_STREAM_MIN queries
+
 @app.get('/health')  # type: ignore[misc]
 def health() -> Dict[str, Any]:
-	return {'status':'ok','chunks': len(store.meta)}
+	vs = store.current
+	return {'status':'ok','chunks': len(vs.meta), 'version': vs.version, 'reloads': store.reloads, 'tenants': tenants.stats()}
 
-@app.post('/search')  # type: ignore[misc]
-def search(q: QueryIn) -> Dict[str, List[Dict[str, Any]]]:
-	if not q.query.strip():
-		return {'results': []}
-	emb = client.embeddings.create(model=settings.EMBEDDING_MODEL, input=[q.query])
-	vec = emb.data[0].embedding
-	results = store.search(vec, q.top_k)
+def _cache_counts(kind: str):
+	return lambda: [((name,), getattr(getattr(query_cache, name), kind)) for name in ('embeddings', 'results')]
+
+REGISTRY.gauge('bridge_index_chunks', 'Chunks do snapshot padrão carregado', lambda: [((), len(store.current.meta))])
+REGISTRY.gauge('bridge_index_reloads_total', 'Snapshots recarregados sem reinício', lambda: [((), store.reloads)], kind='counter')
+REGISTRY.gauge('bridge_cache_hits_total', 'Hits do cache de queries', _cache_counts('hits'), ('cache',), kind='counter')
+REGISTRY.gauge('bridge_cache_misses_total', 'Misses do cache de queries', _cache_counts('misses'), ('cache',), kind='counter')
+REGISTRY.gauge('bridge_batcher_batches_total', 'Lotes executados pelo micro-batcher', lambda: [((), batcher.batches)], kind='counter')
+REGISTRY.gauge('bridge_batcher_items_total', 'Queries que passaram pelo micro-batcher', lambda: [((), batcher.items)], kind='counter')
+
+@app.get('/metrics')  # type: ignore[misc]
+def metrics() -> Response:
+	return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get('/cache/stats')  # type: ignore[misc]
+def cache_stats() -> Dict[str, Any]:
+	return {**query_cache.stats(), 'batcher': batcher.stats()}
+
+EMBED_MAX_INPUTS = 2048  # limite de inputs por request da API de embeddings
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+	out: List[List[float]] = []
+	for i in range(0, len(texts), EMBED_MAX_INPUTS):
+		t0 = time.perf_counter()
+		emb = await client.embeddings.create(model=settings.EMBEDDING_MODEL, input=texts[i:i+EMBED_MAX_INPUTS])
+		EMBED_SECONDS.observe(time.perf_counter() - t0)
+		EMBED_INPUTS.inc(len(texts[i:i+EMBED_MAX_INPUTS]))
+		out.extend(d.embedding for d in sorted(emb.data, key=lambda d: d.index))
+	return out
+
+def format_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 	# normalize score 0..1 to 0..100
 	out: List[Dict[str, Any]] = []
 	for r in results:
 		score = (r['score'] + 1) / 2  # cosine -1..1
 		out.append({**r, 'score': round(score*100,2)})
-	return {'results': out}
+	return out
+
+def ms(t0: float) -> float:
+	return round((time.perf_counter() - t0) * 1000, 2)
+
+def json_response(payload: Dict[str, Any], endpoint: str) -> Response:
+	# serializa aqui (e não no FastAPI) para medir o custo no histograma
+	t0 = time.perf_counter()
+	body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+	SERIALIZE_SECONDS.observe(time.perf_counter() - t0, endpoint)
+	return Response(body, media_type='application/json')
+
+def run_search(vs: VectorStore, vecs: List[List[float]], k: int, filters: Dict[str, Any] | None, texts: List[str] | None,
+	mode: str, rerank: bool) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+	"""1ª etapa (RERANK_CANDIDATES candidatos se houver rerank) e rerank opcional; devolve também os tempos."""
+	t0 = time.perf_counter()
+	results = vs.search_many(vecs, max(k, settings.RERANK_CANDIDATES) if rerank else k, filters, texts, mode)
+	SEARCH_SECONDS.observe(time.perf_counter() - t0, mode)
+	QUERIES.inc(len(vecs), mode)
+	timings: Dict[str, Any] = {'search_ms': ms(t0)}
+	if rerank and texts:
+		t0 = time.perf_counter()
+		assert reranker is not None
+		results, done = rerank_many(reranker, texts, results, k, settings.RERANK_BUDGET_MS, settings.RERANK_BATCH)
+		RERANK_SECONDS.observe(time.perf_counter() - t0)
+		timings.update({'rerank_ms': ms(t0), 'reranked': done})
+	return results, timings
+
+async def search_vectors(vecs: List[List[float]], k: int, vs: VectorStore | None = None, filters: Dict[str, Any] | None = None,
+	texts: List[str] | None = None, mode: str = 'vector', rerank: bool = False) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+	# numpy/faiss liberam o GIL: scan e rerank rodam numa thread sem travar o event loop
+	return await asyncio.to_thread(run_search, vs or store.current, vecs, k, filters, texts, mode, rerank)
+
+async def resolve_store(f: Filters) -> Tuple[VectorStore, Dict[str, Any]]:
+	"""Snapshot a consultar (shard do tenant ou o padrão) e os filtros a aplicar nele."""
+	if not f.tenant:
+		return store.current, {'source': f.source, 'url_prefix': f.url_prefix}
+	try:
+		# pode carregar o shard do disco na primeira busca do tenant
+		hs, shard = await asyncio.to_thread(tenants.get, f.tenant)
+	except ValueError as e:
+		raise HTTPException(status_code=422, detail=str(e))
+	return hs.current, {'tenant': None if shard else f.tenant, 'source': f.source, 'url_prefix': f.url_prefix}
+
+class SearchItem(NamedTuple):
+	"""Uma query pronta para a busca, validada por `plan`."""
+	text: str  # '' quando o vetor veio no request
+	k: int
+	vs: VectorStore
+	filters: Dict[str, Any]
+	mode: str
+	rerank: bool
+	scope: Hashable | None  # chave do cache de resultados; None = não usa o cache
+
+async def plan(f: Filters, texts: bool = True) -> Tuple[VectorStore, Dict[str, Any], str, bool]:
+	"""Snapshot, filtros, modo e rerank do request (validados); `texts=False` para vetores prontos."""
+	mode = f.search_mode() if texts else 'vector'
+	rerank = f.use_rerank() and texts
+	vs, filters = await resolve_store(f)
+	return vs, filters, mode, rerank
+
+def items_for(f: Filters, texts: List[str], k: int, vs: VectorStore, filters: Dict[str, Any], mode: str, rerank: bool) -> List[SearchItem]:
+	scope = (vs.version, f.tenant, f.source, f.url_prefix, mode, rerank)
+	return [SearchItem(t, k, vs, filters, mode, rerank, scope if t else None) for t in texts]
+
+async def search_items(items: List[SearchItem], vecs: List[List[float]] | None = None) -> List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+	"""Caminho único de /search (via micro-batcher) e /search/batch; devolve (resultados, tempos) por item.
+
+	Queries no cache de resultados voltam direto; as demais (repetidas no lote
+	rodam uma vez) usam `vecs` ou um request de embeddings só para as que
+	faltam no cache e um scan/index.search por (snapshot, filtros, modo,
+	rerank) sobre a matriz de queries. Rerank cortado pelo orçamento (ordem da
+	1ª etapa) não fica em cache: a próxima vez pode caber.
+	"""
+	out: List[Tuple[List[Dict[str, Any]], Dict[str, Any]]] = [([], {}) for _ in items]
+	todo: Dict[Hashable, List[int]] = {}
+	for i, it in enumerate(items):
+		hit = query_cache.get_result(it.text, it.k, it.scope) if it.scope is not None else None
+		if hit is not None:
+			out[i] = (hit, {'cached': True})
+		else:
+			todo.setdefault((normalize_query(it.text), it.k, it.scope) if it.scope is not None else i, []).append(i)
+	if not todo:
+		return out
+	first = [rows[0] for rows in todo.values()]
+	t0 = time.perf_counter()
+	qv = [vecs[i] for i in first] if vecs is not None else await query_cache.embed_many([items[i].text for i in first], embed_texts)
+	embed_ms = ms(t0)
+	groups: Dict[Any, List[int]] = {}
+	for j, i in enumerate(first):
+		it = items[i]
+		groups.setdefault((id(it.vs), tuple(sorted(it.filters.items())), it.mode, it.rerank), []).append(j)
+	async def run(js: List[int]) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+		it = items[first[js[0]]]
+		return await search_vectors([qv[j] for j in js], max(items[first[j]].k for j in js), it.vs, it.filters, [items[first[j]].text for j in js], it.mode, it.rerank)
+	same = list(todo.values())
+	for js, (results, timings) in zip(groups.values(), await asyncio.gather(*[run(js) for js in groups.values()])):
+		for n, (j, r) in enumerate(zip(js, results)):
+			it = items[first[j]]
+			t = {'embed_ms': embed_ms, **timings, 'batch': len(items), 'cached': False}
+			if 'reranked' in t:
+				t['reranked'] = t['reranked'][n]
+			res = format_results(r[:it.k])
+			if it.scope is not None:
+				query_cache.put_result(it.text, it.k, it.scope, res, timings.get('search_ms', 0) + timings.get('rerank_ms', 0), t.get('reranked', True))
+			for i in same[j]:
+				out[i] = (res, t)
+	return out
+
+def batch_timings(per_item: List[Dict[str, Any]]) -> Dict[str, Any]:
+	"""Tempos da busca do lote e, por query (na ordem das não vazias), `reranked` e `cached`."""
+	out = dict(next((t for t in per_item if not t.get('cached')), {}))
+	if 'reranked' in out:
+		out['reranked'] = [bool(t.get('reranked', t.get('cached'))) for t in per_item]
+	out['cached'] = [bool(t.get('cached')) for t in per_item]
+	return out
+
+batcher = MicroBatcher(search_items, settings.SEARCH_BATCH_WINDOW_MS, settings.SEARCH_MAX_BATCH, settings.SEARCH_MAX_INFLIGHT)
+
+@app.post('/search')  # type: ignore[misc]
+async def search(q: QueryIn) -> Response:
+	"""Uma query: lote de um item de `search_items`; o micro-batcher junta com as demais que chegarem na janela."""
+	if not q.query.strip():
+		return json_response({'results': []}, 'search')
+	t0 = time.perf_counter()
+	vs, filters, mode, rerank = await plan(q)
+	results, timings = await batcher.submit(items_for(q, [q.query.strip()], q.top_k, vs, filters, mode, rerank)[0])
+	out: Dict[str, Any] = {'results': results}
+	if q.timings:
+		out['timings'] = {**timings, 'total_ms': ms(t0)}  # cached: veio do cache de resultados
+	return json_response(out, 'search')
 
+@app.post('/search/batch')  # type: ignore[misc]
+async def search_many(b: BatchIn) -> Any:
+	"""Várias queries (ou vetores) por request: um embedding em lote e uma busca
+	matricial pelo mesmo `search_items` de /search. `results[i]` corresponde a
+	`queries[i]`; em NDJSON cada linha é `{"index": i, "results": [...]}`, na
+	ordem das queries."""
+	if bool(b.queries) == bool(b.vectors):
+		raise HTTPException(status_code=422, detail='informe queries ou vectors')
+	if b.vectors and (b.mode not in (None, 'vector') or b.rerank):
+		raise HTTPException(status_code=422, detail='modos hybrid/lexical e rerank precisam do texto das queries')
+	t0 = time.perf_counter()
+	n = len(b.queries or b.vectors)
+	vs, filters, mode, rerank = await plan(b, bool(b.queries))  # o request inteiro (inclusive o stream) usa um único snapshot
+	if b.vectors:
+		dim = vs.vectors.shape[1] if vs.vectors is not None else None
+		if dim is not None and any(len(v) != dim for v in b.vectors):
+			raise HTTPException(status_code=422, detail=f'vetores devem ter dimensão {dim}')
+		rows, vecs, texts = list(range(n)), b.vectors, [''] * n
+	else:
+		rows = [i for i, t in enumerate(b.queries) if t.strip()]
+		texts = [b.queries[i].strip() for i in rows]
+		# um request de embeddings para o lote todo, mesmo quando a busca sai em blocos
+		vecs = await query_cache.embed_many(texts, embed_texts) if rows else []
+	embed_ms = ms(t0)
+	items = items_for(b, texts, b.top_k, vs, filters, mode, rerank)
+	def with_timings(payload: Dict[str, Any], t: Dict[str, Any]) -> Dict[str, Any]:
+		if b.timings:
+			payload['timings'] = {**t, 'embed_ms': embed_ms, 'total_ms': ms(t0)}
+		return payload
+	stream = b.stream if b.stream is not None else n >= settings.SEARCH_STREAM_MIN
+	if not stream:
+		results: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+		found = await search_items(items, vecs)
+		for i, (r, _) in zip(rows, found):
+			results[i] = r
+		return json_response(with_timings({'results': results}, batch_timings([t for _, t in found])), 'search_batch')
+	async def lines() -> AsyncIterator[bytes]:
+		# busca em blocos: as primeiras linhas saem antes do lote inteiro terminar
+		done = 0
+		serialize = 0.0
+		step = max(1, settings.SEARCH_MAX_BATCH)
+		for start in range(0, len(rows), step):
+			part = await search_items(items[start:start+step], vecs[start:start+step])
+			for i, (r, timings) in zip(rows[start:start+step], part):
+				while done < i:
+					yield (json.dumps({'index': done, 'results': []}) + '\n').encode()
+					done += 1
+				# timings (se pedidos) são os do bloco de queries desta linha
+				t = time.perf_counter()
+				line = (json.dumps(with_timings({'index': i, 'results': r}, timings), ensure_ascii=False) + '\n').encode()
+				serialize += time.perf_counter() - t
+				yield line
+				done += 1
+		while done < n:
+			yield (json.dumps({'index': done, 'results': []}) + '\n').encode()
+			done += 1
+		SERIALIZE_SECONDS.observe(serialize, 'search_batch_stream')
+	return StreamingResponse(lines(), media_type='application/x-ndjson')
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+class MicroBatcher:
+	"""Junta os itens que chegam dentro de `window_ms` numa única chamada ao handler.
+
+	O primeiro item de uma janela arma o timer; o lote sai quando a janela
+	fecha ou quando atinge `max_batch`. Com `max_inflight` lotes já em voo os
+	itens continuam acumulando até um deles terminar, então o tamanho do lote
+	cresce com a carga. `handler(itens)` devolve um resultado por item, na
+	mesma ordem; uma exceção do handler falha todo o lote.
+	"""
+	def __init__(self, handler: Callable[[List[Any]], Awaitable[List[Any]]], window_ms: float, max_batch: int, max_inflight: int = 0):
+		self.handler = handler
+		self.window = window_ms / 1000
+		self.max_batch = max(1, max_batch)
+		self.max_inflight = max_inflight  # 0 = sem limite
+		self._pending: List[Tuple[Any, 'asyncio.Future[Any]']] = []
+		self._timer: asyncio.TimerHandle | None = None
+		self._tasks: Set['asyncio.Task[None]'] = set()
+		self.batches = 0
+		self.items = 0
+		self.max_seen = 0
+
+	async def submit(self, item: Any) -> Any:
+		loop = asyncio.get_running_loop()
+		fut: 'asyncio.Future[Any]' = loop.create_future()
+		self._pending.append((item, fut))
+		if len(self._pending) >= self.max_batch or self.window <= 0:
+			self._flush()
+		elif self._timer is None:
+			self._timer = loop.call_later(self.window, self._flush)
+		return await fut
+
+	def _flush(self):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		if not self._pending or (self.max_inflight and len(self._tasks) >= self.max_inflight):
+			return  # o próximo lote sai quando um dos em voo terminar
+		batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+		self.batches += 1
+		self.items += len(batch)
+		self.max_seen = max(self.max_seen, len(batch))
+		task = asyncio.get_running_loop().create_task(self._run(batch))
+		self._tasks.add(task)  # referência forte até terminar
+		task.add_done_callback(self._done)
+		if self._pending and self._timer is None:
+			self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+	def _done(self, task: 'asyncio.Task[None]'):
+		self._tasks.discard(task)
+		if self._pending and self._timer is None:
+			self._flush()
+
+	async def _run(self, batch: List[Tuple[Any, 'asyncio.Future[Any]']]):
+		try:
+			results = await self.handler([item for item, _ in batch])
+		except BaseException as e:
+			for _, fut in batch:
+				if not fut.done():
+					fut.set_exception(e)
+			return
+		for (_, fut), res in zip(batch, results):
+			if not fut.done():
+				fut.set_result(res)
+
+	def stats(self) -> Dict[str, Any]:
+		return {'batches': self.batches, 'items': self.items, 'avg_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+			'max_batch': self.max_seen, 'window_ms': self.window * 1000}
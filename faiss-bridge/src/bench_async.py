@@ -0,0 +1,150 @@
+"""Throughput do /search com N clientes concorrentes contra um stub local de embeddings.
+
+Uso (a partir de faiss-bridge/):
+	python -m src.bench_async --chunks 100000 --dim 256 --clients 200 --requests 4000
+
+Sobe um stub compatível com POST /v1/embeddings (vetores determinísticos por
+hash do texto, latência fixa + por item, como um upstream real), a bridge via
+uvicorn apontando para ele (OPENAI_BASE_URL) e dispara `--requests` queries
+distintas (cache de queries desligado) com `--clients` conexões simultâneas.
+Rodadas (`--modes`): `single` = uma query por request de embedding e por scan
+(sem micro-batching); `batch` = configuração padrão do micro-batcher.
+"""
+import os, sys, json, time, socket, base64, asyncio, hashlib, argparse, subprocess
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+import numpy as np  # type: ignore[import-not-found]
+from typing import Any, Dict, List
+
+def free_port() -> int:
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+
+def stub_app(dim: int, latency_ms: float, per_item_ms: float):  # type: ignore[no-untyped-def]
+	from fastapi import FastAPI, Request  # type: ignore[import-not-found]
+	app = FastAPI()
+	stats = {'requests': 0, 'inputs': 0}
+
+	@app.post('/v1/embeddings')  # type: ignore[misc]
+	async def embeddings(req: Request) -> Dict[str, Any]:
+		body = await req.json()
+		inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+		stats['requests'] += 1
+		stats['inputs'] += len(inputs)
+		await asyncio.sleep((latency_ms + per_item_ms * len(inputs)) / 1000)
+		data = []
+		b64 = body.get('encoding_format') == 'base64'
+		for i, text in enumerate(inputs):
+			seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+			vec = np.random.default_rng(seed).standard_normal(dim).astype('<f4')
+			data.append({'object': 'embedding', 'index': i, 'embedding': base64.b64encode(vec.tobytes()).decode() if b64 else vec.tolist()})
+		return {'object': 'list', 'data': data, 'model': body.get('model', 'stub'), 'usage': {'prompt_tokens': 0, 'total_tokens': 0}}
+
+	@app.get('/stats')  # type: ignore[misc]
+	def get_stats() -> Dict[str, int]:
+		return stats
+	return app
+
+def wait_http(url: str, timeout: float = 60):
+	import httpx  # type: ignore[import-not-found]
+	t0 = time.time()
+	while time.time() - t0 < timeout:
+		try:
+			httpx.get(url, timeout=1)
+			return
+		except Exception:
+			time.sleep(0.2)
+	raise RuntimeError(f'{url} não subiu')
+
+async def post_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str, payload: Dict[str, Any]) -> int:
+	# HTTP/1.1 keep-alive mínimo: o cliente não pode ser o gargalo do benchmark
+	body = json.dumps(payload).encode()
+	writer.write(f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+	head = await reader.readuntil(b'\r\n\r\n')
+	status = int(head.split(b' ', 2)[1])
+	length = 0
+	for line in head.split(b'\r\n'):
+		if line.lower().startswith(b'content-length:'):
+			length = int(line.split(b':')[1])
+	await reader.readexactly(length)
+	return status
+
+async def load(url: str, clients: int, requests: int, top_k: int) -> Dict[str, Any]:
+	host, port = url.split('//')[1].split(':')
+	lat: List[float] = []
+	errors = 0
+	counter = iter(range(requests))
+	async def worker():
+		nonlocal errors
+		reader, writer = await asyncio.open_connection(host, int(port))
+		try:
+			for i in counter:
+				t = time.perf_counter()
+				try:
+					ok = await post_json(reader, writer, host, '/search', {'query': f'pergunta {i}', 'top_k': top_k}) == 200
+				except (OSError, asyncio.IncompleteReadError):
+					ok = False
+					writer.close()
+					reader, writer = await asyncio.open_connection(host, int(port))
+				if not ok:
+					errors += 1
+					continue
+				lat.append((time.perf_counter() - t) * 1000)
+		finally:
+			writer.close()
+	t0 = time.perf_counter()
+	await asyncio.gather(*[worker() for _ in range(clients)])
+	total = time.perf_counter() - t0
+	arr = np.array(lat)
+	return {'qps': round(requests / total, 1), 'p50_ms': round(float(np.percentile(arr, 50)), 1), 'p99_ms': round(float(np.percentile(arr, 99)), 1), 'errors': errors}
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--chunks', type=int, default=100_000)
+	ap.add_argument('--dim', type=int, default=256)
+	ap.add_argument('--dir', default='/tmp/faiss-bridge-bench-async')
+	ap.add_argument('--clients', type=int, default=200)
+	ap.add_argument('--requests', type=int, default=4000)
+	ap.add_argument('--modes', default='single,batch')
+	ap.add_argument('--latency-ms', type=float, default=50)
+	ap.add_argument('--per-item-ms', type=float, default=0.2)
+	ap.add_argument('--top-k', type=int, default=5)
+	ap.add_argument('--serve-stub', type=int, help=argparse.SUPPRESS)
+	args = ap.parse_args()
+	import uvicorn  # type: ignore[import-not-found]
+	if args.serve_stub:
+		uvicorn.run(stub_app(args.dim, args.latency_ms, args.per_item_ms), host='127.0.0.1', port=args.serve_stub, log_level='warning')
+		return
+	from .bench_load import generate  # type: ignore[attr-defined]
+	marker = os.path.join(args.dir, 'chunks.offsets.npy')
+	if not os.path.exists(marker) or len(np.load(marker)) != args.chunks + 1:
+		generate(args.dir, args.chunks, args.dim, 300)
+	stub_port = free_port()
+	stub = subprocess.Popen([sys.executable, '-m', 'src.bench_async', '--serve-stub', str(stub_port), '--dim', str(args.dim),
+		'--latency-ms', str(args.latency_ms), '--per-item-ms', str(args.per_item_ms)])
+	try:
+		wait_http(f'http://127.0.0.1:{stub_port}/stats')
+		for mode in args.modes.split(','):
+			port = free_port()
+			env = {**os.environ, 'INDEX_DIR': args.dir, 'OPENAI_BASE_URL': f'http://127.0.0.1:{stub_port}/v1',
+				'QUERY_CACHE_SIZE': '0', 'RESULT_CACHE_SIZE': '0'}
+			if mode == 'single':
+				env.update({'SEARCH_MAX_BATCH': '1', 'SEARCH_MAX_INFLIGHT': '0'})
+			bridge = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'src.app:app', '--port', str(port), '--log-level', 'warning', '--backlog', '4096', '--timeout-keep-alive', '75'], env=env)
+			try:
+				url = f'http://127.0.0.1:{port}'
+				wait_http(url + '/health')
+				asyncio.run(load(url, args.clients, min(args.clients, args.requests), args.top_k))  # warmup
+				res = asyncio.run(load(url, args.clients, args.requests, args.top_k))
+				import httpx  # type: ignore[import-not-found]
+				batch = httpx.get(url + '/cache/stats').json()['batcher']
+				print(json.dumps({'mode': mode, 'clients': args.clients, 'requests': args.requests, **res, 'avg_batch': batch['avg_batch'], 'max_batch': batch['max_batch']}))
+			finally:
+				bridge.terminate(); bridge.wait()
+		import httpx  # type: ignore[import-not-found]
+		print(json.dumps({'stub': httpx.get(f'http://127.0.0.1:{stub_port}/stats').json()}))
+	finally:
+		stub.terminate(); stub.wait()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,112 @@
+"""Tempo de carga e RSS do VectorStore: layout antigo vs compacto (mmap).
+
+Uso (a partir de faiss-bridge/):
+	python -m src.bench_load --chunks 1000000 --dim 256 --dir /tmp/bench-index
+
+Gera um índice sintético com os dois layouts no mesmo diretório (meta.json +
+vectors.npy + index.faiss, como o indexer exportava; chunks.jsonl +
+chunks.offsets.npy + vectors.f16.npy) e mede cada modo num processo novo:
+- legacy: json.load(meta.json) + np.load(vectors.npy) + faiss.read_index
+- mmap: VectorStore.load com VECTORS_DTYPE=float32
+- f16: VectorStore.load com VECTORS_DTYPE=float16
+RSS separado em anônimo (privado do processo) e file-backed (page cache do
+mmap, compartilhado entre workers).
+"""
+import os, sys, json, time, argparse, subprocess
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+import numpy as np  # type: ignore[import-not-found]
+from typing import Dict, Any
+
+def rss_mb() -> Dict[str, float]:
+	out: Dict[str, float] = {}
+	with open('/proc/self/status') as f:
+		for line in f:
+			key, _, val = line.partition(':')
+			if key in ('VmRSS', 'VmHWM', 'RssAnon', 'RssFile'):
+				out[key] = int(val.split()[0]) / 1024
+	return out
+
+def generate(base: str, n: int, dim: int, text_chars: int, block: int = 100_000):
+	import faiss  # type: ignore[import-not-found]
+	os.makedirs(base, exist_ok=True)
+	rng = np.random.default_rng(0)
+	vecs = np.lib.format.open_memmap(os.path.join(base, 'vectors.npy'), mode='w+', dtype='float32', shape=(n, dim))
+	f16 = np.lib.format.open_memmap(os.path.join(base, 'vectors.f16.npy'), mode='w+', dtype='float16', shape=(n, dim))
+	index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))  # type: ignore[attr-defined]
+	for i in range(0, n, block):
+		part = rng.standard_normal((min(block, n-i), dim), dtype=np.float32)
+		part /= np.linalg.norm(part, axis=1, keepdims=True)
+		vecs[i:i+len(part)] = part
+		f16[i:i+len(part)] = part
+		index.add_with_ids(part, np.arange(i, i+len(part), dtype='int64'))  # type: ignore[call-arg]
+	vecs.flush(); f16.flush()
+	del vecs, f16
+	faiss.write_index(index, os.path.join(base, 'index.faiss'))  # type: ignore[attr-defined]
+	del index
+	filler = ('lorem ipsum dolor sit amet ' * (text_chars // 27 + 1))[:text_chars]
+	offsets = np.empty(n + 1, dtype='int64')
+	pos = 0
+	with open(os.path.join(base, 'meta.json'), 'w', encoding='utf-8') as fj, open(os.path.join(base, 'chunks.jsonl'), 'wb') as fc:
+		for i in range(n):
+			line = json.dumps({'chunk_id': str(i), 'title': f'Doc {i // 10}', 'url': f'https://example.com/p/{i // 10}', 'source': 'site', 'tenant_id': 'bench', 'text': f'{i} {filler}'}, ensure_ascii=False)
+			fj.write((',' if i else '[') + line)
+			data = (line + '\n').encode('utf-8')
+			offsets[i] = pos
+			fc.write(data)
+			pos += len(data)
+		offsets[n] = pos
+		fj.write(']')
+	np.save(os.path.join(base, 'chunks.offsets.npy'), offsets)
+
+def measure(base: str, mode: str, queries: int) -> Dict[str, Any]:
+	# o módulo store carrega INDEX_DIR ao ser importado (como no app)
+	os.environ['INDEX_DIR'] = os.path.join(base, 'missing') if mode == 'legacy' else base
+	os.environ['VECTORS_DTYPE'] = 'float16' if mode == 'f16' else 'float32'
+	t0 = time.perf_counter()
+	from .store import store as vs  # type: ignore[attr-defined]
+	if mode == 'legacy':
+		import faiss  # type: ignore[import-not-found]
+		with open(os.path.join(base, 'meta.json'), 'r') as f: meta = json.load(f)
+		vs.set_data(np.load(os.path.join(base, 'vectors.npy')), meta)
+		index = faiss.read_index(os.path.join(base, 'index.faiss'))  # type: ignore[attr-defined]  # noqa: F841
+	load_s = time.perf_counter() - t0
+	after_load = rss_mb()
+	assert vs.vectors is not None
+	rng = np.random.default_rng(1)
+	qs = rng.standard_normal((queries, vs.vectors.shape[1]), dtype=np.float32)
+	vs.search(qs[0].tolist(), 5)
+	lat = []
+	for q in qs:
+		t = time.perf_counter()
+		vs.search(q.tolist(), 5)
+		lat.append((time.perf_counter() - t) * 1000)
+	return {'mode': mode, 'chunks': len(vs.meta), 'load_s': round(load_s, 3),
+		'rss_load_mb': round(after_load.get('VmRSS', 0), 1), 'anon_load_mb': round(after_load.get('RssAnon', 0), 1),
+		'rss_search_mb': round(rss_mb().get('VmRSS', 0), 1), 'anon_search_mb': round(rss_mb().get('RssAnon', 0), 1),
+		'peak_mb': round(rss_mb().get('VmHWM', 0), 1), 'search_p50_ms': round(float(np.percentile(lat, 50)), 2)}
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--chunks', type=int, default=1_000_000)
+	ap.add_argument('--dim', type=int, default=256)
+	ap.add_argument('--text-chars', type=int, default=300)
+	ap.add_argument('--dir', default='/tmp/faiss-bridge-bench-load')
+	ap.add_argument('--modes', default='legacy,mmap,f16')
+	ap.add_argument('--queries', type=int, default=20)
+	ap.add_argument('--measure', help=argparse.SUPPRESS)
+	args = ap.parse_args()
+	if args.measure:
+		print(json.dumps(measure(args.dir, args.measure, args.queries)))
+		return
+	marker = os.path.join(args.dir, 'chunks.offsets.npy')
+	if not os.path.exists(marker) or len(np.load(marker)) != args.chunks + 1:
+		t0 = time.perf_counter()
+		generate(args.dir, args.chunks, args.dim, args.text_chars)
+		print(f"índice sintético gerado em {time.perf_counter()-t0:.1f}s: {args.dir}", file=sys.stderr)
+	for mode in args.modes.split(','):
+		# processo novo por modo: RSS e page cache de um não contaminam o outro
+		r = subprocess.run([sys.executable, '-m', 'src.bench_load', '--dir', args.dir, '--queries', str(args.queries), '--measure', mode], capture_output=True, text=True)
+		print(r.stdout.strip() if r.returncode == 0 else json.dumps({'mode': mode, 'error': r.stderr.strip().splitlines()[-1:]}))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,126 @@
+"""Benchmark de latência do VectorStore.search com vetores sintéticos.
+
+Uso (a partir de faiss-bridge/):
+	python -m src.bench_search --sizes 10000,100000,1000000 --dim 256 --queries 200
+
+Com --legacy também mede o loop antigo (um utils.cosine por linha) para
+comparação; só faz sentido em tamanhos pequenos.
+
+Com --hybrid gera também um índice BM25 sintético (vocabulário Zipf,
+`--terms-per-chunk` termos distintos por chunk, no formato `bm25.*` do indexer)
+e mede os modos lexical e hybrid com perguntas de 3 termos.
+"""
+import os, json, argparse, tempfile, time
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+import numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Any
+from .store import VectorStore  # type: ignore[attr-defined]
+from .utils import cosine  # type: ignore[attr-defined]
+
+def make_store(n: int, dim: int, seed: int = 0) -> VectorStore:
+	rng = np.random.default_rng(seed)
+	vecs = np.empty((n, dim), dtype='float32')
+	step = 100_000
+	for i in range(0, n, step):
+		block = rng.standard_normal((min(step, n-i), dim), dtype=np.float32)
+		block /= np.linalg.norm(block, axis=1, keepdims=True)
+		vecs[i:i+len(block)] = block
+	meta = [{'chunk_id': str(i), 'title': '', 'url': '', 'text': ''} for i in range(n)]
+	vs = VectorStore(autoload=False)
+	vs.set_data(vecs, meta)
+	return vs
+
+def make_bm25(base: str, n: int, terms_per_chunk: int, vocab: int = 200_000, seed: int = 0):
+	from .lexical import TOKENIZER  # type: ignore[attr-defined]
+	rng = np.random.default_rng(seed)
+	keys = []
+	for i in range(0, n, 100_000):
+		m = min(100_000, n - i)
+		t = np.minimum(rng.zipf(1.2, m * terms_per_chunk), vocab) - 1
+		r = np.repeat(np.arange(i, i + m, dtype='int64'), terms_per_chunk)
+		keys.append(np.unique(t.astype('int64') * n + r))  # (termo, linha) sem repetição
+	key = np.concatenate(keys)
+	del keys
+	key.sort()
+	terms, rows = key // n, (key % n).astype('int32')
+	del key
+	offsets = np.zeros(vocab + 1, dtype='int64')
+	np.cumsum(np.bincount(terms, minlength=vocab), out=offsets[1:])
+	del terms
+	np.save(os.path.join(base, 'bm25.rows.npy'), rows)
+	np.save(os.path.join(base, 'bm25.impact.npy'), (0.5 + rng.random(len(rows), dtype=np.float32)).astype('float16'))
+	np.save(os.path.join(base, 'bm25.offsets.npy'), offsets)
+	words = [f't{i:06d}' for i in range(vocab)]
+	np.save(os.path.join(base, 'bm25.vocab.npy'), np.arange(vocab + 1, dtype='int64') * 8)
+	with open(os.path.join(base, 'bm25.vocab.bin'), 'wb') as f:
+		f.write(''.join(w + '\n' for w in words).encode())
+	with open(os.path.join(base, 'bm25.json'), 'w') as f:
+		json.dump({'tokenizer': TOKENIZER, 'n': n, 'postings': int(len(rows))}, f)
+
+def legacy_search(vs: VectorStore, query_vec: List[float], k: int) -> List[tuple[int, float]]:
+	q = np.array(query_vec, dtype='float32')
+	q = q / (np.linalg.norm(q) + 1e-9)
+	assert vs.vectors is not None
+	sims = [(i, cosine(q, vs.vectors[i])) for i in range(vs.vectors.shape[0])]
+	sims.sort(key=lambda x: x[1], reverse=True)
+	return sims[:k]
+
+def percentiles(lat_ms: List[float]) -> Dict[str, float]:
+	arr = np.array(lat_ms)
+	return {'p50_ms': float(np.percentile(arr, 50)), 'p99_ms': float(np.percentile(arr, 99)), 'qps': float(1000.0 / arr.mean())}
+
+def timed(vs: VectorStore, qs: np.ndarray, k: int, texts: List[str] | None = None, mode: str = 'vector') -> Dict[str, float]:
+	vs.search_many([qs[0]], k, texts=texts[:1] if texts else None, mode=mode)  # warmup
+	lat: List[float] = []
+	for i, q in enumerate(qs):
+		t0 = time.perf_counter()
+		vs.search_many([q.tolist()], k, texts=[texts[i]] if texts else None, mode=mode)
+		lat.append((time.perf_counter() - t0) * 1000)
+	return percentiles(lat)
+
+def run(n: int, dim: int, queries: int, k: int, legacy: bool, hybrid: bool = False, terms_per_chunk: int = 40) -> Dict[str, Any]:
+	vs = make_store(n, dim)
+	rng = np.random.default_rng(1)
+	qs = rng.standard_normal((queries, dim), dtype=np.float32)
+	res: Dict[str, Any] = {'n': n, 'dim': dim, **timed(vs, qs, k)}
+	if hybrid:
+		from .lexical import BM25Index  # type: ignore[attr-defined]
+		with tempfile.TemporaryDirectory() as base:
+			make_bm25(base, n, terms_per_chunk)
+			vs.lexical = BM25Index(base)
+			texts = [' '.join(f't{t:06d}' for t in np.minimum(rng.zipf(1.2, 3), 200_000) - 1) for _ in range(queries)]
+			res['postings'] = vs.lexical.info['postings']
+			res['lexical'] = timed(vs, qs, k, texts, 'lexical')
+			res['hybrid'] = timed(vs, qs, k, texts, 'hybrid')
+			vs.lexical = None
+	if legacy:
+		lat_old: List[float] = []
+		for q in qs[:min(queries, 20)]:
+			t0 = time.perf_counter()
+			legacy_search(vs, q.tolist(), k)
+			lat_old.append((time.perf_counter() - t0) * 1000)
+		res['legacy'] = percentiles(lat_old)
+	return res
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark VectorStore.search')
+	parser.add_argument('--sizes', default='10000,100000,1000000')
+	parser.add_argument('--dim', type=int, default=256, help='3072 = text-embedding-3-large (1M x 3072 ocupa ~12GB)')
+	parser.add_argument('--queries', type=int, default=200)
+	parser.add_argument('--top-k', type=int, default=5)
+	parser.add_argument('--legacy', action='store_true', help='mede também o loop Python antigo')
+	parser.add_argument('--hybrid', action='store_true', help='mede também os modos lexical e hybrid (BM25 sintético)')
+	parser.add_argument('--terms-per-chunk', type=int, default=40)
+	args = parser.parse_args()
+	for n in [int(s) for s in args.sizes.split(',') if s.strip()]:
+		r = run(n, args.dim, args.queries, args.top_k, args.legacy, args.hybrid, args.terms_per_chunk)
+		line = f"n={r['n']:>8} dim={r['dim']} p50={r['p50_ms']:.2f}ms p99={r['p99_ms']:.2f}ms qps={r['qps']:.1f}"
+		if 'legacy' in r:
+			line += f" | legacy p50={r['legacy']['p50_ms']:.2f}ms p99={r['legacy']['p99_ms']:.2f}ms"
+		for mode in ('lexical', 'hybrid'):
+			if mode in r:
+				line += f" | {mode} p50={r[mode]['p50_ms']:.2f}ms p99={r[mode]['p99_ms']:.2f}ms"
+		print(line)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,58 @@
+"""Carga e busca do VectorStore sobre um OUT_DIR real (usado pelo indexer/src/bench_suite.py).
+
+Uso (a partir de faiss-bridge/):
+	python -m src.bench_store --dir /tmp/every-bot-bench/out --queries q.npy --k 10
+
+`--queries` é um .npy (Q × dim) de vetores de query; `--expect` (opcional) um
+.npy com a linha esperada de cada query para medir hit@k. Imprime um JSON com
+load_s, rss_mb, p50/p99 da busca unitária, QPS unitário e QPS em lote.
+"""
+import os, sys, json, time, argparse
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+import numpy as np  # type: ignore[import-not-found]
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--dir', required=True)
+	ap.add_argument('--queries', required=True)
+	ap.add_argument('--expect')
+	ap.add_argument('--k', type=int, default=10)
+	ap.add_argument('--batch', type=int, default=64)
+	args = ap.parse_args()
+	from .bench_load import rss_mb  # type: ignore[attr-defined]
+	from .store import VectorStore  # type: ignore[attr-defined]
+	t0 = time.perf_counter()
+	vs = VectorStore(autoload=False, base=args.dir)
+	vs.load()
+	load_s = time.perf_counter() - t0
+	qs = np.load(args.queries).astype('float32')
+	vs.search_many(qs[:1], args.k)  # aquece páginas e threads do BLAS/faiss
+	lat = []
+	hits = []
+	for q in qs:
+		t = time.perf_counter()
+		rows = vs.ranked(q, args.k)[0]
+		lat.append((time.perf_counter() - t) * 1000)
+		hits.append(rows)
+	t = time.perf_counter()
+	for i in range(0, len(qs), args.batch):
+		vs.search_many(qs[i:i+args.batch], args.k)
+	batch_s = time.perf_counter() - t
+	arr = np.array(lat)
+	out = {
+		'chunks': len(vs.meta),
+		'load_s': round(load_s, 3),
+		'rss_mb': round(rss_mb().get('VmHWM', 0.0), 1),
+		'search_p50_ms': round(float(np.percentile(arr, 50)), 3),
+		'search_p99_ms': round(float(np.percentile(arr, 99)), 3),
+		'search_qps': round(len(qs) / (arr.sum() / 1000), 1),
+		'search_batch_qps': round(len(qs) / batch_s, 1),
+	}
+	if args.expect:
+		expect = np.load(args.expect)
+		out['hit_at_k'] = round(float(np.mean([e in set(r.tolist()) for e, r in zip(expect, hits)])), 4)
+	json.dump(out, sys.stdout)
+	print()
+
+if __name__ == '__main__':
+	main()
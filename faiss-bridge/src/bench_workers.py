@@ -0,0 +1,138 @@
+"""RSS/PSS e QPS da bridge com 1, 4 e 8 workers (python -m src.serve) sobre o mesmo índice.
+
+Uso (a partir de faiss-bridge/):
+	python -m src.bench_workers --chunks 500000 --dim 256 --workers 1,4,8 --seconds 20
+
+Gera o índice sintético do bench_load (+ norms.npy, como o indexer exporta),
+sobe `src.serve` com WORKERS=N e dispara `--clients` conexões com
+POST /search/batch de um vetor por request (sem API de embeddings) durante
+`--seconds`. Memória somada do master e dos workers, lida de
+/proc/<pid>/smaps_rollup depois da carga:
+- rss_mb: soma dos RSS (conta as páginas do mmap uma vez por worker)
+- pss_mb: soma dos PSS (páginas compartilhadas divididas entre os processos;
+  é a memória que o conjunto realmente ocupa)
+- private_mb: páginas só de cada processo (heap, interpretador, cópias)
+`--modes mmap,private`: `private` repete com VECTORS_MMAP=0 (cada worker
+copia os vetores), para comparação.
+"""
+import os, sys, json, time, signal, asyncio, argparse, subprocess
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+import numpy as np  # type: ignore[import-not-found]
+from typing import Any, Dict, List
+from .bench_async import free_port, wait_http, post_json  # type: ignore[attr-defined]
+
+def smaps(pid: int) -> Dict[str, float]:
+	out: Dict[str, float] = {}
+	with open(f'/proc/{pid}/smaps_rollup') as f:
+		for line in f:
+			key, _, val = line.partition(':')
+			if val.strip().endswith('kB'):
+				out[key] = int(val.split()[0]) / 1024
+	return out
+
+def children(pid: int) -> List[int]:
+	try:
+		with open(f'/proc/{pid}/task/{pid}/children') as f:
+			return [int(p) for p in f.read().split()]
+	except FileNotFoundError:
+		return []
+
+def memory(master: int) -> Dict[str, float]:
+	# uvicorn com workers>1: o master só supervisiona; os workers são filhos diretos
+	tot: Dict[str, float] = {'processes': 0, 'rss_mb': 0.0, 'pss_mb': 0.0, 'private_mb': 0.0}
+	for pid in [master] + children(master):
+		try:
+			m = smaps(pid)
+		except FileNotFoundError:
+			continue
+		tot['processes'] += 1
+		tot['rss_mb'] += m.get('Rss', 0)
+		tot['pss_mb'] += m.get('Pss', 0)
+		tot['private_mb'] += m.get('Private_Clean', 0) + m.get('Private_Dirty', 0)
+	return {k: round(v, 1) for k, v in tot.items()}
+
+def write_norms(base: str, block: int = 65536):
+	vecs = np.load(os.path.join(base, 'vectors.npy'), mmap_mode='r')
+	norms = np.lib.format.open_memmap(os.path.join(base, 'norms.npy'), mode='w+', dtype='float32', shape=(vecs.shape[0],))
+	for i in range(0, vecs.shape[0], block):
+		part = np.asarray(vecs[i:i+block], dtype='float32')
+		norms[i:i+block] = np.sqrt((part * part).sum(axis=1))
+	norms.flush()
+
+async def load(url: str, bodies: List[Dict[str, Any]], clients: int, seconds: float) -> Dict[str, Any]:
+	host, port = url.split('//')[1].split(':')
+	lat: List[float] = []
+	errors = 0
+	deadline = time.perf_counter() + seconds
+	async def worker(j: int):
+		nonlocal errors
+		reader, writer = await asyncio.open_connection(host, int(port))
+		i = j
+		try:
+			while time.perf_counter() < deadline:
+				t = time.perf_counter()
+				if await post_json(reader, writer, host, '/search/batch', bodies[i % len(bodies)]) == 200:
+					lat.append((time.perf_counter() - t) * 1000)
+				else:
+					errors += 1
+				i += clients
+		finally:
+			writer.close()
+	t0 = time.perf_counter()
+	await asyncio.gather(*[worker(j) for j in range(clients)])
+	total = time.perf_counter() - t0
+	arr = np.array(lat or [0.0])
+	return {'qps': round(len(lat) / total, 1), 'p50_ms': round(float(np.percentile(arr, 50)), 1), 'p99_ms': round(float(np.percentile(arr, 99)), 1), 'errors': errors}
+
+def run(base: str, workers: int, mode: str, bodies: List[Dict[str, Any]], clients: int, seconds: float, log_path: str) -> Dict[str, Any]:
+	port = free_port()
+	env = {**os.environ, 'INDEX_DIR': base, 'WORKERS': str(workers), 'PORT': str(port), 'HOST': '127.0.0.1',
+		'INDEX_POLL_S': '0', 'VECTORS_MMAP': '0' if mode == 'private' else '1'}
+	with open(log_path, 'w') as log:
+		t0 = time.perf_counter()
+		server = subprocess.Popen([sys.executable, '-m', 'src.serve'], env=env, stdout=log, stderr=subprocess.STDOUT)
+	try:
+		url = f'http://127.0.0.1:{port}'
+		wait_http(url + '/health', timeout=600)
+		# cada worker loga uma vez "Index ... carregado"; só mede com todos prontos
+		while open(log_path).read().count(' carregado: ') < workers:
+			if server.poll() is not None:
+				raise RuntimeError(f'src.serve saiu ({server.returncode}); ver {log_path}')
+			time.sleep(0.2)
+		ready_s = time.perf_counter() - t0
+		asyncio.run(load(url, bodies, clients, min(3.0, seconds)))  # aquece páginas em todos os workers
+		res = asyncio.run(load(url, bodies, clients, seconds))
+		return {'mode': mode, 'workers': workers, 'ready_s': round(ready_s, 1), **res, **memory(server.pid)}
+	finally:
+		server.send_signal(signal.SIGTERM)
+		try:
+			server.wait(60)
+		except subprocess.TimeoutExpired:
+			server.kill()
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--chunks', type=int, default=500_000)
+	ap.add_argument('--dim', type=int, default=256)
+	ap.add_argument('--dir', default='/tmp/faiss-bridge-bench-workers')
+	ap.add_argument('--workers', default='1,4,8')
+	ap.add_argument('--modes', default='mmap')
+	ap.add_argument('--clients', type=int, default=32)
+	ap.add_argument('--seconds', type=float, default=20)
+	ap.add_argument('--top-k', type=int, default=5)
+	args = ap.parse_args()
+	from .bench_load import generate  # type: ignore[attr-defined]
+	marker = os.path.join(args.dir, 'chunks.offsets.npy')
+	if not os.path.exists(marker) or len(np.load(marker)) != args.chunks + 1:
+		t0 = time.perf_counter()
+		generate(args.dir, args.chunks, args.dim, 300)
+		write_norms(args.dir)
+		print(f"índice sintético gerado em {time.perf_counter()-t0:.1f}s: {args.dir}", file=sys.stderr)
+	qs = np.random.default_rng(1).standard_normal((256, args.dim), dtype=np.float32)
+	bodies = [{'vectors': [q.tolist()], 'top_k': args.top_k} for q in qs]
+	for mode in args.modes.split(','):
+		for w in (int(x) for x in args.workers.split(',')):
+			print(json.dumps(run(args.dir, w, mode, bodies, args.clients, args.seconds, os.path.join(args.dir, f'serve-{mode}-{w}.log'))), flush=True)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,186 @@
+import re, time, asyncio, threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+def normalize_query(text: str) -> str:
+	"""Chave de cache da pergunta: espaços colapsados e casefold."""
+	return re.sub(r'\s+', ' ', text).strip().casefold()
+
+class TTLCache:
+	"""LRU com expiração por entrada (thread-safe)."""
+	def __init__(self, maxsize: int, ttl: float):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key: Hashable) -> Any:
+		with self._lock:
+			item = self._data.get(key)
+			if item is not None and (self.ttl <= 0 or item[0] > time.monotonic()):
+				self._data.move_to_end(key)
+				self.hits += 1
+				return item[1]
+			if item is not None:
+				del self._data[key]
+			self.misses += 1
+			return None
+
+	def put(self, key: Hashable, value: Any):
+		if self.maxsize <= 0:
+			return
+		with self._lock:
+			self._data[key] = (time.monotonic() + self.ttl, value)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def stats(self) -> Dict[str, Any]:
+		total = self.hits + self.misses
+		return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl_s': self.ttl, 'hits': self.hits, 'misses': self.misses,
+			'hit_rate': round(self.hits / total, 4) if total else 0.0}
+
+class SingleFlight:
+	"""Corrotinas concorrentes com a mesma chave esperam a primeira em vez de repetir."""
+	def __init__(self):
+		self.calls: Dict[Hashable, 'asyncio.Future[Any]'] = {}
+		self.coalesced = 0
+
+	async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+		fut = self.calls.get(key)
+		if fut is not None:
+			self.coalesced += 1
+			return await asyncio.shield(fut)
+		fut = self.calls[key] = asyncio.get_running_loop().create_future()
+		try:
+			result = await fn()
+		except BaseException as e:
+			fut.set_exception(e)
+			fut.exception()  # marca como lida: seguidores recebem, ninguém mais loga
+			raise
+		else:
+			fut.set_result(result)
+			return result
+		finally:
+			del self.calls[key]
+
+class QueryCache:
+	"""Cache pergunta -> embedding (e opcionalmente -> resultado) com single-flight.
+
+	`saved_ms` estima a latência economizada: cada hit vale a latência média
+	observada do que ele evitou (chamada de embedding, ou embedding + busca no
+	cache de resultados).
+	"""
+	def __init__(self, size: int, ttl: float, result_size: int = 0, result_ttl: float = 0):
+		self.embeddings = TTLCache(size, ttl)
+		self.results = TTLCache(result_size, result_ttl)
+		self.flight = SingleFlight()
+		self._embed_ms = 0.0
+		self._embed_calls = 0
+		self._search_ms = 0.0
+		self._search_calls = 0
+		self.saved_ms = 0.0
+
+	def _avg(self, total: float, calls: int) -> float:
+		return total / calls if calls else 0.0
+
+	async def embed_many(self, texts: List[str], fn: Callable[[List[str]], Awaitable[List[Any]]]) -> List[Any]:
+		"""Embeddings de `texts`: hits do cache, em voo (outro request) ou um único `fn(faltantes)`."""
+		keys = [normalize_query(t) for t in texts]
+		out: List[Any] = [None] * len(texts)
+		waits: Dict[str, 'asyncio.Future[Any]'] = {}
+		todo: Dict[str, str] = {}
+		for i, (key, text) in enumerate(zip(keys, texts)):
+			vec = self.embeddings.get(key)
+			if vec is not None:
+				self.saved_ms += self._avg(self._embed_ms, self._embed_calls)
+				out[i] = vec
+			elif key in waits or key in todo:
+				self.flight.coalesced += 1
+			elif ('emb', key) in self.flight.calls:
+				self.flight.coalesced += 1
+				waits[key] = self.flight.calls[('emb', key)]
+			else:
+				todo[key] = text
+		if todo:
+			loop = asyncio.get_running_loop()
+			mine = {key: loop.create_future() for key in todo}
+			for key, fut in mine.items():
+				self.flight.calls[('emb', key)] = fut
+			try:
+				t0 = time.perf_counter()
+				vecs = await fn(list(todo.values()))
+				self._embed_ms += (time.perf_counter() - t0) * 1000
+				self._embed_calls += 1
+				for (key, fut), vec in zip(mine.items(), vecs):
+					self.embeddings.put(key, vec)
+					fut.set_result(vec)
+			except BaseException as e:
+				for fut in mine.values():
+					fut.set_exception(e)
+					fut.exception()
+				raise
+			finally:
+				for key in mine:
+					self.flight.calls.pop(('emb', key), None)
+			waits.update(mine)
+		for i, key in enumerate(keys):
+			if out[i] is None:
+				out[i] = await asyncio.shield(waits[key])
+		return out
+
+	async def embedding(self, query: str, fn: Callable[[List[str]], Awaitable[List[Any]]]) -> Any:
+		return (await self.embed_many([query], fn))[0]
+
+	def get_result(self, query: str, top_k: int, version: Hashable) -> Any:
+		"""Resultado em cache de (query normalizada, top_k, version), ou None."""
+		if self.results.maxsize <= 0:
+			return None
+		out = self.results.get((normalize_query(query), top_k, version))
+		if out is not None:
+			self.saved_ms += self._avg(self._search_ms, self._search_calls)
+		return out
+
+	def put_result(self, query: str, top_k: int, version: Hashable, res: Any, search_ms: float, keep: bool = True):
+		"""Conta `search_ms` na média do `saved_ms` e guarda `res` (se `keep`)."""
+		self._search_ms += search_ms
+		self._search_calls += 1
+		if keep and self.results.maxsize > 0:
+			self.results.put((normalize_query(query), top_k, version), res)
+
+	async def result(self, query: str, top_k: int, version: Hashable, fn: Callable[[], Awaitable[Any]],
+		keep: Callable[[Any], bool] | None = None) -> Any:
+		"""Resultado de `fn()` em cache por (query normalizada, top_k, version), com single-flight; `keep(res)` falso não guarda."""
+		if self.results.maxsize <= 0:
+			return await fn()
+		out = self.get_result(query, top_k, version)
+		if out is not None:
+			return out
+		async def call() -> Any:
+			t0 = time.perf_counter()
+			res = await fn()
+			self.put_result(query, top_k, version, res, (time.perf_counter() - t0) * 1000, keep is None or keep(res))
+			return res
+		return await self.flight.do(('res', (normalize_query(query), top_k, version)), call)
+
+	def clear(self):
+		self.embeddings.clear()
+		self.results.clear()
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			'embeddings': self.embeddings.stats(),
+			'results': self.results.stats(),
+			'coalesced': self.flight.coalesced,
+			'avg_embed_ms': round(self._avg(self._embed_ms, self._embed_calls), 2),
+			'saved_ms': round(self.saved_ms, 1),
+		}
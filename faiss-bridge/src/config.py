@@ -11,9 +11,45 @@ if not Path('.env').exists() and Path('.env.example').exists():
 
 class Settings(BaseSettings):  # type: ignore[misc]
 	OPENAI_API_KEY: str
+	OPENAI_BASE_URL: str = ""  # vazio = API da OpenAI (útil para stubs locais)
 	EMBEDDING_MODEL: str = "text-embedding-3-large"
 	INDEX_DIR: str = "../indexer/database/every"
+	INDEX_POLL_S: float = 5  # intervalo de checagem de novo snapshot (CURRENT); 0 desliga o hot reload
+	TENANTS_DIR: str = ""  # um subdiretório (OUT_DIR do indexer) por tenant; vazio = só INDEX_DIR
+	TENANT_MEMORY_MB: int = 4096  # orçamento dos shards de tenant carregados (LRU acima disso)
+	FILTER_EXACT_MAX_ROWS: int = 50000  # filtros com até N linhas: scan exato só delas em vez do índice ANN
 	ALLOWED_ORIGINS: str = "*"
+	HOST: str = "0.0.0.0"
+	PORT: int = 8000
+	WORKERS: int = 1  # processos uvicorn (python -m src.serve); 0 = um por CPU. O índice em mmap é compartilhado
+	SEARCH_THREADS: int = 0  # threads BLAS/OpenMP por worker; 0 = CPUs / WORKERS
+	VECTORS_MMAP: bool = True  # vetores via mmap (páginas compartilhadas entre workers)
+	VECTORS_DTYPE: str = "float32"  # float16: usa vectors.f16.npy (ou converte na carga)
+	VECTORS_QUANT: str = ""  # float16 | int8 | binary: 1ª etapa compacta + rescore exato em vectors.npy (mmap); vazio desliga
+	QUANT_RESCORE: int = 200  # candidatos da etapa compacta reordenados pelo cosine exato
+	SEARCH_BACKEND: str = "auto"  # auto: ANN se index.json indicar fábrica não-Flat; exact; ann
+	ANN_NPROBE: int = 0  # 0 = valor gravado em index.json pelo indexer
+	ANN_EF_SEARCH: int = 0
+	QUERY_CACHE_SIZE: int = 10000  # pergunta normalizada -> embedding (0 desliga)
+	QUERY_CACHE_TTL_S: int = 86400
+	RESULT_CACHE_SIZE: int = 0  # (pergunta, top_k, versão do índice) -> resultados; 0 desliga
+	RESULT_CACHE_TTL_S: int = 300
+	SEARCH_MODE: str = "vector"  # padrão do /search: vector | hybrid (RRF denso + BM25) | lexical
+	HYBRID_CANDIDATES: int = 100  # candidatos de cada lista antes da fusão
+	HYBRID_RRF_K: float = 60
+	HYBRID_VECTOR_WEIGHT: float = 1.0
+	HYBRID_LEXICAL_WEIGHT: float = 1.0
+	RERANKER: str = ""  # vazio = sem rerank; lexical; ou pacote.modulo:fabrica (reranker plugável)
+	RERANK_DEFAULT: bool = True  # com RERANKER configurado, requests sem "rerank" usam o rerank
+	RERANK_CANDIDATES: int = 50  # candidatos da 1ª etapa reordenados
+	RERANK_BUDGET_MS: float = 50  # estourou: devolve a ordem da 1ª etapa
+	RERANK_BATCH: int = 32  # candidatos por chamada ao reranker
+	SEARCH_BATCH_WINDOW_MS: float = 3  # janela do micro-batcher (0 = sem espera)
+	SEARCH_MAX_BATCH: int = 64
+	SEARCH_STREAM_MIN: int = 100  # /search/batch responde em NDJSON a partir de N queries
+	SEARCH_MAX_INFLIGHT: int = 4  # lotes simultâneos; acima disso as queries acumulam no próximo
+	PROFILE_DIR: str = ""  # requests com `X-Profile: 1` geram um profile por amostragem aqui; vazio desliga
+	PROFILE_INTERVAL_MS: float = 5
 
 	if 'SettingsConfigDict' in globals() and SettingsConfigDict is not None:  # type: ignore[name-defined]
 		model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')  # type: ignore[call-arg]
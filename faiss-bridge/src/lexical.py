@@ -0,0 +1,136 @@
+import os, re, json, mmap, unicodedata, numpy as np  # type: ignore[import-not-found]
+from typing import Dict, List, Sequence, Tuple
+from .utils import logger  # type: ignore[attr-defined]
+
+TOKENIZER = 'w-casefold-noaccent-v1'
+_WORD = re.compile(r'\w+')
+
+def tokenize(text: str) -> List[str]:
+	"""Mesmo tokenizador do indexer (indexer/src/lexical.py): \\w+, casefold, sem acentos."""
+	text = unicodedata.normalize('NFKD', text.casefold())
+	text = ''.join(c for c in text if not unicodedata.combining(c))
+	return _WORD.findall(text)
+
+class BM25Index:
+	"""Índice invertido BM25 exportado pelo indexer (`bm25.*`), todo via mmap.
+
+	O vocabulário fica ordenado em `bm25.vocab.bin` e é consultado por busca
+	binária, sem montar um dict na carga; as postings de cada termo são uma
+	fatia contígua de `bm25.rows.npy`/`bm25.impact.npy`, com o peso BM25 já
+	normalizado por tamanho do chunk. Por query: idf × impacto somados nas
+	linhas das postings dos termos da pergunta.
+	"""
+	def __init__(self, base: str, rows: int | None = None):
+		with open(os.path.join(base, 'bm25.json'), 'r') as f:
+			self.info = json.load(f)
+		if self.info.get('tokenizer') != TOKENIZER:
+			raise ValueError(f"tokenizador {self.info.get('tokenizer')} diferente do da bridge ({TOKENIZER})")
+		self.n = int(self.info['n'])
+		if rows is not None and self.n != rows:
+			# sobra de outro export: as postings apontariam para outros chunks (ou além do fim)
+			raise ValueError(f"bm25.json tem {self.n} linhas e vectors.npy {rows}")
+		self.vocab_offsets = np.load(os.path.join(base, 'bm25.vocab.npy'), mmap_mode='r')
+		self.offsets = np.load(os.path.join(base, 'bm25.offsets.npy'), mmap_mode='r')
+		self.rows = np.load(os.path.join(base, 'bm25.rows.npy'), mmap_mode='r')
+		self.impact = np.load(os.path.join(base, 'bm25.impact.npy'), mmap_mode='r')
+		self._file = open(os.path.join(base, 'bm25.vocab.bin'), 'rb')
+		size = os.fstat(self._file.fileno()).st_size
+		self._vocab = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+	@classmethod
+	def load(cls, base: str, rows: int | None = None) -> 'BM25Index | None':
+		"""None sem `bm25.json` ou se ele não serve para este índice (hybrid/lexical caem na busca vetorial)."""
+		if not os.path.exists(os.path.join(base, 'bm25.json')):
+			return None
+		try:
+			return cls(base, rows)
+		except ValueError as e:
+			logger.warning(f"bm25.* ignorado ({e}); hybrid/lexical usam só a busca vetorial")
+			return None
+
+	def __len__(self) -> int:
+		return len(self.vocab_offsets) - 1
+
+	def _term(self, i: int) -> bytes:
+		return self._vocab[int(self.vocab_offsets[i]):int(self.vocab_offsets[i+1]) - 1]
+
+	def term_id(self, term: str) -> int:
+		"""Posição do termo no vocabulário (bytes utf-8 ordenam como os code points), ou -1."""
+		key = term.encode('utf-8')
+		lo, hi = 0, len(self)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self._term(mid) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo if lo < len(self) and self._term(lo) == key else -1
+
+	def nbytes(self) -> int:
+		return int(self.rows.nbytes + self.impact.nbytes + self.offsets.nbytes + self.vocab_offsets.nbytes + len(self._vocab))
+
+	def scores(self, text: str, mask: np.ndarray | None = None, k: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+		"""(linhas, score BM25) candidatas para a pergunta, restritas a `mask`.
+
+		Com `k` > 0 usa MaxScore: termos raros primeiro; quando o k-ésimo melhor
+		score já supera o máximo que os termos restantes (os comuns, de idf baixo)
+		podem somar, linhas fora dos candidatos não entram mais no top-k e os
+		termos comuns só completam o score dos candidatos por busca binária nas
+		suas postings (ordenadas por linha). O top-k continua exato; sem essa
+		garantia (ou k=0) acumula tudo num vetor denso.
+		"""
+		terms = []
+		for term in dict.fromkeys(tokenize(text)):
+			t = self.term_id(term)
+			if t >= 0:
+				lo, hi = int(self.offsets[t]), int(self.offsets[t+1])
+				terms.append((hi - lo, lo, hi, float(np.log(1 + (self.n - (hi - lo) + 0.5) / (hi - lo + 0.5)))))
+		terms.sort()
+		bound = float(self.info.get('k1', 1.2)) + 1  # impacto máximo: tf·(k1+1)/(tf+…) < k1+1
+		rest = [sum(idf for *_, idf in terms[i:]) * bound for i in range(len(terms))]
+		cand = np.empty(0, dtype='int64')
+		sc = np.empty(0, dtype='float32')
+		for i, (df, lo, hi, idf) in enumerate(terms):
+			if k and len(cand) >= k and np.partition(sc, len(sc) - k)[len(sc) - k] >= rest[i]:
+				for _, lo2, hi2, idf2 in terms[i:]:
+					post = self.rows[lo2:hi2]
+					pos = np.minimum(np.searchsorted(post, cand), hi2 - lo2 - 1)
+					hit = np.asarray(post[pos]) == cand
+					sc[hit] += np.asarray(self.impact[lo2 + pos[hit]], dtype='float32') * np.float32(idf2)
+				return cand, sc
+			if df * 32 > self.n:
+				return self._dense(cand, sc, terms[i:], mask)
+			rows = np.asarray(self.rows[lo:hi], dtype='int64')
+			w = np.asarray(self.impact[lo:hi], dtype='float32') * np.float32(idf)
+			if mask is not None:
+				keep = mask[rows]
+				rows, w = rows[keep], w[keep]
+			cand, inv = np.unique(np.concatenate([cand, rows]), return_inverse=True)
+			sc = np.bincount(inv, weights=np.concatenate([sc, w]), minlength=len(cand)).astype('float32')
+		return cand, sc
+
+	def _dense(self, cand: np.ndarray, sc: np.ndarray, terms: List[Tuple[int, int, int, float]], mask: np.ndarray | None) -> Tuple[np.ndarray, np.ndarray]:
+		# termos comuns sem poda: acumulador denso (linhas de um termo são únicas, sem np.add.at)
+		acc = np.zeros(self.n, dtype='float32')
+		seen = np.zeros(self.n, dtype=bool)
+		acc[cand] = sc
+		seen[cand] = True
+		for _, lo, hi, idf in terms:
+			rows = np.asarray(self.rows[lo:hi])
+			acc[rows] += np.asarray(self.impact[lo:hi], dtype='float32') * np.float32(idf)
+			seen[rows] = True
+		if mask is not None:
+			seen &= mask
+		rows = np.flatnonzero(seen)
+		return rows, acc[rows]
+
+def rrf_fuse(lists: Sequence[Tuple[np.ndarray, float]], k_rrf: float, k: int) -> np.ndarray:
+	"""Reciprocal rank fusion: soma de peso/(k_rrf + posição) de cada lista; empates por linha."""
+	fused: Dict[int, float] = {}
+	for rows, weight in lists:
+		if weight <= 0:
+			continue
+		for rank, r in enumerate(rows.tolist()):
+			fused[r] = fused.get(r, 0.0) + weight / (k_rrf + rank + 1)
+	best = sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+	return np.array([r for r, _ in best], dtype='int64')
@@ -0,0 +1,11 @@
+"""Registro das métricas da bridge servido em `/metrics`.
+
+Os tipos (Counter, Histogram, Gauge, Registry), o `Sampler` e `profile_path`
+vêm do pacote compartilhado `promtext` (o mesmo do indexer); as métricas em
+si são declaradas no app. Gauges de estado (chunks, cache, batcher) são lidos
+na hora do scrape por callbacks; as buscas rodam em threads via
+asyncio.to_thread, por isso os tipos são thread-safe.
+"""
+from promtext import CONTENT_TYPE, Registry, Sampler, profile_path  # type: ignore[import-not-found]
+
+REGISTRY = Registry()
@@ -0,0 +1,88 @@
+"""1ª etapa da busca sobre representações compactas dos vetores (VECTORS_QUANT).
+
+- `float16` / `int8`: faiss IndexScalarQuantizer (QT_fp16 / QT_8bit com faixa
+  por dimensão) de `vectors.sqfp16.faiss` / `vectors.sq8.faiss`; metade / um
+  quarto dos bytes de float32, produto interno em SIMD. O faiss 1.8 não faz
+  mmap de códigos flat, então esses bytes ficam na RAM do processo.
+- `binary`: um bit por dimensão (sinal), `vectors.bin.npy` em packbits, via
+  mmap; distância de Hamming com `faiss.knn_hamming` (popcount), 1/32 dos bytes.
+
+A etapa compacta só escolhe a shortlist (QUANT_RESCORE candidatos); o score
+final é o cosine exato contra `vectors.npy` (mmap), então só as páginas dos
+candidatos são lidas do float32. Os arquivos vêm do indexer (EXPORT_QUANT);
+sem eles a representação é montada na carga a partir de `vectors.npy`.
+"""
+import os, time, numpy as np  # type: ignore[import-not-found]
+from typing import Any
+from .utils import logger  # type: ignore[attr-defined]
+
+QUANT_FILES = {'float16': 'vectors.sqfp16.faiss', 'int8': 'vectors.sq8.faiss', 'binary': 'vectors.bin.npy'}
+
+def pack_signs(vectors: np.ndarray, block: int = 65536) -> np.ndarray:
+	out = np.empty((vectors.shape[0], (vectors.shape[1] + 7) // 8), dtype='uint8')
+	for i in range(0, vectors.shape[0], block):
+		out[i:i+block] = np.packbits(np.asarray(vectors[i:i+block]) > 0, axis=1)
+	return out
+
+def build_sq(vectors: np.ndarray, kind: str, train_sample: int = 100000, block: int = 65536) -> Any:
+	import faiss  # type: ignore[import-not-found]
+	qtype = faiss.ScalarQuantizer.QT_fp16 if kind == 'float16' else faiss.ScalarQuantizer.QT_8bit
+	index = faiss.IndexScalarQuantizer(vectors.shape[1], qtype, faiss.METRIC_INNER_PRODUCT)
+	n = vectors.shape[0]
+	rows = np.arange(n) if n <= train_sample else np.sort(np.random.default_rng(0).choice(n, train_sample, replace=False))
+	index.train(np.ascontiguousarray(vectors[rows], dtype='float32'))
+	for i in range(0, n, block):
+		index.add(np.ascontiguousarray(vectors[i:i+block], dtype='float32'))
+	return index
+
+class QuantIndex:
+	def __init__(self, kind: str, index: Any = None, codes: np.ndarray | None = None):
+		self.kind = kind
+		self.index = index
+		self.codes = codes
+
+	@classmethod
+	def load(cls, base: str, kind: str, vectors: np.ndarray) -> 'QuantIndex':
+		if kind not in QUANT_FILES:
+			raise ValueError(f"VECTORS_QUANT inválido: {kind!r} (use {', '.join(QUANT_FILES)})")
+		path = os.path.join(base, QUANT_FILES[kind])
+		exists = os.path.exists(path)
+		if not exists:
+			logger.warning(f"{QUANT_FILES[kind]} ausente; montando {kind} a partir dos vetores (exporte com EXPORT_QUANT={kind})")
+		t0 = time.perf_counter()
+		q = cls._read(path, kind) if exists else cls._build(vectors, kind)
+		if len(q) != vectors.shape[0]:
+			# arquivo de outro export (p.ex. sobra de EXPORT_QUANT antigo sem snapshots): linhas não batem
+			logger.warning(f"{QUANT_FILES[kind]} tem {len(q)} linhas e vectors.npy {vectors.shape[0]}; ignorando o arquivo e montando {kind} a partir dos vetores")
+			q = cls._build(vectors, kind)
+		logger.debug(f"Quant {kind}: {q.nbytes() / 1e6:.1f}MB em {time.perf_counter() - t0:.2f}s")
+		return q
+
+	@classmethod
+	def _read(cls, path: str, kind: str) -> 'QuantIndex':
+		if kind == 'binary':
+			return cls(kind, codes=np.load(path, mmap_mode='r'))
+		import faiss  # type: ignore[import-not-found]
+		return cls(kind, index=faiss.read_index(path))
+
+	@classmethod
+	def _build(cls, vectors: np.ndarray, kind: str) -> 'QuantIndex':
+		if kind == 'binary':
+			return cls(kind, codes=pack_signs(vectors))
+		return cls(kind, index=build_sq(vectors, kind))
+
+	def __len__(self) -> int:
+		return int(self.codes.shape[0]) if self.codes is not None else int(self.index.ntotal)
+
+	def nbytes(self) -> int:
+		if self.codes is not None:
+			return int(self.codes.nbytes)
+		return int(self.index.sa_code_size()) * len(self)
+
+	def shortlist(self, qs: np.ndarray, r: int) -> np.ndarray:
+		"""Linhas candidatas (B x r, -1 = vazio) pela representação compacta; `qs` normalizadas."""
+		r = min(r, len(self))
+		if self.codes is not None:
+			import faiss  # type: ignore[import-not-found]
+			return faiss.knn_hamming(np.packbits(qs > 0, axis=1), self.codes, r)[1]
+		return self.index.search(np.ascontiguousarray(qs, dtype='float32'), r)[1]
@@ -0,0 +1,77 @@
+import time, importlib
+from typing import Any, Dict, List, Protocol, Sequence, Tuple
+from .lexical import tokenize
+
+class Reranker(Protocol):
+	def score(self, query: str, candidates: Sequence[Dict[str, Any]]) -> Sequence[float]:
+		"""Score de cada candidato (dict do resultado: `text`, `score` cosine, ...); maior = melhor."""
+		...
+
+class LexicalReranker:
+	"""Reranker de CPU sem modelo: cosine da 1ª etapa + sobreposição lexical.
+
+	Fração dos termos da pergunta presentes no chunk (termos de até 2 letras
+	não contam) e dos bigramas da pergunta na mesma ordem, o que aproxima o
+	que um cross-encoder captura de casamento exato (códigos, nomes de
+	produto, frases). O score de cada candidato não depende dos demais, então
+	o resultado é o mesmo com qualquer RERANK_BATCH.
+	"""
+	def __init__(self, weight: float = 0.3, bigram_weight: float = 0.3):
+		self.weight = weight
+		self.bigram_weight = bigram_weight
+
+	def score(self, query: str, candidates: Sequence[Dict[str, Any]]) -> List[float]:
+		tokens = tokenize(query)
+		terms = {t for t in tokens if len(t) > 2 or t.isdigit()}
+		qbigrams = set(zip(tokens, tokens[1:]))
+		out = []
+		for c in candidates:
+			base = float(c.get('score', 0.0))
+			if not terms:
+				out.append(base)
+				continue
+			d = tokenize(str(c.get('text', '')))
+			coverage = len(terms.intersection(d)) / len(terms)
+			bigrams = len(qbigrams.intersection(zip(d, d[1:]))) / len(qbigrams) if qbigrams else 0.0
+			out.append(base + self.weight * ((1 - self.bigram_weight) * coverage + self.bigram_weight * bigrams))
+		return out
+
+def load_reranker(name: str) -> Reranker | None:
+	"""`''`/`none`: sem rerank; `lexical`; ou `pacote.modulo:fabrica` (ex.: um cross-encoder ONNX local)."""
+	if not name or name == 'none':
+		return None
+	if name == 'lexical':
+		return LexicalReranker()
+	module, _, attr = name.partition(':')
+	return getattr(importlib.import_module(module), attr or 'reranker')()
+
+def rerank_many(reranker: Reranker, queries: Sequence[str], results: Sequence[List[Dict[str, Any]]], k: int,
+	budget_ms: float, batch: int) -> Tuple[List[List[Dict[str, Any]]], List[bool]]:
+	"""Reordena os candidatos de cada query e corta em `k`, dentro de `budget_ms` para o lote todo.
+
+	O reranker é chamado em blocos de `batch` candidatos; estourado o
+	orçamento, a query corrente e as seguintes ficam na ordem da 1ª etapa
+	(flag False), sem misturar scores parciais. O prazo só é checado entre
+	blocos (uma chamada ao reranker não é interrompida), então o lote pode
+	passar de `budget_ms` em até um bloco.
+	"""
+	deadline = time.perf_counter() + budget_ms / 1000
+	out: List[List[Dict[str, Any]]] = []
+	done: List[bool] = []
+	expired = False
+	for query, cands in zip(queries, results):
+		scores: List[float] = []
+		for i in range(0, len(cands), max(1, batch)):
+			if expired or time.perf_counter() > deadline:
+				expired = True
+				break
+			scores.extend(reranker.score(query, cands[i:i+batch]))
+		if expired or time.perf_counter() > deadline:
+			expired = True
+			out.append(list(cands[:k]))
+			done.append(False)
+			continue
+		order = sorted(range(len(cands)), key=lambda i: -scores[i])[:k]
+		out.append([{**cands[i], 'rerank_score': round(float(scores[i]), 4)} for i in order])
+		done.append(True)
+	return out, done
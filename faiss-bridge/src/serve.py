@@ -0,0 +1,40 @@
+"""Sobe a bridge com WORKERS processos uvicorn sobre o mesmo índice.
+
+Uso (a partir de faiss-bridge/):
+	WORKERS=4 python -m src.serve
+
+Cada worker carrega o VectorStore, mas os dados do índice são arquivos em
+mmap somente leitura (vectors.npy, norms.npy, ids.npy, chunks.jsonl +
+offsets, facets, bm25.*, index.faiss IVF): as páginas ficam uma vez no page
+cache do kernel e todos os workers as mapeiam. O que sobra por worker é o
+interpretador, as bibliotecas e os caches de queries/resultados.
+
+Cópias privadas por worker (a memória cresce com WORKERS): VECTORS_MMAP=0,
+VECTORS_DTYPE=float16 sem vectors.f16.npy, VECTORS_QUANT=float16|int8 (o
+faiss 1.8 não faz mmap de códigos SQ; `binary` é mmap) e índices ANN
+HNSW/Flat (IVF é mmap).
+
+Os workers dividem os núcleos: BLAS/OpenMP ficam com SEARCH_THREADS threads
+(padrão CPUs / WORKERS) para não disputarem a mesma CPU.
+"""
+import os
+from typing import Tuple
+from .config import settings  # type: ignore[attr-defined]
+
+THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+def plan(workers: int, threads: int, cpus: int) -> Tuple[int, int]:
+	"""(workers, threads por worker); 0 = automático."""
+	workers = workers or cpus
+	return workers, threads or max(1, cpus // workers)
+
+def main():
+	import uvicorn  # type: ignore[import-not-found]
+	workers, threads = plan(settings.WORKERS, settings.SEARCH_THREADS, os.cpu_count() or 1)
+	# antes de importar numpy/faiss: os workers herdam o ambiente (spawn)
+	for var in THREAD_VARS:
+		os.environ.setdefault(var, str(threads))
+	uvicorn.run('src.app:app', host=settings.HOST, port=settings.PORT, workers=workers, log_level='info')
+
+if __name__ == '__main__':
+	main()
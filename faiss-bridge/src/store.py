@@ -1,41 +1,427 @@
-import os, json, faiss, numpy as np  # type: ignore[import-not-found]
-from typing import List, Dict, Any
+import os, re, json, mmap, time, bisect, threading, numpy as np  # type: ignore[import-not-found]
+from collections import OrderedDict
+from typing import List, Dict, Any, Sequence, Tuple
 from .config import settings  # type: ignore[attr-defined]
-from .utils import logger, cosine  # type: ignore[attr-defined]
+from .utils import logger  # type: ignore[attr-defined]
+from .lexical import BM25Index, rrf_fuse  # type: ignore[attr-defined]
+from .quant import QuantIndex  # type: ignore[attr-defined]
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+	"""Índices dos k maiores scores (desc), empates por índice crescente.
+
+	Equivale a `sorted(enumerate(scores), key=score, reverse=True)[:k]` mas em
+	O(N) com argpartition; só os candidatos >= k-ésimo score são ordenados.
+	"""
+	n = scores.shape[0]
+	k = min(k, n)
+	if k <= 0:
+		return np.empty(0, dtype='int64')
+	if k < n:
+		kth = scores[np.argpartition(-scores, k-1)[k-1]]
+		cand = np.flatnonzero(scores >= kth)
+	else:
+		cand = np.arange(n)
+	order = np.lexsort((cand, -scores[cand]))
+	return cand[order[:k]]
+
+FACETS = ('tenant', 'source', 'url')  # mesma ordem das colunas de facets.npy (indexer index_store)
+SEARCH_MODES = ('vector', 'hybrid', 'lexical')
+TENANT_RE = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,127}')
+
+def valid_tenant(tenant: str) -> bool:
+	# vira nome de diretório em TENANTS_DIR: nada de '/', '..' etc.
+	return bool(TENANT_RE.fullmatch(tenant))
+
+def resolve_index(base: str) -> Tuple[str, str]:
+	"""(diretório, versão) do snapshot apontado por `CURRENT` (ver indexer
+	index_store.finalize); sem `CURRENT`, o próprio `base` com versão vazia."""
+	try:
+		with open(os.path.join(base, 'CURRENT'), 'r') as f:
+			version = f.read().strip()
+	except FileNotFoundError:
+		return base, ''
+	return os.path.join(base, 'snapshots', version), version
+
+class ChunkMeta(Sequence[Dict[str, Any]]):
+	"""Metadados por linha lidos sob demanda de `chunks.jsonl` (mmap).
+
+	`chunks.offsets.npy` guarda o offset de início de cada linha (N+1 valores),
+	então `meta[i]` só decodifica o JSON do chunk i: no /search isso acontece
+	apenas para o top-k, e o texto dos chunks nunca fica residente no processo.
+	Offsets e dados são mmap: entre workers só existe uma cópia (page cache).
+	"""
+	def __init__(self, data_path: str, offsets_path: str):
+		self.offsets = np.load(offsets_path, mmap_mode='r')
+		self._file = open(data_path, 'rb')
+		size = os.fstat(self._file.fileno()).st_size
+		self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+	def __len__(self) -> int:
+		return max(len(self.offsets) - 1, 0)
+
+	def __getitem__(self, i):  # type: ignore[no-untyped-def,override]
+		if isinstance(i, slice):
+			return [self[j] for j in range(*i.indices(len(self)))]
+		i = int(i)
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError(i)
+		return self.decode(self._buf[int(self.offsets[i]):int(self.offsets[i+1])])
+
+	def decode(self, data: bytes) -> Any:
+		return json.loads(data)
+
+	def close(self):
+		if isinstance(self._buf, mmap.mmap):
+			self._buf.close()
+		self._file.close()
+
+class StringTable(ChunkMeta):
+	"""Lista de str em mmap (`<nome>.bin` + `<nome>.offsets.npy`), ex.: as URLs dos facets."""
+	def decode(self, data: bytes) -> Any:
+		return data.decode('utf-8')
 
 class VectorStore:
-	def __init__(self):
-		self.index = None
-		self.meta: List[Dict[str, Any]] = []
+	def __init__(self, autoload: bool = True, base: str | None = None):
+		self.base = base  # None = settings.INDEX_DIR
+		self.meta: Sequence[Dict[str, Any]] = []
 		self.vectors: np.ndarray | None = None
-		self.load()
+		self.norms: np.ndarray | None = None
+		self.index: Any = None  # índice ANN (IVF/HNSW/PQ); None = varredura exata
+		self.ids: np.ndarray | None = None  # chunk_id por linha, para mapear os labels do índice
+		self.index_info: Dict[str, Any] = {}
+		self.version = ''  # muda a cada índice carregado (chave do cache de resultados)
+		self.facets: np.ndarray | None = None  # linhas x FACETS, códigos em facet_values
+		self.facet_values: Dict[str, Sequence[str]] = {}
+		self._facet_codes: Dict[str, Dict[str, int]] = {}
+		self.index_bytes = 0
+		self.lexical: BM25Index | None = None  # bm25.* do indexer (modos hybrid/lexical)
+		self.quant: QuantIndex | None = None  # 1ª etapa compacta (VECTORS_QUANT); vetores float32 só no rescore
+		if autoload:
+			self.load()
 
-	def load(self):
-		base = settings.INDEX_DIR
-		meta_path = os.path.join(base,'meta.json')
+	def load(self, base: str | None = None):
+		"""Carrega o índice exportado pelo indexer (snapshot corrente de INDEX_DIR).
+
+		Layout compacto (padrão): `chunks.jsonl` + `chunks.offsets.npy` e vetores
+		via mmap (`vectors.npy`, ou `vectors.f16.npy` com VECTORS_DTYPE=float16),
+		sem copiar para a RAM do processo. `meta.json` só é lido em índices antigos
+		sem o layout compacto. `index.faiss` só é carregado quando `index.json`
+		indica uma fábrica ANN (não-Flat); Flat usa os vetores diretamente. Com
+		VECTORS_QUANT a varredura usa a representação compacta (ver quant.py) e
+		`vectors.npy` fica em mmap só para o rescore.
+		"""
+		base, snapshot = resolve_index(base or self.base or settings.INDEX_DIR)
 		vec_path = os.path.join(base,'vectors.npy')
-		index_path = os.path.join(base,'index.faiss')
-		if not (os.path.exists(meta_path) and os.path.exists(vec_path) and os.path.exists(index_path)):
+		f16_path = os.path.join(base,'vectors.f16.npy')
+		chunks_path = os.path.join(base,'chunks.jsonl')
+		offsets_path = os.path.join(base,'chunks.offsets.npy')
+		meta_path = os.path.join(base,'meta.json')
+		has_chunks = os.path.exists(chunks_path) and os.path.exists(offsets_path)
+		if not (os.path.exists(vec_path) and (has_chunks or os.path.exists(meta_path))):
 			logger.warning('Index incompleto; inicializando vazio')
 			return
-		with open(meta_path,'r') as f: self.meta = json.load(f)
-		self.vectors = np.load(vec_path)
-		self.index = faiss.read_index(index_path)  # type: ignore[attr-defined]
-		logger.info(f"Index carregado: {len(self.meta)} chunks")
-
-	def search(self, query_vec: List[float], k:int=5) -> List[Dict[str, Any]]:
-		if self.vectors is None or not self.meta:
-			return []
-		q = np.array(query_vec, dtype='float32')
-		q = q / (np.linalg.norm(q) + 1e-9)
-		sims: List[tuple[int, float]] = []
-		vecs32: np.ndarray = self.vectors.astype('float32', copy=False)  # type: ignore[assignment]
-		for i in range(vecs32.shape[0]):
-			v = vecs32[i].astype('float32', copy=False)
-			sims.append((i, cosine(q, v)))  # type: ignore[arg-type]
-		sims.sort(key=lambda x: x[1], reverse=True)
+		t0 = time.perf_counter()
+		mmap_mode = 'r' if settings.VECTORS_MMAP else None
+		if settings.VECTORS_QUANT:
+			vectors = np.load(vec_path, mmap_mode='r')
+		elif settings.VECTORS_DTYPE == 'float16':
+			f16 = np.load(f16_path, mmap_mode='r') if os.path.exists(f16_path) else None
+			if f16 is not None and f16.shape != np.load(vec_path, mmap_mode='r').shape:
+				logger.warning('vectors.f16.npy não bate com vectors.npy (sobra de outro export); convertendo vectors.npy')
+				f16 = None
+			if f16 is not None:
+				vectors = f16 if mmap_mode else np.array(f16)
+			else:
+				# sem export fp16: converte em blocos (metade da RAM de float32)
+				src = np.load(vec_path, mmap_mode='r')
+				vectors = np.empty(src.shape, dtype='float16')
+				for i in range(0, src.shape[0], 65536):
+					vectors[i:i+65536] = src[i:i+65536]
+		else:
+			vectors = np.load(vec_path, mmap_mode=mmap_mode)
+		if has_chunks:
+			meta: Sequence[Dict[str, Any]] = ChunkMeta(chunks_path, offsets_path)
+		else:
+			logger.warning('chunks.jsonl ausente; lendo meta.json (re-exporte o índice para o layout compacto)')
+			with open(meta_path,'r') as f: meta = json.load(f)
+		norms_path = os.path.join(base, 'norms.npy')
+		exported = os.path.exists(norms_path) and vectors.dtype == np.float32
+		self.set_data(vectors, meta, norms=not (settings.VECTORS_QUANT or exported))
+		if exported:
+			self.norms = np.load(norms_path, mmap_mode='r')
+		if settings.VECTORS_QUANT:
+			self.quant = QuantIndex.load(base, settings.VECTORS_QUANT, vectors)
+		self.load_facets(base)
+		self.lexical = BM25Index.load(base, vectors.shape[0])
+		self.load_ann(base)
+		st = os.stat(vec_path)
+		self.version = snapshot or f"{st.st_mtime_ns:x}-{st.st_size:x}"
+		quant = f", 1ª etapa {self.quant.kind} {self.quant.nbytes() / 1e6:.1f}MB" if self.quant is not None else ''
+		logger.info(f"Index {self.version} carregado: {len(self.meta)} chunks ({self.vectors.dtype}, mmap={isinstance(vectors, np.memmap)}{quant}) em {time.perf_counter()-t0:.2f}s")  # type: ignore[union-attr]
+
+	def load_ann(self, base: str):
+		info_path = os.path.join(base, 'index.json')
+		if settings.SEARCH_BACKEND == 'exact' or not os.path.exists(info_path):
+			return
+		with open(info_path, 'r') as f:
+			info = json.load(f)
+		if info.get('factory', 'Flat') == 'Flat' and settings.SEARCH_BACKEND != 'ann':
+			return
+		import faiss  # type: ignore[import-not-found]
+		path = os.path.join(base, 'index.faiss')
+		try:
+			index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+		except RuntimeError:
+			index = faiss.read_index(path)
+		params = dict(info.get('params', {}))
+		if settings.ANN_NPROBE:
+			params['nprobe'] = settings.ANN_NPROBE
+		if settings.ANN_EF_SEARCH:
+			params['efSearch'] = settings.ANN_EF_SEARCH
+		if 'nprobe' in params:
+			faiss.extract_index_ivf(index).nprobe = int(params['nprobe'])
+		if 'efSearch' in params:
+			faiss.ParameterSpace().set_index_parameter(index, 'efSearch', int(params['efSearch']))
+		self.ids = np.load(os.path.join(base, 'ids.npy'), mmap_mode='r')
+		self.index, self.index_info = index, {**info, 'params': params}
+		self.index_bytes = os.path.getsize(path)
+		logger.info(f"Índice ANN {info.get('factory')} {params}")
+
+	def load_facets(self, base: str):
+		codes_path = os.path.join(base, 'facets.npy')
+		values_path = os.path.join(base, 'facets.json')
+		if not (os.path.exists(codes_path) and os.path.exists(values_path)):
+			return  # export antigo: montado a partir dos metadados no primeiro filtro
+		with open(values_path, 'r', encoding='utf-8') as f:
+			values = json.load(f)['values']
+		urls = os.path.join(base, 'facets.url')
+		if 'url' not in values and os.path.exists(urls + '.offsets.npy'):
+			values['url'] = StringTable(urls + '.bin', urls + '.offsets.npy')
+		self.set_facets(np.load(codes_path, mmap_mode='r'), values)
+
+	def set_facets(self, codes: np.ndarray, values: Dict[str, Sequence[str]]):
+		self.facets, self.facet_values = codes, values
+		self._facet_codes = {f: {v: i for i, v in enumerate(vals)} for f, vals in values.items() if f != 'url'}
+
+	def _ensure_facets(self):
+		if self.facets is not None:
+			return
+		logger.warning('facets.npy ausente; lendo os metadados de todos os chunks para filtrar (re-exporte o índice)')
+		cols: Dict[str, List[str]] = {f: [] for f in FACETS}
+		for m in self.meta:
+			for f in FACETS:
+				cols[f].append(str(m.get(f) or ''))
+		values: Dict[str, Sequence[str]] = {}
+		codes = np.empty((len(self.meta), len(FACETS)), dtype='int32')
+		for j, f in enumerate(FACETS):
+			values[f] = sorted(set(cols[f]))
+			pos = {v: i for i, v in enumerate(values[f])}
+			codes[:, j] = [pos[v] for v in cols[f]]
+		self.set_facets(codes, values)
+
+	def mask(self, filters: Dict[str, Any] | None) -> np.ndarray | None:
+		"""Linhas que passam em `filters` (tenant, source: igualdade; url_prefix); None = sem filtro.
+
+		Os códigos de URL seguem a ordem lexicográfica, então o prefixo é um
+		intervalo [lo, hi) de códigos achado por bisect.
+		"""
+		active = {k: v for k, v in (filters or {}).items() if v}
+		if not active or self.vectors is None:
+			return None
+		self._ensure_facets()
+		assert self.facets is not None
+		keep = np.ones(self.facets.shape[0], dtype=bool)
+		for j, field in enumerate(FACETS):
+			if field == 'url':
+				prefix = active.get('url_prefix')
+				if prefix:
+					urls = self.facet_values.get('url', [])
+					lo = bisect.bisect_left(urls, prefix)
+					hi = bisect.bisect_left(urls, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+					col = self.facets[:, j]
+					keep &= (col >= lo) & (col < hi)
+			elif active.get(field):
+				code = self._facet_codes.get(field, {}).get(active[field])
+				if code is None:
+					return np.zeros(self.facets.shape[0], dtype=bool)
+				keep &= self.facets[:, j] == code
+		return keep
+
+	def nbytes(self) -> int:
+		"""Memória estimada do índice (vetores, normas, ids, facets e índice ANN).
+
+		Com VECTORS_QUANT conta a representação compacta no lugar dos vetores
+		float32, dos quais só as páginas da shortlist são lidas.
+		"""
+		arrays = (self.vectors if self.quant is None else None, self.norms, self.ids, self.facets)
+		lexical = self.lexical.nbytes() if self.lexical is not None else 0
+		quant = self.quant.nbytes() if self.quant is not None else 0
+		return int(sum(a.nbytes for a in arrays if a is not None)) + self.index_bytes + lexical + quant
+
+	def set_data(self, vectors: np.ndarray, meta: Sequence[Dict[str, Any]], block: int = 65536, norms: bool = True):
+		# normas pré-calculadas uma vez: o score por query vira um único matmul.
+		# float32/float16 são mantidos como vieram (inclusive memmap, sem cópia).
+		# norms=False (VECTORS_QUANT): não lê o arquivo inteiro; o rescore calcula as da shortlist
+		if vectors.dtype not in (np.float32, np.float16):
+			vectors = vectors.astype('float32')
+		self.vectors = vectors if isinstance(vectors, np.memmap) else np.ascontiguousarray(vectors)
+		self.norms = None
+		self.quant = None
+		if norms:
+			self._compute_norms(block)
+		self.meta = meta
+
+	def _compute_norms(self, block: int = 65536):
+		assert self.vectors is not None
+		norms = np.empty(self.vectors.shape[0], dtype='float32')
+		for i in range(0, self.vectors.shape[0], block):
+			part = np.asarray(self.vectors[i:i+block], dtype='float32')
+			norms[i:i+block] = np.sqrt((part * part).sum(axis=1))
+		self.norms = norms
+
+	def _rows(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		# (vetores float32, normas) só das linhas pedidas
+		assert self.vectors is not None
+		part = np.asarray(self.vectors[rows], dtype='float32')
+		norms = self.norms[rows] if self.norms is not None else np.sqrt((part * part).sum(axis=1))
+		return part, norms
+
+	def scores(self, q: np.ndarray, block: int = 65536) -> np.ndarray:
+		"""Cosine de `q` contra todas as linhas (mesma fórmula de utils.cosine).
+
+		`q` pode ser um vetor (-> N scores) ou uma matriz B x dim de queries
+		(-> N x B, um único matmul para o lote).
+		"""
+		if self.norms is None:
+			self._compute_norms(block)
+		assert self.vectors is not None and self.norms is not None
+		qt = q if q.ndim == 1 else q.T
+		qn = np.sqrt((q*q).sum(axis=-1)).astype('float32')
+		if self.vectors.dtype == np.float32:
+			dots = np.asarray(self.vectors) @ qt
+		else:
+			# float16 não tem BLAS: converte em blocos para float32
+			dots = np.empty((self.vectors.shape[0],) + qt.shape[1:], dtype='float32')
+			for i in range(0, self.vectors.shape[0], block):
+				dots[i:i+block] = np.asarray(self.vectors[i:i+block], dtype='float32') @ qt
+		norms = self.norms if q.ndim == 1 else self.norms[:, None]
+		return dots / (qn * norms + np.float32(1e-9))
+
+	def rescore(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+		"""Cosine exato de `q` só para `rows` (mesma fórmula de scores)."""
+		part, norms = self._rows(rows)
+		qn = np.float32((q*q).sum()**0.5)
+		return (part @ q) / (qn * norms + np.float32(1e-9))
+
+	def rescore_many(self, qs: np.ndarray, rows: np.ndarray) -> np.ndarray:
+		"""Cosine de cada query (colunas) só para `rows` (linhas): len(rows) x B."""
+		part, norms = self._rows(rows)
+		qn = np.sqrt((qs*qs).sum(axis=1)).astype('float32')
+		dots = part @ qs.T
+		return dots / (norms[:, None] * qn[None, :] + np.float32(1e-9))
+
+	def _search_params(self, sel: Any) -> Any:
+		# SearchParameters substitui os do índice: repete nprobe/efSearch do index.json
+		import faiss  # type: ignore[import-not-found]
+		params = self.index_info.get('params', {})
+		if 'nprobe' in params:
+			return faiss.SearchParametersIVF(sel=sel, nprobe=int(params['nprobe']))
+		if 'efSearch' in params:
+			return faiss.SearchParametersHNSW(sel=sel, efSearch=int(params['efSearch']))
+		return faiss.SearchParameters(sel=sel)
+
+	def ranked_filtered(self, qs: np.ndarray, k: int, mask: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+		"""top-k só entre as linhas de `mask`, escolhido dentro da busca (não é pós-filtro).
+
+		Filtro seletivo (até FILTER_EXACT_MAX_ROWS linhas) ou sem índice ANN: scan
+		exato só das linhas permitidas (ou scan completo com as demais em -inf,
+		quando passam mais da metade e não há VECTORS_QUANT). Senão o índice ANN busca com um
+		IDSelector dos chunk_ids permitidos. Com VECTORS_QUANT (sem ANN) a
+		shortlist compacta é aumentada na proporção do filtro e filtrada antes
+		do rescore; se sobrarem menos de k linhas, cai no scan exato.
+		"""
+		rows = np.flatnonzero(mask)
+		if not rows.size:
+			return [(rows, np.empty(0, dtype='float32')) for _ in qs]
+		if self.index is None and self.quant is not None and rows.size > settings.FILTER_EXACT_MAX_ROWS:
+			r = max(k, settings.QUANT_RESCORE)
+			fetch = min(mask.size, r * -(-mask.size // rows.size) + r)
+			out = []
+			for q, l in zip(qs, self.quant.shortlist(qs, fetch)):
+				l = l[l >= 0]
+				l = l[mask[l]]
+				out.append(self._rescored(q, l[:r] if l.size >= k else rows, k))
+			return out
+		if self.index is None or self.ids is None or rows.size <= settings.FILTER_EXACT_MAX_ROWS:
+			# com VECTORS_QUANT não há normas de todas as linhas (nem vetores na RAM): só as permitidas
+			if rows.size * 2 > mask.size and self.quant is None:
+				sims = np.ascontiguousarray(self.scores(qs).T if len(qs) > 1 else self.scores(qs[0])[None, :])
+				sims[:, ~mask] = -np.inf
+				out = []
+				for s in sims:
+					top = top_k(s, min(k, rows.size))
+					out.append((top, s[top]))
+				return out
+			sub = np.ascontiguousarray(self.rescore_many(qs, rows).T)
+			out = []
+			for s in sub:
+				top = top_k(s, k)
+				out.append((rows[top], s[top]))
+			return out
+		import faiss  # type: ignore[import-not-found]
+		sel = faiss.IDSelectorBatch(np.ascontiguousarray(self.ids[rows], dtype='int64'))
+		labels = self.index.search(np.ascontiguousarray(qs), k, params=self._search_params(sel))[1]
+		return [self._from_labels(q, l) for q, l in zip(qs, labels)]
+
+	def _from_labels(self, q: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		# ids.npy sai do indexer em ordem crescente de chunk_id
+		assert self.ids is not None
+		rows = np.sort(np.searchsorted(self.ids, labels[labels >= 0]))
+		sims = self.rescore(q, rows)
+		order = np.lexsort((rows, -sims))
+		return rows[order], sims[order]
+
+	def _rescored(self, q: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+		# shortlist da etapa compacta (VECTORS_QUANT) reordenada pelo cosine exato
+		rows = rows[rows >= 0]
+		sims = self.rescore(q, rows)
+		order = np.lexsort((rows, -sims))[:k]
+		return rows[order], sims[order]
+
+	def ranked(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+		"""(linhas, scores) do top-k: via índice ANN quando carregado, senão exato."""
+		if self.index is None and self.quant is not None:
+			return self._rescored(q, self.quant.shortlist(q[None], max(k, settings.QUANT_RESCORE))[0], k)
+		if self.index is None or self.ids is None:
+			sims = self.scores(q)
+			rows = top_k(sims, k)
+			return rows, sims[rows]
+		return self._from_labels(q, self.index.search(q.reshape(1, -1), k)[1][0])
+
+	def ranked_many(self, qs: np.ndarray, k: int, mask: np.ndarray | None = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+		"""`ranked` para uma matriz de queries com um único scan / index.search."""
+		if mask is not None:
+			return self.ranked_filtered(qs, k, mask)
+		if len(qs) == 1:
+			return [self.ranked(qs[0], k)]
+		if self.index is None and self.quant is not None:
+			labels = self.quant.shortlist(qs, max(k, settings.QUANT_RESCORE))
+			return [self._rescored(q, l, k) for q, l in zip(qs, labels)]
+		if self.index is None or self.ids is None:
+			sims = np.ascontiguousarray(self.scores(qs).T)
+			out = []
+			for s in sims:
+				rows = top_k(s, k)
+				out.append((rows, s[rows]))
+			return out
+		labels = self.index.search(np.ascontiguousarray(qs), k)[1]
+		return [self._from_labels(q, l) for q, l in zip(qs, labels)]
+
+	def results(self, rows: np.ndarray, sims: np.ndarray) -> List[Dict[str, Any]]:
 		out: List[Dict[str, Any]] = []
-		for idx, score in sims[:k]:
+		for idx, score in zip(rows, sims):
 			m: Dict[str, Any] = self.meta[idx]
 			out.append({
 				'chunk_id': str(m.get('chunk_id')),
@@ -46,5 +432,192 @@ class VectorStore:
 			})
 		return out
 
-store = VectorStore()
+	def ranked_lexical(self, qs: np.ndarray, texts: Sequence[str], k: int, mask: np.ndarray | None, mode: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+		"""`lexical`: top-k BM25; `hybrid`: RRF dos top HYBRID_CANDIDATES densos e BM25.
+
+		O score devolvido continua sendo o cosine com a query (mesma escala do
+		modo vetorial); só a ordem vem da fusão.
+		"""
+		assert self.lexical is not None
+		c = max(k, settings.HYBRID_CANDIDATES)
+		dense = self.ranked_many(qs, c, mask) if mode == 'hybrid' else [None] * len(qs)
+		out = []
+		for q, text, d in zip(qs, texts, dense):
+			rows, sc = self.lexical.scores(text, mask, c)
+			top = rows[top_k(sc, c)]
+			if d is None:
+				top = top[:k]
+			else:
+				top = rrf_fuse([(d[0], settings.HYBRID_VECTOR_WEIGHT), (top, settings.HYBRID_LEXICAL_WEIGHT)], settings.HYBRID_RRF_K, k)
+			out.append((top, self.rescore(q, top)))
+		return out
+
+	def search_many(self, query_vecs: Sequence[Sequence[float]] | np.ndarray, k:int=5, filters: Dict[str, Any] | None = None,
+		texts: Sequence[str] | None = None, mode: str = 'vector') -> List[List[Dict[str, Any]]]:
+		if mode not in SEARCH_MODES:
+			raise ValueError(f'modo de busca inválido: {mode!r}')
+		if self.vectors is None or not len(self.meta) or not len(query_vecs):
+			return [[] for _ in range(len(query_vecs))]
+		qs = np.array(query_vecs, dtype='float32').reshape(len(query_vecs), -1)
+		qs = qs / (np.linalg.norm(qs, axis=1, keepdims=True) + 1e-9)
+		mask = self.mask(filters)
+		if mode != 'vector' and texts is not None and self.lexical is not None:
+			ranked = self.ranked_lexical(qs, texts, k, mask, mode)
+		else:
+			# sem bm25.* no export (ou sem texto, ex.: /search/batch com vectors): só denso
+			ranked = self.ranked_many(qs, k, mask)
+		return [self.results(rows, sims) for rows, sims in ranked]
+
+	def search(self, query_vec: List[float], k:int=5, filters: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+		return self.search_many([query_vec], k, filters)[0]
+
+class HotStore:
+	"""VectorStore servido, trocado por inteiro quando o indexer publica um snapshot.
+
+	Atributos e métodos são delegados ao `current`; como cada busca resolve
+	`current` uma vez (`store.search_many(...)`), queries em voo terminam no
+	snapshot antigo enquanto as novas já usam o novo. A carga do novo snapshot
+	acontece fora do caminho das queries (thread do `TenantStores.watch`) e a
+	troca é uma única atribuição de referência. O antigo é liberado quando a
+	última query que o usa termina (mmap e arquivos fecham no GC).
+	"""
+	def __init__(self, autoload: bool = True, base: str | None = None):
+		self.base = base  # None = settings.INDEX_DIR
+		self.current = VectorStore(autoload=autoload, base=base)
+		self.reloads = 0
+		self._lock = threading.Lock()  # uma recarga por vez
+		self._failed = ''
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(self.current, name)
+
+	def reload(self, force: bool = False) -> bool:
+		"""Carrega e publica o snapshot de `CURRENT` se ele mudou; True se trocou.
+
+		Só segue snapshots (`CURRENT`): sem ele os arquivos do diretório podem
+		estar sendo regravados e a recarga automática não é segura.
+		"""
+		with self._lock:
+			_, version = resolve_index(self.base or settings.INDEX_DIR)
+			if not version or (not force and (version == self.current.version or version == self._failed)):
+				return False
+			t0 = time.perf_counter()
+			try:
+				new = VectorStore(autoload=False, base=self.base)
+				new.load()
+			except Exception as e:
+				self._failed = version
+				logger.error(f"Falha ao carregar snapshot {version}; mantendo {self.current.version}: {e}")
+				return False
+			if new.vectors is None:
+				self._failed = version
+				logger.error(f"Snapshot {version} incompleto; mantendo {self.current.version}")
+				return False
+			old, self.current = self.current, new
+			self.reloads += 1
+			self._failed = ''
+			logger.info(f"Snapshot {old.version or '-'} -> {new.version} em {time.perf_counter()-t0:.2f}s")
+			return True
+
+class TenantStores:
+	"""Shards por tenant num único processo, carregados sob demanda.
+
+	`TENANTS_DIR/<tenant>/` é o OUT_DIR do indexer daquele tenant. O shard é
+	carregado na primeira busca do tenant e os menos usados recentemente são
+	descarregados quando a soma estimada (`VectorStore.nbytes`) passa de
+	`budget_mb`; o store padrão (INDEX_DIR) não conta e nunca sai. Tenant sem
+	shard próprio é servido pelo store padrão com filtro por tenant.
+	"""
+	def __init__(self, default: HotStore, root: str, budget_mb: float):
+		self.default = default
+		self.root = root
+		self.budget = budget_mb * 1e6
+		self._loaded: 'OrderedDict[str, HotStore]' = OrderedDict()
+		self._lock = threading.Lock()
+		self._loading: Dict[str, threading.Lock] = {}
+		self.loads = 0
+		self.evictions = 0
+		self._thread: threading.Thread | None = None
+		self._stop = threading.Event()
+
+	def shard_dir(self, tenant: str) -> str | None:
+		if not self.root:
+			return None
+		path = os.path.join(self.root, tenant)
+		return path if os.path.isdir(path) else None
+
+	def get(self, tenant: str | None) -> Tuple[HotStore, bool]:
+		"""(store, é shard do tenant); sem shard, o store padrão (filtrar por tenant)."""
+		if not tenant:
+			return self.default, False
+		if not valid_tenant(tenant):
+			raise ValueError(f'tenant inválido: {tenant!r}')
+		with self._lock:
+			hs = self._loaded.get(tenant)
+			if hs is not None:
+				self._loaded.move_to_end(tenant)
+				return hs, True
+			path = self.shard_dir(tenant)
+			if path is None:
+				return self.default, False
+			gate = self._loading.setdefault(tenant, threading.Lock())
+		with gate:  # carga fora do lock global: buscas de outros tenants seguem
+			with self._lock:
+				hs = self._loaded.get(tenant)
+			if hs is None:
+				t0 = time.perf_counter()
+				hs = HotStore(base=path)
+				with self._lock:
+					self._loaded[tenant] = hs
+					self._loading.pop(tenant, None)
+					self.loads += 1
+					self._evict(keep=tenant)
+				logger.info(f"Tenant {tenant} carregado ({hs.current.nbytes()/1e6:.1f}MB) em {time.perf_counter()-t0:.2f}s")
+		return hs, True
+
+	def _evict(self, keep: str):
+		total = sum(hs.current.nbytes() for hs in self._loaded.values())
+		for tenant in list(self._loaded):
+			if total <= self.budget:
+				break
+			if tenant == keep:
+				continue
+			total -= self._loaded.pop(tenant).current.nbytes()
+			self.evictions += 1
+			logger.info(f"Tenant {tenant} descarregado (orçamento {self.budget/1e6:.0f}MB)")
+
+	def stores(self) -> List[HotStore]:
+		with self._lock:
+			return [self.default] + list(self._loaded.values())
+
+	def reload_all(self):
+		for hs in self.stores():
+			hs.reload()
+
+	def watch(self, interval_s: float):
+		"""Verifica `CURRENT` de todos os stores carregados a cada `interval_s` (thread daemon)."""
+		if interval_s <= 0 or self._thread is not None:
+			return
+		def loop():  # type: ignore[no-untyped-def]
+			while not self._stop.wait(interval_s):
+				try:
+					self.reload_all()
+				except Exception as e:  # pragma: no cover
+					logger.error(f"Recarga do índice falhou: {e}")
+		self._stop.clear()
+		self._thread = threading.Thread(target=loop, name='index-watch', daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			loaded = {t: {'version': hs.current.version, 'chunks': len(hs.current.meta), 'mb': round(hs.current.nbytes() / 1e6, 1)} for t, hs in self._loaded.items()}
+		return {'loaded': loaded, 'budget_mb': self.budget / 1e6, 'loads': self.loads, 'evictions': self.evictions}
 
+store = HotStore()
+tenants = TenantStores(store, settings.TENANTS_DIR, settings.TENANT_MEMORY_MB)
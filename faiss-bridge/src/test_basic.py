@@ -0,0 +1,395 @@
+import numpy as np  # type: ignore[import-not-found]
+from src.store import VectorStore, top_k  # type: ignore[import-not-found]
+from src.utils import cosine  # type: ignore[import-not-found]
+
+def _legacy_rank(vecs, q, k):  # type: ignore[no-untyped-def]
+	q = q / (np.linalg.norm(q) + 1e-9)
+	sims = [(i, cosine(q, vecs[i])) for i in range(vecs.shape[0])]
+	sims.sort(key=lambda x: x[1], reverse=True)
+	return sims[:k]
+
+def test_search_matches_legacy_loop():  # type: ignore[no-untyped-def]
+	rng = np.random.default_rng(0)
+	vecs = rng.standard_normal((500, 32)).astype('float32')
+	vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+	meta = [{'chunk_id': str(i), 'title': f't{i}', 'url': f'u{i}', 'text': f'x{i}'} for i in range(500)]
+	vs = VectorStore(autoload=False)
+	vs.set_data(vecs, meta)
+	for _ in range(5):
+		q = rng.standard_normal(32).astype('float32')
+		got = vs.search(q.tolist(), 10)
+		want = _legacy_rank(vecs, q, 10)
+		assert [r['chunk_id'] for r in got] == [str(i) for i, _ in want]
+		assert np.allclose([r['score'] for r in got], [s for _, s in want], atol=1e-6)
+
+def test_top_k_ties_and_bounds():  # type: ignore[no-untyped-def]
+	scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1], dtype='float32')
+	assert top_k(scores, 3).tolist() == [1, 3, 0]
+	assert top_k(scores, 10).tolist() == [1, 3, 0, 2, 4]
+	assert top_k(scores, 0).tolist() == []
+
+def test_load_compact_layout_mmap_and_lazy_meta(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.store import ChunkMeta  # type: ignore[import-not-found]
+	rng = np.random.default_rng(0)
+	vecs = rng.standard_normal((50, 16)).astype('float32')
+	vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+	meta = [{'chunk_id': str(i), 'title': f't{i}', 'url': f'u{i}', 'text': f'texto {i} ção\nfim'} for i in range(50)]
+	np.save(tmp_path / 'vectors.npy', vecs)
+	np.save(tmp_path / 'vectors.f16.npy', vecs.astype('float16'))
+	lines = [(json.dumps(m, ensure_ascii=False) + '\n').encode('utf-8') for m in meta]
+	np.save(tmp_path / 'chunks.offsets.npy', np.cumsum([0] + [len(b) for b in lines]))
+	(tmp_path / 'chunks.jsonl').write_bytes(b''.join(lines))
+	monkeypatch.setattr(settings, 'INDEX_DIR', str(tmp_path))
+	ref = VectorStore(autoload=False)
+	ref.set_data(vecs, meta)
+	vs = VectorStore()
+	assert isinstance(vs.vectors, np.memmap) and isinstance(vs.meta, ChunkMeta)
+	assert vs.meta[49] == meta[49] and vs.meta[-1] == meta[49]
+	q = rng.standard_normal(16).astype('float32').tolist()
+	assert vs.search(q, 5) == ref.search(q, 5)
+	monkeypatch.setattr(settings, 'VECTORS_DTYPE', 'float16')
+	vs16 = VectorStore()
+	assert vs16.vectors is not None and vs16.vectors.dtype == np.float16
+	assert [r['chunk_id'] for r in vs16.search(q, 5)] == [r['chunk_id'] for r in ref.search(q, 5)]
+	np.save(tmp_path / 'vectors.f16.npy', vecs[:10].astype('float16'))  # sobra de outro export: ignorado
+	assert [r['chunk_id'] for r in VectorStore().search(q, 5)] == [r['chunk_id'] for r in ref.search(q, 5)]
+
+def test_ann_index_from_index_json(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json, faiss  # type: ignore[import-not-found]
+	from src.config import settings  # type: ignore[import-not-found]
+	rng = np.random.default_rng(0)
+	vecs = rng.standard_normal((1000, 16)).astype('float32')
+	vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+	ids = np.arange(1000, dtype='int64') * 3  # chunk_ids não contíguos (tombstones)
+	meta = [{'chunk_id': str(i), 'title': '', 'url': '', 'text': ''} for i in ids]
+	index = faiss.IndexIDMap2(faiss.index_factory(16, 'IVF16,Flat', faiss.METRIC_INNER_PRODUCT))
+	index.train(vecs)
+	index.add_with_ids(vecs, ids)
+	faiss.write_index(index, str(tmp_path / 'index.faiss'))
+	(tmp_path / 'index.json').write_text(json.dumps({'factory': 'IVF16,Flat', 'params': {'nprobe': 16}}))
+	np.save(tmp_path / 'ids.npy', ids)
+	np.save(tmp_path / 'vectors.npy', vecs)
+	(tmp_path / 'meta.json').write_text(json.dumps(meta))
+	monkeypatch.setattr(settings, 'INDEX_DIR', str(tmp_path))
+	vs = VectorStore()
+	assert vs.index is not None and faiss.extract_index_ivf(vs.index).nprobe == 16
+	ref = VectorStore(autoload=False)
+	ref.set_data(vecs, meta)
+	q = rng.standard_normal(16).astype('float32').tolist()
+	assert vs.search(q, 5) == ref.search(q, 5)  # nprobe = nlist: exato
+	monkeypatch.setattr(settings, 'ANN_NPROBE', 1)
+	assert faiss.extract_index_ivf(VectorStore().index).nprobe == 1
+
+def test_quantized_first_stage_with_exact_rescore(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.quant import pack_signs  # type: ignore[import-not-found]
+	rng = np.random.default_rng(2)
+	n = 2000
+	vecs = rng.standard_normal((n, 32)).astype('float32')
+	vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+	meta = [{'chunk_id': str(i), 'title': '', 'url': '', 'text': '', 'tenant': 'a' if i % 4 else 'b'} for i in range(n)]
+	np.save(tmp_path / 'vectors.npy', vecs)
+	np.save(tmp_path / 'vectors.bin.npy', pack_signs(vecs))
+	(tmp_path / 'meta.json').write_text(json.dumps(meta))
+	monkeypatch.setattr(settings, 'INDEX_DIR', str(tmp_path))
+	ref = VectorStore(autoload=False)
+	ref.set_data(vecs, meta)
+	qs = rng.standard_normal((4, 32)).astype('float32')
+	monkeypatch.setattr(settings, 'FILTER_EXACT_MAX_ROWS', 0)  # filtro também pela shortlist compacta
+	for kind in ('float16', 'int8', 'binary'):
+		monkeypatch.setattr(settings, 'VECTORS_QUANT', kind)
+		monkeypatch.setattr(settings, 'QUANT_RESCORE', 200 if kind != 'binary' else n)  # binary: rescore de tudo = exato
+		vs = VectorStore()
+		assert vs.quant is not None and vs.norms is None and vs.nbytes() < ref.nbytes()
+		assert isinstance(vs.quant.codes, np.memmap) == (kind == 'binary')
+		for filters in (None, {'tenant': 'b'}):
+			got, want = vs.search_many(qs, 5, filters), ref.search_many(qs, 5, filters)
+			assert [[r['chunk_id'] for r in g] for g in got] == [[r['chunk_id'] for r in w] for w in want]
+			assert np.allclose([[r['score'] for r in g] for g in got], [[r['score'] for r in w] for w in want], atol=1e-6)
+	# filtro amplo (3/4 das linhas) abaixo de FILTER_EXACT_MAX_ROWS: exato só nas linhas permitidas, sem normas globais
+	monkeypatch.setattr(settings, 'FILTER_EXACT_MAX_ROWS', n)
+	got, want = vs.search_many(qs, 5, {'tenant': 'a'}), ref.search_many(qs, 5, {'tenant': 'a'})
+	assert [[r['chunk_id'] for r in g] for g in got] == [[r['chunk_id'] for r in w] for w in want] and vs.norms is None
+	# arquivo de outro export (menos linhas): ignorado, a representação é montada dos vetores
+	np.save(tmp_path / 'vectors.bin.npy', pack_signs(vecs[:n // 2]))
+	vs = VectorStore()
+	assert len(vs.quant) == n and not isinstance(vs.quant.codes, np.memmap)
+
+def test_shared_layout_maps_norms_offsets_and_url_table(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.store import StringTable  # type: ignore[import-not-found]
+	from src.serve import plan  # type: ignore[import-not-found]
+	rng = np.random.default_rng(4)
+	n = 300
+	vecs = rng.standard_normal((n, 16)).astype('float32')
+	meta = [{'chunk_id': str(i), 'url': f'https://x/{i % 3}/ção{i % 10}'} for i in range(n)]
+	np.save(tmp_path / 'vectors.npy', vecs)
+	np.save(tmp_path / 'norms.npy', np.sqrt((vecs * vecs).sum(axis=1)))
+	lines = [(json.dumps(m, ensure_ascii=False) + '\n').encode('utf-8') for m in meta]
+	np.save(tmp_path / 'chunks.offsets.npy', np.cumsum([0] + [len(b) for b in lines]))
+	(tmp_path / 'chunks.jsonl').write_bytes(b''.join(lines))
+	urls = sorted({m['url'] for m in meta})
+	codes = np.zeros((n, 3), dtype='int32')
+	codes[:, 2] = [urls.index(m['url']) for m in meta]
+	np.save(tmp_path / 'facets.npy', codes)
+	(tmp_path / 'facets.json').write_text(json.dumps({'fields': ['tenant', 'source', 'url'], 'values': {'tenant': [''], 'source': ['']}}))
+	data = [u.encode('utf-8') for u in urls]
+	(tmp_path / 'facets.url.bin').write_bytes(b''.join(data))
+	np.save(tmp_path / 'facets.url.offsets.npy', np.cumsum([0] + [len(b) for b in data]))
+	monkeypatch.setattr(settings, 'INDEX_DIR', str(tmp_path))
+	vs = VectorStore()
+	# tudo mapeado dos arquivos: nada proporcional ao índice é copiado por worker
+	assert isinstance(vs.norms, np.memmap) and isinstance(vs.meta.offsets, np.memmap)  # type: ignore[attr-defined]
+	assert isinstance(vs.facet_values['url'], StringTable) and list(vs.facet_values['url']) == urls
+	ref = VectorStore(autoload=False)
+	ref.set_data(vecs, meta)
+	q = rng.standard_normal(16).astype('float32').tolist()
+	assert vs.search(q, 5, {'url_prefix': 'https://x/1/'}) == ref.search(q, 5, {'url_prefix': 'https://x/1/'})
+	assert len(found := vs.search(q, 200, {'url_prefix': 'https://x/1/'})) == n // 3 and all(r['url'].startswith('https://x/1/') for r in found)
+	assert plan(0, 0, 8) == (8, 1) and plan(4, 0, 8) == (4, 2) and plan(8, 0, 4) == (8, 1) and plan(2, 3, 8) == (2, 3)
+
+def test_query_cache_normalizes_and_coalesces():  # type: ignore[no-untyped-def]
+	import asyncio
+	from src.cache import QueryCache  # type: ignore[import-not-found]
+	calls = []
+	async def embed(texts):  # type: ignore[no-untyped-def]
+		calls.append(list(texts))
+		await asyncio.sleep(0.2)
+		return [[float(len(t)), 0.0] for t in texts]
+	async def run():  # type: ignore[no-untyped-def]
+		qc = QueryCache(size=10, ttl=60, result_size=10, result_ttl=60)
+		got = await asyncio.gather(*[qc.embedding(' Olá   Mundo', embed) for _ in range(5)], qc.embed_many(['olá mundo', 'outra', 'OUTRA'], embed))
+		assert calls == [[' Olá   Mundo'], ['outra']]
+		assert qc.flight.coalesced == 6 and got[-1][0] == got[0] and got[-1][1] == got[-1][2]
+		assert await qc.embedding('olá mundo', embed) == got[0] and len(calls) == 2
+		stats = qc.stats()
+		assert stats['embeddings']['hits'] == 1 and stats['saved_ms'] >= 150
+		async def res(v):  # type: ignore[no-untyped-def]
+			return [v]
+		assert await qc.result('Olá mundo', 5, 'v1', lambda: res('r')) == ['r']
+		assert await qc.result('olá  mundo', 5, 'v1', lambda: res('outro')) == ['r']
+		assert await qc.result('olá mundo', 5, 'v2', lambda: res('novo')) == ['novo']
+	asyncio.run(run())
+
+def test_micro_batcher_groups_concurrent_queries():  # type: ignore[no-untyped-def]
+	import asyncio
+	from src.batcher import MicroBatcher  # type: ignore[import-not-found]
+	batches = []
+	async def handler(items):  # type: ignore[no-untyped-def]
+		batches.append(list(items))
+		return [i * 2 for i in items]
+	async def run():  # type: ignore[no-untyped-def]
+		b = MicroBatcher(handler, window_ms=20, max_batch=4)
+		assert await asyncio.gather(*[b.submit(i) for i in range(6)]) == [0, 2, 4, 6, 8, 10]
+		assert batches == [[0, 1, 2, 3], [4, 5]]
+	asyncio.run(run())
+
+def test_search_many_matches_single():  # type: ignore[no-untyped-def]
+	rng = np.random.default_rng(3)
+	vecs = rng.standard_normal((300, 16)).astype('float32')
+	meta = [{'chunk_id': str(i)} for i in range(300)]
+	vs = VectorStore(autoload=False)
+	vs.set_data(vecs, meta)
+	qs = rng.standard_normal((7, 16)).astype('float32')
+	batch = vs.search_many(qs, 5)
+	for q, res in zip(qs, batch):
+		single = vs.search(q.tolist(), 5)
+		assert [r['chunk_id'] for r in res] == [r['chunk_id'] for r in single]
+		assert np.allclose([r['score'] for r in res], [r['score'] for r in single], atol=1e-6)
+
+def test_search_batch_endpoint_matches_single_and_streams(monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	monkeypatch.setenv('OPENAI_API_KEY', 'test')
+	from fastapi.testclient import TestClient  # type: ignore[import-not-found]
+	import src.app as app  # type: ignore[import-not-found]
+	rng = np.random.default_rng(4)
+	app.store.set_data(rng.standard_normal((200, 16)).astype('float32'), [{'chunk_id': str(i)} for i in range(200)])
+	calls = []
+	async def fake_embed(texts):  # type: ignore[no-untyped-def]
+		calls.append(list(texts))
+		return [np.random.default_rng(len(t)).standard_normal(16).tolist() for t in texts]
+	monkeypatch.setattr(app, 'embed_texts', fake_embed)
+	app.query_cache.clear()
+	c = TestClient(app.app)
+	queries = ['a', '', 'bbb', 'cc']
+	res = c.post('/search/batch', json={'queries': queries, 'top_k': 3}).json()['results']
+	assert len(calls) == 1 and [len(r) for r in res] == [3, 0, 3, 3]
+	assert res[2] == c.post('/search', json={'query': 'bbb', 'top_k': 3}).json()['results']
+	lines = [json.loads(l) for l in c.post('/search/batch', json={'queries': queries, 'top_k': 3, 'stream': True}).text.splitlines()]
+	assert [l['index'] for l in lines] == [0, 1, 2, 3] and [l['results'] for l in lines] == res
+	assert c.post('/search/batch', json={'vectors': [[1.0, 2.0]]}).status_code == 422
+	assert c.post('/search/batch', json={}).status_code == 422
+	# mesmo caminho (search_items) nos dois endpoints: cache de resultados compartilhado e repetidas rodam uma vez
+	from src.cache import QueryCache  # type: ignore[import-not-found]
+	monkeypatch.setattr(app, 'query_cache', QueryCache(size=16, ttl=60, result_size=16, result_ttl=60))
+	calls.clear()
+	out = c.post('/search/batch', json={'queries': ['dd', ' DD', 'a'], 'top_k': 3, 'timings': True}).json()
+	assert calls == [['dd', 'a']] and out['results'][0] == out['results'][1] and out['timings']['cached'] == [False] * 3
+	single = c.post('/search', json={'query': 'dd', 'top_k': 3, 'timings': True}).json()
+	assert single['results'] == out['results'][0] and single['timings']['cached'] is True and len(calls) == 1
+	assert c.post('/search/batch', json={'queries': ['a', 'eee'], 'top_k': 3, 'timings': True}).json()['timings']['cached'] == [True, False]
+
+def test_hot_store_swaps_to_new_snapshot(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.store import HotStore  # type: ignore[import-not-found]
+	def publish(version, n):  # type: ignore[no-untyped-def]
+		d = tmp_path / 'snapshots' / version
+		d.mkdir(parents=True)
+		np.save(d / 'vectors.npy', np.eye(n, 8, dtype='float32'))
+		lines = [(json.dumps({'chunk_id': f'{version}-{i}'}) + '\n').encode() for i in range(n)]
+		np.save(d / 'chunks.offsets.npy', np.cumsum([0] + [len(b) for b in lines]))
+		(d / 'chunks.jsonl').write_bytes(b''.join(lines))
+		(tmp_path / 'CURRENT.tmp').write_text(version)
+		(tmp_path / 'CURRENT.tmp').replace(tmp_path / 'CURRENT')
+	monkeypatch.setattr(settings, 'INDEX_DIR', str(tmp_path))
+	publish('v1', 4)
+	hs = HotStore()
+	assert hs.version == 'v1' and not hs.reload()
+	old = hs.current
+	publish('v2', 6)
+	(tmp_path / 'snapshots' / 'v3').mkdir()  # snapshot sem arquivos: não é publicado
+	assert hs.reload() and hs.version == 'v2' and len(hs.meta) == 6
+	assert old.search([1.0] + [0.0] * 7, 1)[0]['chunk_id'] == 'v1-0'  # query em voo termina no antigo
+	(tmp_path / 'CURRENT').write_text('v3')
+	assert not hs.reload() and hs.version == 'v2' and hs.reloads == 1
+	assert hs.search([0.0] * 5 + [1.0, 0.0, 0.0], 1)[0]['chunk_id'] == 'v2-5'
+
+def test_filtered_search_inside_index_and_tenant_lru(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json, pytest  # type: ignore[import-not-found]
+	import faiss  # type: ignore[import-not-found]
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.store import HotStore, TenantStores  # type: ignore[import-not-found]
+	rng = np.random.default_rng(5)
+	n = 3000
+	vecs = rng.standard_normal((n, 16)).astype('float32')
+	vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+	meta = [{'chunk_id': str(i), 'tenant': 'a' if i % 3 else 'b', 'source': 'doc' if i % 5 == 0 else 'site', 'url': f'https://x/{i % 7}/p{i}'} for i in range(n)]
+	vs = VectorStore(autoload=False)
+	vs.set_data(vecs, meta)
+	q = rng.standard_normal(16).astype('float32')
+	def expected(ok):  # type: ignore[no-untyped-def]
+		rows = [i for i in range(n) if ok(meta[i])]
+		return [str(i) for i in sorted(rows, key=lambda i: -float(vecs[i] @ q))[:5]]
+	cases = [({'tenant': 'a'}, lambda m: m['tenant'] == 'a'),  # > metade: scan completo com -inf
+		({'source': 'doc', 'url_prefix': 'https://x/3/'}, lambda m: m['source'] == 'doc' and m['url'].startswith('https://x/3/')),
+		({'tenant': 'zz'}, lambda m: False)]
+	for filters, ok in cases:
+		assert [r['chunk_id'] for r in vs.search(q.tolist(), 5, filters)] == expected(ok)
+	# índice ANN: IDSelector dentro do index.search (filtros acima de FILTER_EXACT_MAX_ROWS)
+	monkeypatch.setattr(settings, 'FILTER_EXACT_MAX_ROWS', 0)
+	index = faiss.IndexIDMap2(faiss.index_factory(16, 'IVF8,Flat', faiss.METRIC_INNER_PRODUCT))
+	index.train(vecs)
+	index.add_with_ids(vecs, np.arange(n, dtype='int64'))
+	vs.index, vs.ids, vs.index_info = index, np.arange(n, dtype='int64'), {'params': {'nprobe': 8}}
+	for filters, ok in cases[:2]:
+		assert [r['chunk_id'] for r in vs.search(q.tolist(), 5, filters)] == expected(ok)
+	# shards por tenant: carga sob demanda, LRU acima do orçamento
+	for t in ('t1', 't2'):
+		d = tmp_path / t
+		d.mkdir()
+		np.save(d / 'vectors.npy', vecs[:1000])
+		(d / 'meta.json').write_text(json.dumps(meta[:1000]))
+	default = HotStore(autoload=False)
+	reg = TenantStores(default, str(tmp_path), budget_mb=0.1)  # cabe um shard (~70KB)
+	assert reg.get(None) == (default, False) and reg.get('t3') == (default, False)
+	t1, shard = reg.get('t1')
+	assert shard and len(t1.meta) == 1000 and reg.get('t1')[0] is t1
+	reg.get('t2')
+	assert list(reg.stats()['loaded']) == ['t2'] and reg.evictions == 1
+	with pytest.raises(ValueError):
+		reg.get('../t1')
+
+def test_hybrid_search_fuses_bm25_and_vectors(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import json
+	from src.config import settings  # type: ignore[import-not-found]
+	from src.lexical import BM25Index, TOKENIZER, tokenize  # type: ignore[import-not-found]
+	texts = ['plano básico', 'plano pro anual', 'suporte por email', 'peça XR-77 compatível']
+	# bm25.* no formato do indexer (indexer/src/lexical.py), impacto = tf simples
+	docs = [tokenize(t) for t in texts]
+	vocab = sorted({w for d in docs for w in d})
+	post = [[r for r, d in enumerate(docs) if w in d] for w in vocab]
+	np.save(tmp_path / 'bm25.rows.npy', np.array([r for p in post for r in p], dtype='int32'))
+	np.save(tmp_path / 'bm25.impact.npy', np.ones(sum(map(len, post)), dtype='float16'))
+	np.save(tmp_path / 'bm25.offsets.npy', np.cumsum([0] + [len(p) for p in post]))
+	np.save(tmp_path / 'bm25.vocab.npy', np.cumsum([0] + [len(w.encode()) + 1 for w in vocab]))
+	(tmp_path / 'bm25.vocab.bin').write_bytes(''.join(w + '\n' for w in vocab).encode())
+	(tmp_path / 'bm25.json').write_text(json.dumps({'tokenizer': TOKENIZER, 'n': len(texts)}))
+	bm = BM25Index(str(tmp_path))
+	assert bm.term_id('xr') == vocab.index('xr') and bm.term_id('zzz') == -1
+	assert BM25Index.load(str(tmp_path), len(texts) + 1) is None  # bm25.* de outro export: fica só a busca vetorial
+	assert bm.scores('Peça xr 77')[0].tolist() == [3]
+	vs = VectorStore(autoload=False)
+	vs.set_data(np.array([[1, 0], [0.9, 0.1], [0.8, 0.2], [-1, 0.1]], dtype='float32'), [{'chunk_id': str(i), 'text': t} for i, t in enumerate(texts)])
+	vs.lexical = bm
+	monkeypatch.setattr(settings, 'HYBRID_CANDIDATES', 4)
+	q, text = [1.0, 0.0], 'plano XR-77'
+	ids = lambda res: [r['chunk_id'] for r in res]  # noqa: E731
+	assert ids(vs.search_many([q], 2, texts=[text])[0]) == ['0', '1']
+	assert ids(vs.search_many([q], 1, texts=[text], mode='lexical')[0]) == ['3']
+	hybrid = vs.search_many([q], 2, texts=[text], mode='hybrid')[0]
+	assert ids(hybrid) == ['0', '3'] and hybrid[1]['score'] < 0  # score segue sendo o cosine
+	assert ids(vs.search_many([q], 2, {'url_prefix': 'x'}, texts=[text], mode='hybrid')[0]) == []
+
+def test_rerank_stage_reorders_within_budget_and_reports_timings(monkeypatch):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OPENAI_API_KEY', 'test')
+	from fastapi.testclient import TestClient  # type: ignore[import-not-found]
+	import src.app as app  # type: ignore[import-not-found]
+	from src.rerank import LexicalReranker  # type: ignore[import-not-found]
+	from src.cache import QueryCache  # type: ignore[import-not-found]
+	texts = ['planos e preços', 'preço do plano pro', 'suporte técnico', 'peça XR-77 compatível com o plano pro']
+	app.store.set_data(np.array([[1, 0], [0.95, 0.3], [0.9, 0.4], [0.8, 0.6]], dtype='float32'), [{'chunk_id': str(i), 'text': t} for i, t in enumerate(texts)])
+	async def fake_embed(texts):  # type: ignore[no-untyped-def]
+		return [[1.0, 0.0] for _ in texts]
+	monkeypatch.setattr(app, 'embed_texts', fake_embed)
+	app.query_cache.clear()
+	c = TestClient(app.app)
+	body = {'query': 'peça XR-77', 'top_k': 2, 'timings': True}
+	assert c.post('/search', json={**body, 'rerank': True}).status_code == 422  # sem RERANKER
+	monkeypatch.setattr(app, 'reranker', LexicalReranker())
+	plain = c.post('/search', json={**body, 'rerank': False}).json()
+	assert [r['chunk_id'] for r in plain['results']] == ['0', '1'] and 'rerank_ms' not in plain['timings']
+	out = c.post('/search', json=body).json()
+	assert [r['chunk_id'] for r in out['results']] == ['3', '0'] and out['timings']['reranked'] is True
+	assert {'embed_ms', 'search_ms', 'rerank_ms', 'total_ms'} <= set(out['timings'])
+	# orçamento estourado: mantém a ordem da 1ª etapa
+	monkeypatch.setattr(app.settings, 'RERANK_BUDGET_MS', 0)
+	monkeypatch.setattr(app, 'query_cache', QueryCache(size=16, ttl=60, result_size=16, result_ttl=60))  # com cache de resultados
+	out = c.post('/search', json={**body, 'query': 'peça XR-77!'}).json()
+	assert [r['chunk_id'] for r in out['results']] == ['0', '1'] and out['timings']['reranked'] is False
+	# o resultado cortado pelo orçamento não foi para o cache: com tempo, a mesma query é reordenada
+	monkeypatch.setattr(app.settings, 'RERANK_BUDGET_MS', 1000)
+	out = c.post('/search', json={**body, 'query': 'peça XR-77!'}).json()
+	assert [r['chunk_id'] for r in out['results']] == ['3', '0'] and out['timings']['reranked'] is True
+
+def test_metrics_endpoint_and_profile_header(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OPENAI_API_KEY', 'test')
+	from fastapi.testclient import TestClient  # type: ignore[import-not-found]
+	import src.app as app  # type: ignore[import-not-found]
+	from promtext import Histogram  # type: ignore[import-not-found]
+	h = Histogram('h', 'doc', ('mode',), buckets=(0.1, 1))
+	for v in (0.05, 0.5, 5):
+		h.observe(v, 'x')
+	assert h.render()[2:] == ['h_bucket{mode="x",le="0.1"} 1', 'h_bucket{mode="x",le="1"} 2', 'h_bucket{mode="x",le="+Inf"} 3', 'h_sum{mode="x"} 5.55', 'h_count{mode="x"} 3']
+	app.store.set_data(np.eye(4, dtype='float32'), [{'chunk_id': str(i)} for i in range(4)])
+	async def fake_embed(texts):  # type: ignore[no-untyped-def]
+		return [[1.0, 0, 0, 0] for _ in texts]
+	monkeypatch.setattr(app, 'embed_texts', fake_embed)
+	app.query_cache.clear()
+	before = app.SEARCH_SECONDS.count('vector')
+	c = TestClient(app.app)
+	assert c.post('/search', json={'query': 'métricas', 'top_k': 2}).json()['results'][0]['chunk_id'] == '0'
+	text = c.get('/metrics').text
+	assert app.SEARCH_SECONDS.count('vector') == before + 1
+	assert 'bridge_requests_total{endpoint="search",status="200"}' in text
+	assert 'bridge_serialize_seconds_count{endpoint="search"}' in text and 'bridge_index_chunks 4' in text
+	# profile só com o header; o arquivo .folded tem pilhas "thread;arquivo:função N"
+	pc = TestClient(app.ProfileMiddleware(app.app, str(tmp_path), 1))
+	assert 'x-profile-file' not in pc.post('/search', json={'query': 'a'}).headers
+	path = pc.post('/search', json={'query': 'b'}, headers={'X-Profile': '1'}).headers['x-profile-file']
+	lines = open(path).read().splitlines()
+	assert all(l.rsplit(' ', 1)[1].isdigit() for l in lines)
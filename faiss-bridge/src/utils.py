@@ -1,6 +1,8 @@
 import logging
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger('faiss-bridge')
+# httpx (cliente OpenAI) loga cada request em INFO
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 from numpy.typing import NDArray  # type: ignore[import-not-found]
 import numpy as np  # type: ignore[import-not-found]
@@ -0,0 +1,229 @@
+"""Fábrica de índices FAISS (Flat, IVF-Flat, IVF-PQ, HNSW, com OPQ/PCA opcionais).
+
+`INDEX_FACTORY` recebe uma string do `faiss.index_factory`, com `{nlist}`
+substituído por ~4*sqrt(N) (ex.: "IVF{nlist},Flat", "OPQ32,IVF{nlist},PQ32",
+"PCA256,IVF{nlist},Flat", "HNSW32"). Vetores são normalizados no build, então a
+métrica é produto interno (= cosine). Índices treináveis são treinados numa
+amostra de até `ANN_TRAIN_SAMPLE` linhas; os parâmetros de busca (nprobe /
+efSearch) vão para `index.json`, lido pela bridge.
+
+Com ANN_TUNE=1 (padrão para fábricas não-Flat) o build mede recall@k contra a
+busca exata numa amostra de queries e grava o menor nprobe/efSearch que atinge
+`ANN_TARGET_RECALL`, além do relatório em `ann_report.json`.
+
+Relatório avulso sobre um OUT_DIR já exportado:
+	python -m indexer.src.ann --factories "Flat;IVF{nlist},Flat;IVF{nlist},PQ32;HNSW32"
+"""
+import os, json, math, time, argparse, faiss, numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Any, Tuple
+from .utils import logger
+
+INDEX_META = 'index.json'
+REPORT_FILE = 'ann_report.json'
+NPROBE_GRID = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+EF_GRID = (16, 32, 64, 128, 256, 512)
+
+def resolve_factory(factory: str, n: int) -> str:
+	nlist = max(1, min(int(4 * math.sqrt(max(n, 1))), 65536))
+	return factory.replace('{nlist}', str(nlist))
+
+def min_train_points(spec: str, index: Any) -> int:
+	"""Mínimo de pontos de treino para a fábrica não degenerar (k-means / PQ)."""
+	need = 1
+	ivf = _ivf(index)
+	if ivf is not None:
+		need = max(need, ivf.nlist * 4)
+	if 'PQ' in spec:
+		need = max(need, 256)  # 2^8 centróides por sub-quantizador
+	return need
+
+def _base(index: Any) -> Any:
+	# desembrulha IDMap e IndexPreTransform (OPQ/PCA) até o índice de busca
+	index = faiss.downcast_index(index)
+	while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexPreTransform)):
+		index = faiss.downcast_index(index.index)
+	return index
+
+def _ivf(index: Any) -> Any:
+	try:
+		return faiss.extract_index_ivf(index)
+	except Exception:
+		return None
+
+def _hnsw(index: Any) -> Any:
+	base = _base(index)
+	return base if isinstance(base, faiss.IndexHNSW) else None
+
+def set_params(index: Any, params: Dict[str, Any]):
+	ivf = _ivf(index)
+	if ivf is not None and params.get('nprobe'):
+		ivf.nprobe = int(params['nprobe'])
+	hnsw = _hnsw(index)
+	if hnsw is not None and params.get('efSearch'):
+		hnsw.hnsw.efSearch = int(params['efSearch'])
+
+def default_params(index: Any) -> Dict[str, Any]:
+	params: Dict[str, Any] = {}
+	ivf = _ivf(index)
+	if ivf is not None:
+		params['nprobe'] = int(os.getenv('ANN_NPROBE', str(min(ivf.nlist, 16))))
+	if _hnsw(index) is not None:
+		params['efSearch'] = int(os.getenv('ANN_EF_SEARCH', '64'))
+	return params
+
+def sample_rows(n: int, size: int, seed: int = 0) -> np.ndarray:
+	if n <= size:
+		return np.arange(n)
+	return np.sort(np.random.default_rng(seed).choice(n, size, replace=False))
+
+def build_ann(vectors: np.ndarray, ids: np.ndarray, factory: str, block: int = 65536) -> Tuple[Any, str]:
+	"""Cria, treina (se preciso) e popula o índice; `vectors` pode ser memmap.
+
+	Devolve (índice IDMap2 por chunk_id, fábrica efetivamente usada). Com
+	poucos vetores para treinar a fábrica pedida, cai para Flat.
+	"""
+	n, dim = vectors.shape
+	spec = resolve_factory(factory, n)
+	inner = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+	if not inner.is_trained:
+		need = min_train_points(spec, inner)
+		if n < need:
+			logger.warning(f"ANN: {n} vetores não bastam para treinar {spec} (mín. {need}); usando Flat")
+			spec = 'Flat'
+			inner = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+		else:
+			rows = sample_rows(n, max(need, int(os.getenv('ANN_TRAIN_SAMPLE', '100000'))))
+			t0 = time.perf_counter()
+			inner.train(np.ascontiguousarray(vectors[rows], dtype='float32'))
+			logger.info(f"ANN: {spec} treinado em {len(rows)} vetores ({time.perf_counter()-t0:.1f}s)")
+	index = faiss.IndexIDMap2(inner)
+	for i in range(0, n, block):
+		index.add_with_ids(np.ascontiguousarray(vectors[i:i+block], dtype='float32'), np.ascontiguousarray(ids[i:i+block], dtype='int64'))  # type: ignore[call-arg]
+	return index, spec
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 65536) -> np.ndarray:
+	"""Posições do top-k exato por produto interno (ground truth), em blocos."""
+	best_s = np.full((len(queries), k), -np.inf, dtype='float32')
+	best_i = np.full((len(queries), k), -1, dtype='int64')
+	for i in range(0, vectors.shape[0], block):
+		s = np.ascontiguousarray(queries @ np.asarray(vectors[i:i+block], dtype='float32').T)
+		all_s = np.concatenate([best_s, s], axis=1)
+		all_i = np.concatenate([best_i, np.broadcast_to(np.arange(i, i+s.shape[1]), s.shape)], axis=1)
+		sel = np.argsort(-all_s, axis=1, kind='stable')[:, :k]
+		best_s = np.take_along_axis(all_s, sel, axis=1)
+		best_i = np.take_along_axis(all_i, sel, axis=1)
+	return best_i
+
+def _index_bytes(index: Any) -> int:
+	return int(faiss.serialize_index(index).size)
+
+def evaluate(index: Any, vectors: np.ndarray, ids: np.ndarray, k: int = 10, n_queries: int = 200) -> Dict[str, Any]:
+	"""recall@k / latência por query para cada valor de nprobe ou efSearch.
+
+	Queries são vetores do próprio índice com ruído gaussiano (não há log de
+	queries reais no build); o baseline é a busca exata sobre os mesmos vetores.
+	"""
+	n, dim = vectors.shape
+	rng = np.random.default_rng(1)
+	rows = sample_rows(n, n_queries, seed=1)
+	q = np.asarray(vectors[rows], dtype='float32') + rng.standard_normal((len(rows), dim), dtype=np.float32) * (0.5 / math.sqrt(dim))
+	q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-9
+	k = min(k, n)
+	truth = ids[exact_top_k(vectors, q, k)]
+	ivf, hnsw = _ivf(index), _hnsw(index)
+	if ivf is not None:
+		name, grid = 'nprobe', [p for p in NPROBE_GRID if p <= ivf.nlist]
+	elif hnsw is not None:
+		name, grid = 'efSearch', [e for e in EF_GRID if e >= k]
+	else:
+		name, grid = '', [0]
+	points: List[Dict[str, Any]] = []
+	for value in grid:
+		if name:
+			set_params(index, {name: value})
+		index.search(q[:1], k)  # warmup
+		t0 = time.perf_counter()
+		lat: List[float] = []
+		labels = np.empty((len(q), k), dtype='int64')
+		for j in range(len(q)):
+			t = time.perf_counter()
+			labels[j] = index.search(q[j:j+1], k)[1][0]
+			lat.append((time.perf_counter() - t) * 1000)
+		total = time.perf_counter() - t0
+		recall = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(labels.tolist(), truth.tolist())]))
+		point = {'recall': round(recall, 4), 'p50_ms': round(float(np.percentile(lat, 50)), 3), 'p99_ms': round(float(np.percentile(lat, 99)), 3), 'qps': round(len(q) / total, 1)}
+		if name:
+			point[name] = value
+		points.append(point)
+	return {'k': k, 'queries': len(q), 'param': name, 'points': points, 'index_bytes': _index_bytes(index), 'flat_bytes': int(n * dim * 4)}
+
+def tune(report: Dict[str, Any], target: float) -> Dict[str, Any]:
+	"""Menor nprobe/efSearch com recall >= target (ou o de maior recall)."""
+	name = report['param']
+	if not name:
+		return {}
+	ok = [p for p in report['points'] if p['recall'] >= target]
+	best = ok[0] if ok else max(report['points'], key=lambda p: p['recall'])
+	return {name: best[name]}
+
+def write_index(out_dir: str, vectors: np.ndarray, ids: np.ndarray, factory: str, suffix: str = '.tmp') -> List[Tuple[str, str]]:
+	"""Grava index.faiss (+ index.json e ann_report.json) como `<nome><suffix>`.
+
+	Devolve os pares (tmp, final) para o chamador fazer os os.replace junto com
+	os demais arquivos do export.
+	"""
+	index, spec = build_ann(vectors, ids, factory)
+	params = default_params(index)
+	info: Dict[str, Any] = {'factory': spec, 'metric': 'ip', 'count': int(vectors.shape[0]), 'dim': int(vectors.shape[1]), 'params': params}
+	pairs = []
+	tune_env = os.getenv('ANN_TUNE')
+	if (tune_env is None and spec != 'Flat') or (tune_env or '0').lower() not in ('0', 'false', 'no'):
+		report = evaluate(index, vectors, ids, int(os.getenv('ANN_REPORT_K', '10')))
+		target = float(os.getenv('ANN_TARGET_RECALL', '0.95'))
+		params = {**params, **tune(report, target)}
+		info['params'] = params
+		report = {'factory': spec, 'target_recall': target, 'chosen': params, **report}
+		for p in report['points']:
+			logger.debug(f"ANN {spec}: " + ', '.join(f"{k}={v}" for k, v in p.items()))
+		logger.info(f"ANN {spec}: {params} (recall alvo {target}); índice {report['index_bytes']/1e6:.1f}MB vs Flat {report['flat_bytes']/1e6:.1f}MB")
+		rpath = os.path.join(out_dir, REPORT_FILE)
+		with open(rpath + suffix, 'w', encoding='utf-8') as f:
+			json.dump(report, f, indent=1)
+		pairs.append((rpath + suffix, rpath))
+	set_params(index, params)
+	ipath = os.path.join(out_dir, 'index.faiss')
+	faiss.write_index(index, ipath + suffix)
+	pairs.append((ipath + suffix, ipath))
+	jpath = os.path.join(out_dir, INDEX_META)
+	with open(jpath + suffix, 'w', encoding='utf-8') as f:
+		json.dump(info, f)
+	pairs.append((jpath + suffix, jpath))
+	return pairs
+
+def main():
+	ap = argparse.ArgumentParser(description='recall@k x latência x memória de fábricas FAISS sobre o vectors.npy exportado')
+	ap.add_argument('--dir', default=None, help='OUT_DIR (padrão: settings.OUT_DIR)')
+	ap.add_argument('--factories', default='Flat;IVF{nlist},Flat;IVF{nlist},PQ32;HNSW32', help="separadas por ';'")
+	ap.add_argument('-k', type=int, default=10)
+	ap.add_argument('--queries', type=int, default=200)
+	args = ap.parse_args()
+	if args.dir is None:
+		from .config import settings
+		args.dir = settings.OUT_DIR
+	from .index_store import current_dir
+	args.dir = current_dir(args.dir)
+	vectors = np.load(os.path.join(args.dir, 'vectors.npy'), mmap_mode='r')
+	ids = np.arange(vectors.shape[0], dtype='int64')
+	rows = []
+	for factory in args.factories.split(';'):
+		t0 = time.perf_counter()
+		index, spec = build_ann(vectors, ids, factory)
+		build_s = time.perf_counter() - t0
+		rep = evaluate(index, vectors, ids, args.k, args.queries)
+		for p in rep['points']:
+			rows.append({'factory': spec, 'build_s': round(build_s, 2), 'index_mb': round(rep['index_bytes'] / 1e6, 1), **p})
+	for r in rows:
+		print(json.dumps(r))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,73 @@
+"""Chunker estruturado (por tokens) × janelas de caracteres num corpus grande.
+
+Uso (a partir da raiz do repo):
+	python -m indexer.src.bench_chunking --docs 20000
+	python -m indexer.src.bench_chunking --input ./input   # .txt/.md de um diretório
+
+O corpus sintético imita páginas do crawl (headings `#`, parágrafos de frases
+com vocabulário Zipf). Mede chunks/s, chunks gerados, tokens totais (o que vai
+para a API de embedding, com overlap) e chunks que terminam no meio de uma
+palavra.
+"""
+import os, time, argparse, numpy as np  # type: ignore[import-not-found]
+from typing import Callable, Iterator, List
+from .chunking import iter_split, iter_chunks, offline_tokens
+
+def synthetic_docs(n: int, seed: int = 0) -> List[str]:
+	rng = np.random.default_rng(seed)
+	vocab = [''.join(rng.choice(list('abcdefghijlmnoprstuvçãé'), rng.integers(2, 11))) for _ in range(20000)]
+	docs = []
+	for _ in range(n):
+		blocks = []
+		for s in range(int(rng.integers(2, 8))):
+			blocks.append('#' * (1 if s == 0 else 2) + ' ' + ' '.join(vocab[w] for w in np.minimum(rng.zipf(1.3, 3), 20000) - 1).capitalize())
+			for _ in range(int(rng.integers(1, 5))):
+				sents = []
+				for _ in range(int(rng.integers(1, 7))):
+					words = [vocab[w] for w in np.minimum(rng.zipf(1.3, int(rng.integers(5, 25))), 20000) - 1]
+					sents.append(' '.join(words).capitalize() + '.')
+				blocks.append(' '.join(sents))
+		docs.append('\n\n'.join(blocks))
+	return docs
+
+def local_docs(path: str) -> List[str]:
+	out = []
+	for root, _, files in os.walk(path):
+		for f in files:
+			if f.endswith(('.txt', '.md')):
+				with open(os.path.join(root, f), 'r', encoding='utf-8', errors='ignore') as fh:
+					out.append(fh.read())
+	return out
+
+def mid_word(doc: str, chunk: str) -> bool:
+	# o fim do chunk cai entre dois caracteres alfanuméricos do texto original
+	tail = chunk[-30:]
+	i = doc.find(tail)
+	j = i + len(tail)
+	return i >= 0 and j < len(doc) and chunk[-1].isalnum() and doc[j].isalnum()
+
+def run(name: str, docs: List[str], split: Callable[[str], Iterator[str]], count: Callable[[str], int]):
+	t0 = time.perf_counter()
+	chunks = [c for d in docs for c in split(d)]
+	secs = time.perf_counter() - t0
+	tokens = sum(count(c) for c in chunks)
+	cuts = sum(1 for d in docs for c in split(d) if mid_word(d, c))
+	print(f"{name:<12} chunks={len(chunks):>8} chunks/s={len(chunks) / secs:>9.0f} MB/s={sum(len(d) for d in docs) / secs / 1e6:6.1f} tokens={tokens:>10} tokens/chunk={tokens / max(1, len(chunks)):6.1f} meio_de_palavra={cuts / max(1, len(chunks)):.1%}")
+
+def main():
+	from .config import settings
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--docs', type=int, default=20000)
+	ap.add_argument('--input', help='diretório com .txt/.md em vez do corpus sintético')
+	ap.add_argument('--size-chars', type=int, default=settings.CHUNK_SIZE_CHARS)
+	ap.add_argument('--overlap-chars', type=int, default=settings.CHUNK_OVERLAP_CHARS)
+	ap.add_argument('--size-tokens', type=int, default=settings.CHUNK_SIZE_TOKENS)
+	ap.add_argument('--overlap-tokens', type=int, default=settings.CHUNK_OVERLAP_TOKENS)
+	args = ap.parse_args()
+	docs = local_docs(args.input) if args.input else synthetic_docs(args.docs)
+	print(f"{len(docs)} docs, {sum(len(d) for d in docs) / 1e6:.1f}M chars")
+	run('chars', docs, lambda d: iter_split(d, args.size_chars, args.overlap_chars), offline_tokens)
+	run('structured', docs, lambda d: (c for c, _ in iter_chunks(d, args.size_tokens, args.overlap_tokens)), offline_tokens)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,210 @@
+"""Benchmark de ponta a ponta: corpus sintético -> chunking -> build -> carga e busca na bridge.
+
+Uso (a partir da raiz do repo):
+	python -m indexer.src.bench_suite --docs 2000 --pages 300 --out /tmp/bench.json
+	python -m indexer.src.bench_suite --save-baseline      # grava indexer/bench_baseline.json
+	python -m indexer.src.bench_suite --baseline indexer/bench_baseline.json --tolerance 0.25
+
+- corpus: `--docs` arquivos .md em INPUT_DIR e um site HTML de `--pages`
+  páginas servido localmente (crawl de verdade, com links e sitemap)
+- embeddings: `hash_embed` (OFFLINE_EMBED, determinístico e não degenerado),
+  então as queries (trechos de chunks sorteados) têm resposta certa: hit@k
+- build: `python -m indexer.src.cli --mode rebuild` num processo filho (tempo
+  de parede e pico de RSS via wait4)
+- bridge: `python -m src.bench_store` (faiss-bridge) sobre o snapshot gerado:
+  tempo de carga, RSS, p50/p99 e QPS da busca
+
+Resultado em JSON (`--out`); com baseline, cada métrica é comparada na
+direção certa (tempo/memória menor é melhor, vazão/hit maior) e o processo
+sai com código 1 se alguma piorar mais que `--tolerance`.
+"""
+import os, sys, json, time, shutil, platform, argparse, threading, subprocess
+for _k, _v in (('OPENAI_API_KEY', 'bench'), ('BASE_URL', 'http://127.0.0.1'), ('TENANT_ID', 'bench'), ('INPUT_DIR', '/tmp/every-bot-bench/input'), ('OUT_DIR', '/tmp/every-bot-bench/out')):
+	os.environ.setdefault(_k, _v)
+import numpy as np  # type: ignore[import-not-found]
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Tuple
+from .bench_chunking import synthetic_docs
+from .chunking import iter_chunks
+from .embedding import hash_embed
+
+REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BASELINE = os.path.join(REPO, 'indexer', 'bench_baseline.json')
+# +1: maior é melhor; -1: menor é melhor; 0: só informativo
+METRICS = {
+	'chunking_chunks_per_s': 1, 'chunks': 0, 'build_wall_s': -1, 'build_chunks_per_s': 1, 'build_peak_rss_mb': -1,
+	'bridge_load_s': -1, 'bridge_rss_mb': -1, 'search_p50_ms': -1, 'search_p99_ms': -1, 'search_qps': 1,
+	'search_batch_qps': 1, 'hit_at_k': 1,
+}
+# diferenças absolutas abaixo disso são ruído de medição, não regressão
+NOISE_FLOOR = {'_s': 0.05, '_ms': 0.05, '_mb': 10.0}
+
+def site_pages(n: int, seed: int = 1) -> Dict[str, str]:
+	"""Páginas HTML (h1/h2/p/li) ligadas em cadeia a partir da home, mais o sitemap de metade delas."""
+	texts = synthetic_docs(n, seed)
+	pages: Dict[str, str] = {}
+	for i, text in enumerate(texts):
+		body = []
+		for block in text.split('\n\n'):
+			if block.startswith('## '):
+				body.append(f'<h2>{block[3:]}</h2>')
+			elif block.startswith('# '):
+				body.append(f'<h1>{block[2:]}</h1>')
+			else:
+				body.append(f'<p>{block}</p>')
+		links = ''.join(f'<li><a href="/p/{j}">página {j}</a></li>' for j in (i + 1, i + 2) if j < n)
+		pages[f'/p/{i}'] = f'<html><title>Página {i}</title><body>{"".join(body)}<ul>{links}</ul></body></html>'
+	pages['/'] = '<html><title>Home</title><body><h1>Home</h1><a href="/p/0">início</a></body></html>'
+	return pages
+
+def serve(pages: Dict[str, str]) -> Tuple[ThreadingHTTPServer, str]:
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):  # type: ignore[no-untyped-def]
+			host = self.headers.get('Host')
+			if self.path == '/sitemap.xml':
+				locs = ''.join(f'<url><loc>http://{host}{p}</loc></url>' for p in list(pages)[::2])
+				body, ctype = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>', 'application/xml'
+			elif self.path in pages:
+				body, ctype = pages[self.path], 'text/html; charset=utf-8'
+			else:
+				self.send_response(404); self.end_headers(); return
+			data = body.encode('utf-8')
+			self.send_response(200)
+			self.send_header('Content-Type', ctype)
+			self.send_header('Content-Length', str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+		def log_message(self, *args):  # type: ignore[no-untyped-def]
+			pass
+	server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def write_corpus(input_dir: str, docs: List[str]):
+	shutil.rmtree(input_dir, ignore_errors=True)
+	os.makedirs(input_dir)
+	for i, text in enumerate(docs):
+		with open(os.path.join(input_dir, f'doc-{i:06d}.md'), 'w', encoding='utf-8') as f:
+			f.write(text)
+
+def run_build(env: Dict[str, str], crawl: bool) -> Tuple[float, float]:
+	"""(segundos, pico de RSS em MB) do build num processo filho."""
+	t0 = time.perf_counter()
+	proc = subprocess.Popen([sys.executable, '-m', 'indexer.src.cli', '--mode', 'rebuild'] + ([] if crawl else ['--no-crawl']), cwd=REPO, env=env)
+	_, status, usage = os.wait4(proc.pid, 0)
+	proc.returncode = os.waitstatus_to_exitcode(status)
+	if proc.returncode:
+		raise RuntimeError(f'build falhou (código {proc.returncode})')
+	return time.perf_counter() - t0, usage.ru_maxrss / 1024
+
+def make_queries(snapshot: str, n: int, dim: int, out_dir: str, seed: int = 2) -> Tuple[str, str]:
+	"""Queries = 20 palavras do meio de chunks sorteados; a resposta esperada é a própria linha."""
+	offsets = np.load(os.path.join(snapshot, 'chunks.offsets.npy'))
+	rng = np.random.default_rng(seed)
+	rows = rng.choice(len(offsets) - 1, size=min(n, len(offsets) - 1), replace=False)
+	texts = []
+	with open(os.path.join(snapshot, 'chunks.jsonl'), 'rb') as f:
+		for r in rows:
+			f.seek(int(offsets[r]))
+			words = json.loads(f.read(int(offsets[r + 1] - offsets[r])))['text'].split()
+			start = len(words) // 3
+			texts.append(' '.join(words[start:start + 20]))
+	qpath, epath = os.path.join(out_dir, 'bench_queries.npy'), os.path.join(out_dir, 'bench_expect.npy')
+	np.save(qpath, hash_embed(texts, dim))
+	np.save(epath, rows)
+	return qpath, epath
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[Tuple[str, float, float, float, str]]:
+	"""(métrica, baseline, atual, variação relativa, status) com status ok | melhor | PIOROU | info."""
+	rows = []
+	for name, direction in METRICS.items():
+		if name not in current or name not in baseline:
+			continue
+		base, cur = float(baseline[name]), float(current[name])
+		delta = (cur - base) / base if base else 0.0
+		floor = next((v for suffix, v in NOISE_FLOOR.items() if name.endswith(suffix)), 0.0)
+		if direction == 0:
+			status = 'info'
+		elif abs(cur - base) < floor:
+			status = 'ok'
+		elif delta * direction < -tolerance:
+			status = 'PIOROU'
+		elif delta * direction > tolerance:
+			status = 'melhor'
+		else:
+			status = 'ok'
+		rows.append((name, base, cur, delta, status))
+	return rows
+
+def main():
+	ap = argparse.ArgumentParser()
+	ap.add_argument('--docs', type=int, default=2000, help='arquivos .md no INPUT_DIR')
+	ap.add_argument('--pages', type=int, default=300, help='páginas do site HTML local (0 = sem crawl)')
+	ap.add_argument('--dim', type=int, default=256)
+	ap.add_argument('--queries', type=int, default=500)
+	ap.add_argument('--k', type=int, default=10)
+	ap.add_argument('--dir', default='/tmp/every-bot-bench')
+	ap.add_argument('--out', help='grava o resultado em JSON')
+	ap.add_argument('--baseline', default=BASELINE)
+	ap.add_argument('--tolerance', type=float, default=0.25)
+	ap.add_argument('--save-baseline', action='store_true', help='grava o resultado como baseline')
+	args = ap.parse_args()
+	from .config import settings
+	input_dir, out_dir = os.path.join(args.dir, 'input'), os.path.join(args.dir, 'out')
+	docs = synthetic_docs(args.docs)
+	write_corpus(input_dir, docs)
+	metrics: Dict[str, Any] = {}
+	t0 = time.perf_counter()
+	n = sum(1 for d in docs for _ in iter_chunks(d, settings.CHUNK_SIZE_TOKENS, settings.CHUNK_OVERLAP_TOKENS))
+	metrics['chunking_chunks_per_s'] = round(n / (time.perf_counter() - t0), 1)
+	server, url = serve(site_pages(args.pages)) if args.pages else (None, 'http://127.0.0.1:9')
+	shutil.rmtree(out_dir, ignore_errors=True)
+	env = {**os.environ, 'OFFLINE_EMBED': '1', 'OFFLINE_EMBED_DIM': str(args.dim), 'INPUT_DIR': input_dir, 'OUT_DIR': out_dir,
+		'BASE_URL': url, 'TENANT_ID': 'bench', 'CRAWL_MAX_PAGES': str(args.pages + 1), 'CRAWL_RESPECT_ROBOTS': 'false',
+		'EMBED_CACHE': '0', 'CRAWL_CACHE': '0', 'EXTRACT_CACHE': '0', 'PYTHONPATH': os.pathsep.join([os.path.join(REPO, 'promtext'), REPO])}  # promtext direto da árvore, sem pip install
+	try:
+		wall, rss = run_build(env, bool(args.pages))
+	finally:
+		if server is not None:
+			server.shutdown()
+	from .index_store import current_dir
+	snapshot = current_dir(out_dir)
+	chunks = len(np.load(os.path.join(snapshot, 'chunks.offsets.npy'))) - 1
+	metrics.update({'chunks': chunks, 'build_wall_s': round(wall, 2), 'build_chunks_per_s': round(chunks / wall, 1), 'build_peak_rss_mb': round(rss, 1)})
+	qpath, epath = make_queries(snapshot, args.queries, args.dim, args.dir)
+	bridge_env = {**env, 'INDEX_DIR': os.path.join(args.dir, 'nenhum'), 'INDEX_POLL_S': '0'}  # o store global da bridge fica vazio
+	res = subprocess.run([sys.executable, '-m', 'src.bench_store', '--dir', snapshot, '--queries', qpath, '--expect', epath, '--k', str(args.k)],
+		cwd=os.path.join(REPO, 'faiss-bridge'), env=bridge_env, check=True, capture_output=True, text=True)
+	bridge = json.loads(res.stdout.strip().splitlines()[-1])
+	metrics.update({'bridge_load_s': bridge['load_s'], 'bridge_rss_mb': bridge['rss_mb'], **{k: bridge[k] for k in ('search_p50_ms', 'search_p99_ms', 'search_qps', 'search_batch_qps', 'hit_at_k')}})
+	result = {
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'git': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip(),
+		'host': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'machine': platform.machine()},
+		'config': {'docs': args.docs, 'pages': args.pages, 'dim': args.dim, 'queries': args.queries, 'k': args.k},
+		'metrics': metrics,
+	}
+	if args.out:
+		with open(args.out, 'w') as f:
+			json.dump(result, f, indent=2)
+	print(json.dumps(result['metrics']))
+	if args.save_baseline:
+		with open(args.baseline, 'w') as f:
+			json.dump(result, f, indent=2)
+			f.write('\n')
+		print(f'baseline gravado em {args.baseline}')
+		return
+	if not os.path.exists(args.baseline):
+		return
+	with open(args.baseline) as f:
+		base = json.load(f)
+	if base.get('config') != result['config']:
+		print(f"aviso: baseline com outra configuração ({base.get('config')})")
+	rows = compare(metrics, base['metrics'], args.tolerance)
+	for name, b, c, delta, status in rows:
+		print(f'{name:<24} {b:>12.3f} {c:>12.3f} {delta:>+8.1%}  {status}')
+	if any(status == 'PIOROU' for *_, status in rows):
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
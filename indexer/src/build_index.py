@@ -1,157 +1,299 @@
-import os, json, faiss, numpy as np  # type: ignore[import-not-found]
-from typing import List, Dict, Any
-from openai import OpenAI  # type: ignore[import-not-found]
-from tqdm import tqdm  # type: ignore[import-not-found]
-from tenacity import retry, wait_exponential, stop_after_attempt  # type: ignore[import-not-found]
+import os, json, time, tempfile, numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Tuple
 from .config import settings
-from .chunking import iter_split
-from .utils import logger, meta_record
+from .chunking import iter_split, iter_chunks, token_counter
+from .utils import logger, meta_record, doc_fingerprint, same_doc, sha1
 try:
 	from .utils import mem_mb  # type: ignore
 except Exception:  # pragma: no cover
 	def mem_mb():
 		return None
 from .io_paths import ensure_out
+from .index_store import IndexWriter
+from .embedding import EmbedPipeline, Backoff, default_embed_fn, embed_model_name, estimate_tokens
+from .embed_cache import EmbedCache
+from .dedup import Deduper
+from . import metrics
 
-_client: OpenAI | None = None
+_backoff = Backoff()
+_cache: EmbedCache | None = None
+
+class DeferredDocs:
+	"""Docs inalterados com `dedup_of` vistos no sync, guardados num arquivo temporário
+	(o crawl é consumido uma vez só) até se saber se algum dono mudou mais adiante."""
+	def __init__(self):
+		self._file = tempfile.TemporaryFile()
+		self._items: List[Tuple[int, str]] = []  # (offset, url)
+
+	def add(self, d: Dict[str, Any], fp: Dict[str, Any]):
+		self._file.seek(0, 2)
+		self._items.append((self._file.tell(), d['url']))
+		self._file.write(json.dumps([d, fp], ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+
+	def due(self, stale: Callable[[Dict[str, Any]], bool]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+		"""(doc, fingerprint) dos docs que ficaram `stale`; repete até estabilizar, já que
+		re-indexar um doc pode invalidar quem dependia dele."""
+		pending = self._items
+		while pending:
+			rest = []
+			for pos, url in pending:
+				self._file.seek(pos)
+				d, fp = json.loads(self._file.readline())
+				if stale(d):
+					yield d, fp
+				else:
+					rest.append((pos, url))
+			if len(rest) == len(pending):
+				return
+			pending = rest
+
+	def close(self):
+		self._file.close()
+
+def cached_embed_fn(cache: EmbedCache | None):
+	fn = default_embed_fn()
+	return cache.wrap(fn, embed_model_name()) if cache else fn
 
-@retry(wait=wait_exponential(multiplier=1, min=2, max=30), stop=stop_after_attempt(5))
 def embed_batch(texts:List[str]):
-	# Offline/testing mode (no chamadas externas) gera vetores zero determinísticos
-	global _client
-	if os.getenv('OFFLINE_EMBED'):
-		DIM = 1536
-		return [[0.0]*DIM for _ in texts]
-	if _client is None:
-		_client = OpenAI(api_key=settings.OPENAI_API_KEY)
-	resp = _client.embeddings.create(model=settings.EMBEDDING_MODEL, input=texts)
-	return [d.embedding for d in resp.data]
+	"""Embedding síncrono de um lote (cache + backoff); o build usa EmbedPipeline."""
+	global _cache
+	if _cache is None:
+		_cache = EmbedCache.from_env(ensure_out())
+	return _backoff.call(cached_embed_fn(_cache), texts)
 
-def build(all_docs:List[Dict[str, Any]], mode:str):
+def build(all_docs:Iterable[Dict[str, Any]], mode:str, prune_sources: Iterable[str] = ('site', 'doc'), resume: bool = False):
+	"""Indexa `all_docs` (qualquer iterável, consumido em streaming) em OUT_DIR.
+
+	mode: rebuild (do zero), append (acrescenta tudo) ou sync (só docs novos ou
+	alterados são re-chunkados/embedados; versões antigas e docs ausentes das
+	fontes em `prune_sources` viram tombstones).
+
+	resume: continua o último build de OUT_DIR (no modo dele, `mode` é
+	ignorado) a partir do último commit: docs já commitados por ele são
+	pulados e os chunks commitados de um doc pela metade são reaproveitados
+	sem re-embedding; o resto segue como num build sem interrupção.
+	"""
+	prune_sources = set(prune_sources)
 	ensure_out()
 	# Streaming padrão (desativar com STREAM_EMBED=0 ou false)
 	stream_env = os.getenv('STREAM_EMBED','1')
 	stream = stream_env.lower() not in ('0','false','no')
 	flush_threshold = int(os.getenv('STREAM_FLUSH','64'))
-	embed_batch_size = int(os.getenv('EMBED_BATCH','32'))
 	safe_mode = bool(os.getenv('SAFE_MODE'))  # SAFE_MODE=1 força flush a cada chunk
 	max_chunks_env = os.getenv('MAX_CHUNKS')
 	max_chunks = int(max_chunks_env) if max_chunks_env else None
 	out_dir = ensure_out()
-	meta_path = os.path.join(out_dir,'meta.json')
-	vec_path = os.path.join(out_dir,'vectors.npy')
-	index_path = os.path.join(out_dir,'index.faiss')
-	all_meta: List[Dict[str, Any]] = []
-	current_vecs: np.ndarray | None = None
-	index = None
-	if mode=='append' and os.path.exists(index_path) and os.path.exists(vec_path) and os.path.exists(meta_path):
-		logger.info('Append: carregando índice existente (modo streaming compatível)')
-		with open(meta_path,'r') as f: all_meta = json.load(f)
-		loaded = np.load(vec_path)
-		current_vecs = loaded.astype('float32', copy=False)
-		dim = current_vecs.shape[1]  # type: ignore[union-attr]
-		index = faiss.IndexFlatL2(dim)  # type: ignore[attr-defined]
-		index.add(current_vecs)  # type: ignore[call-arg]
-	num_chunks_total = len(all_meta)
+	writer = IndexWriter(out_dir, mode, resume)
+	if resume and writer.mode != mode:
+		logger.info(f"Retomando build no modo {writer.mode} (--mode {mode} ignorado)")
+	mode = writer.mode
+	start_count = writer.count
+	start_id = writer.next_id
 	def add_vectors(new_meta: List[Dict[str, Any]], new_vecs: np.ndarray):
-		nonlocal current_vecs, index, num_chunks_total, all_meta
 		if new_vecs.ndim==1:
 			new_vecs = new_vecs.reshape(1,-1)
 		# normalize
 		norms = np.linalg.norm(new_vecs, axis=1, keepdims=True) + 1e-9
 		new_vecs = new_vecs / norms
-		if index is None:
-			index = faiss.IndexFlatL2(new_vecs.shape[1])  # type: ignore[attr-defined]
-			index.add(new_vecs)  # type: ignore[call-arg]
-			current_vecs = new_vecs
-			all_meta = new_meta
-		else:
-			index.add(new_vecs)  # type: ignore[call-arg]
-			current_vecs = np.vstack([current_vecs, new_vecs]) if current_vecs is not None else new_vecs
-			all_meta.extend(new_meta)
-		num_chunks_total = len(all_meta)
-		faiss.write_index(index, index_path)  # type: ignore[attr-defined]
-		np.save(vec_path, current_vecs)
-		with open(meta_path,'w') as f: json.dump(all_meta, f, ensure_ascii=False)
+		# append-only: grava só o lote novo + manifest (O(batch) por flush)
+		with metrics.stage('persist', len(new_meta)):
+			writer.append(new_meta, new_vecs)
 		m = mem_mb()
 		if m:
-			logger.debug(f"Persistidos {len(new_meta)} chunks (total {num_chunks_total}) RAM~{m:.1f}MB")
+			logger.debug(f"Persistidos {len(new_meta)} chunks (total {writer.count}) RAM~{m:.1f}MB")
+	# lotes embedados em paralelo (EMBED_CONCURRENCY) e persistidos em ordem de chunk_id
+	# cache (EMBED_MODEL, sha1) -> vetor: só textos novos/alterados vão para a API
+	cache = EmbedCache.from_env(out_dir)
+	pipeline = EmbedPipeline.from_env(add_vectors, cached_embed_fn(cache))
+	dedup = Deduper.from_env()
+	if writer.resumed or writer.partial:
+		logger.info(f"Resume: {len(writer.resumed)} docs já commitados, {sum(len(p) for p in writer.partial.values())} chunks de doc incompleto")
+		if dedup:
+			# mesmo estado de dedup que o build teria sem a interrupção
+			for m in writer.iter_run_meta():
+				dedup.match(m['text'], m['sha1'], estimate_tokens(m['text']), (m['url'], int(m['chunk_id'])))
+	count_tokens = token_counter(settings.CHUNK_TOKENIZER)
+	def doc_chunks(text: str) -> Iterator[Tuple[str, List[str]]]:
+		if settings.CHUNKER == 'chars':
+			return ((p, []) for p in iter_split(text, settings.CHUNK_SIZE_CHARS, settings.CHUNK_OVERLAP_CHARS))
+		return iter_chunks(text, settings.CHUNK_SIZE_TOKENS, settings.CHUNK_OVERLAP_TOKENS, count_tokens)
 	processed_chunks = 0
 	buffer_texts: List[str] = []
 	buffer_meta: List[Dict[str, Any]] = []
 	def flush_buffer():
-		nonlocal buffer_texts, buffer_meta, processed_chunks
+		nonlocal buffer_texts, buffer_meta
 		if not buffer_texts:
 			return
-		logger.debug(f"Embedding buffer {len(buffer_texts)} (batch={embed_batch_size})")
-		emb: List[List[float]] = []
-		for i in range(0,len(buffer_texts),embed_batch_size):
-			batch = buffer_texts[i:i+embed_batch_size]
-			emb.extend(embed_batch(batch))
-		vecs = np.array(emb, dtype='float32')
-		add_vectors(buffer_meta, vecs)
-		processed_chunks += len(buffer_texts)
+		logger.debug(f"Enfileirando buffer {len(buffer_texts)} (batch={pipeline.batch_size}, em voo={len(pipeline.pending)})")
+		pipeline.submit(buffer_texts, buffer_meta)
 		buffer_texts = []
 		buffer_meta = []
+	sync = mode == 'sync'
+	stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'reused_chunks': 0, 'removed': 0, 'resumed': 0, 'resumed_chunks': 0, 'dependents': 0}
+	seen_docs: set[str] = set()
+	# sync: docs re-chunkados ou removidos nesta execução. Um doc inalterado com chunk
+	# descartado como cópia de um chunk deles (dedup_of) perderia esse conteúdo
+	touched: set[str] = set(writer.resumed) if sync else set()
+	deferred = DeferredDocs() if sync else None
+	complete = False
+	def stale(entry: Dict[str, Any]) -> bool:
+		# algum chunk do qual o doc é cópia foi (ou vai ser, nesta execução) removido
+		for url, ids in (entry.get('dedup_of') or {}).items():
+			owner = writer.docs.get(url)
+			if url in touched or owner is None or not set(ids) <= set(owner.get('chunks', [])):
+				return True
+		return False
+	def index_doc(d: Dict[str, Any], key: str, fp: Dict[str, Any], prev: Dict[str, Any] | None, committed: Dict[str, Any] | None) -> bool:
+		"""Chunka, deduplica e enfileira um doc; True se MAX_CHUNKS foi atingido."""
+		nonlocal processed_chunks
+		logger.debug(f"Chunking doc: {d.get('title')}")
+		text_len = len(d['text']) if d.get('text') else 0
+		if text_len > settings.CHUNK_SIZE_CHARS * 200:
+			logger.warning(f"Doc muito grande ({text_len} chars), truncando para evitar OOM")
+			d['text'] = d['text'][:settings.CHUNK_SIZE_CHARS * 200]
+		t0 = time.perf_counter()
+		doc_chunk_list = list(doc_chunks(d['text']))  # doc já truncado acima: cabe em memória
+		metrics.observe('chunk', time.perf_counter() - t0, len(doc_chunk_list))
+		doc_ids: List[int] = []
+		owners: Dict[str, List[int]] = {}
+		dedup_secs = 0.0
+		partial = writer.partial.pop(key, [])
+		reused = 0
+		cut = False
+		for i, (p, headings) in enumerate(doc_chunk_list):
+			if reused < len(partial) and partial[reused][1] == sha1(p):
+				# prefixo commitado antes da interrupção: mesmo chunk_id, sem embedding
+				doc_ids.append(partial[reused][0])
+				reused += 1
+				if dedup:
+					dedup.match(p, partial[reused - 1][1], estimate_tokens(p), (key, partial[reused - 1][0]))
+				continue
+			cid = start_id + processed_chunks
+			meta = meta_record(str(cid), d['title'], d['url'], 'site' if d['url'].startswith('http') else 'doc', settings.TENANT_ID, p)
+			if dedup:
+				t0 = time.perf_counter()
+				owner = dedup.match(p, meta['sha1'], estimate_tokens(p), (key, cid))
+				dedup_secs += time.perf_counter() - t0
+				if owner is not None:
+					if owner[0] != key:
+						owners.setdefault(owner[0], []).append(owner[1])
+					continue
+			if headings:
+				meta['headings'] = headings
+			doc_ids.append(cid)
+			buffer_texts.append(p)
+			buffer_meta.append(meta)
+			if stream and (safe_mode or len(buffer_texts) >= flush_threshold):  # flush threshold configurável ou modo seguro
+				flush_buffer()
+			processed_chunks += 1
+			if processed_chunks % 500 == 0:
+				m = mem_mb()
+				if m:
+					logger.debug(f"Progresso chunking {processed_chunks} RAM~{m:.1f}MB")
+			if max_chunks and (processed_chunks + start_count) >= max_chunks:
+				logger.warning(f"Max chunks atingido ({max_chunks}) interrompendo")
+				cut = i < len(doc_chunk_list) - 1
+				break
+		if dedup:
+			metrics.observe('dedup', dedup_secs, len(doc_chunk_list))
+		stats['resumed_chunks'] += reused
+		# sync substitui a versão anterior; append mantém as duas (comportamento histórico);
+		# doc commitado pelo build retomado e alterado desde então também é substituído
+		replace = sync or committed is not None
+		old_ids = list(prev.get('chunks', [])) if prev is not None else []
+		chunks = doc_ids if replace else old_ids + doc_ids
+		drop = (old_ids if replace else []) + [c for c, _ in partial[reused:]]
+		entry: Dict[str, Any] = {**fp, 'chunks': chunks}
+		if owners:
+			entry['dedup_of'] = owners
+		if cut:
+			# fingerprint é do doc inteiro: sem a marca o próximo sync o daria por inalterado
+			entry['partial'] = True
+		writer.doc_done(key, entry, max(doc_ids) if doc_ids else -1, drop=drop)
+		if sync:
+			touched.add(key)
+		return bool(max_chunks and (processed_chunks + start_count) >= max_chunks)
 	try:
 		for d in all_docs:
-			logger.debug(f"Chunking doc: {d.get('title')}")
-			text_len = len(d['text']) if d.get('text') else 0
-			if text_len > settings.CHUNK_SIZE_CHARS * 200:
-				logger.warning(f"Doc muito grande ({text_len} chars), truncando para evitar OOM")
-				d['text'] = d['text'][:settings.CHUNK_SIZE_CHARS * 200]
-			chunk_iter = iter_split(d['text'], settings.CHUNK_SIZE_CHARS, settings.CHUNK_OVERLAP_CHARS)
-			for p in chunk_iter:
-				cid = f"{num_chunks_total + len(buffer_meta)}"
-				meta = meta_record(cid, d['title'], d['url'], 'site' if d['url'].startswith('http') else 'doc', settings.TENANT_ID, p)
-				if stream:
-					buffer_texts.append(p)
-					buffer_meta.append(meta)
-					if safe_mode or len(buffer_texts) >= flush_threshold:  # flush threshold configurável ou modo seguro
-						flush_buffer()
-				else:
-					buffer_texts.append(p)
-					buffer_meta.append(meta)
-				processed_chunks += 1
-				if processed_chunks % 500 == 0:
-					m = mem_mb()
-					if m:
-						logger.debug(f"Progresso chunking {processed_chunks} RAM~{m:.1f}MB")
-				if max_chunks and (processed_chunks + num_chunks_total) >= max_chunks:
-					logger.warning(f"Max chunks atingido ({max_chunks}) interrompendo")
-					break
-			if max_chunks and (processed_chunks + num_chunks_total) >= max_chunks:
+			key = d['url']
+			seen_docs.add(key)
+			fp = doc_fingerprint(d)
+			committed = writer.resumed.get(key)
+			if committed is not None and same_doc(committed, fp) and not committed.get('partial'):
+				stats['resumed'] += 1
+				continue
+			prev = writer.docs.get(key)
+			if sync and prev is not None and same_doc(prev, fp) and not prev.get('partial'):
+				if not stale(prev):
+					if prev.get('dedup_of') and deferred is not None:
+						deferred.add(d, fp)  # o dono ainda pode mudar mais adiante no crawl
+					stats['unchanged'] += 1
+					stats['reused_chunks'] += len(prev.get('chunks', []))
+					continue
+				stats['dependents'] += 1
+			else:
+				stats['changed' if prev is not None else 'new'] += 1
+			if index_doc(d, key, fp, prev, committed):
 				break
+		else:
+			complete = True
+		if sync and complete and seen_docs:
+			for key in [k for k, e in writer.docs.items() if k not in seen_docs and e.get('source') in prune_sources]:
+				writer.doc_removed(key)
+				touched.add(key)
+				stats['removed'] += 1
+			if deferred is not None:
+				# inalterados cujo dono foi alterado/removido depois de passarem pelo loop
+				for d, fp in deferred.due(lambda d: stale(writer.docs.get(d['url']) or {})):
+					stats['unchanged'] -= 1
+					stats['dependents'] += 1
+					if index_doc(d, d['url'], fp, writer.docs.get(d['url']), None):
+						break
 	except KeyboardInterrupt:
-		logger.warning('Interrompido por usuário; tentando flush parcial...')
+		logger.warning('Interrompido por usuário; tentando flush parcial (continue com --resume)...')
 	finally:
-		if stream and buffer_texts:
+		if stream:
 			try:
-				logger.debug(f"Flush final parcial {len(buffer_texts)} chunks")
-				emb: List[List[float]] = []
-				for i in range(0,len(buffer_texts),embed_batch_size):
-					batch = buffer_texts[i:i+embed_batch_size]
-					emb.extend(embed_batch(batch))
-				vecs = np.array(emb, dtype='float32')
-				add_vectors(buffer_meta, vecs)
-				processed_chunks += len(buffer_texts)
+				flush_buffer()
+				pipeline.flush()
 			except Exception as e:  # pragma: no cover
 				logger.error(f"Falha flush parcial: {e}")
+				pipeline.close(cancel=True)
+				raise
 			finally:
 				buffer_texts.clear(); buffer_meta.clear()
-	# Final flush
-	flush_buffer()
+		if deferred is not None:
+			deferred.close()
 	if not stream:
 		# Non streaming path: embed everything accumulated once
 		if not buffer_texts:
 			logger.warning('Sem chunks para indexar')
+			pipeline.close()
+			if cache: cache.close()
+			if complete:
+				writer.drop_partial()
+				writer.finish_run()
+			writer.finalize()
 			return
-		logger.info(f"Embedding {len(buffer_texts)} chunks (modo não streaming, batch={embed_batch_size})")
-		emb: List[List[float]] = []
-		for i in range(0,len(buffer_texts),embed_batch_size):
-			batch = buffer_texts[i:i+embed_batch_size]
-			logger.debug(f"Embedding batch {i//embed_batch_size +1} size={len(batch)}")
-			emb.extend(embed_batch(batch))
-		vecs = np.array(emb, dtype='float32')
-		add_vectors(buffer_meta, vecs)
-	logger.info(f"Index pronto. Total chunks: {len(all_meta)}")
+		logger.info(f"Embedding {len(buffer_texts)} chunks (modo não streaming, batch={pipeline.batch_size})")
+		flush_buffer()
+		pipeline.flush()
+	pipeline.close()
+	logger.info(f"Embeddings: {pipeline.batches} lotes")
+	if dedup:
+		st = dedup.stats()
+		logger.info(f"Dedup: {st['exact']} chunks exatos e {st['near']} quase-duplicados descartados (~{st['saved_tokens']} tokens de embedding economizados)")
+	if stats['resumed'] or stats['resumed_chunks']:
+		logger.info(f"Resume: {stats['resumed']} docs pulados, {stats['resumed_chunks']} chunks reaproveitados sem re-embedding")
+	if sync:
+		logger.info(f"Sync: {stats['new']} novos, {stats['changed']} alterados, {stats['removed']} removidos, {stats['unchanged']} inalterados ({stats['reused_chunks']} chunks reaproveitados sem re-embedding), {stats['dependents']} re-indexados por dependerem de chunks alterados (dedup)")
+	if cache:
+		logger.info(f"Cache embeddings: {cache.stats()}")
+		cache.close()
+	if complete:
+		# chunks de doc incompleto que não reapareceu viram tombstones; o próximo --resume só re-exporta
+		writer.drop_partial()
+		writer.finish_run()
+	with metrics.stage('export'):
+		writer.finalize()
+	logger.info(f"Index pronto. Total chunks: {writer.count}")
@@ -1,4 +1,5 @@
-from typing import List, Iterator
+import re
+from typing import Callable, List, Iterator, Tuple
 
 def split_text(text:str, size:int, overlap:int) -> List[str]:
 	chunks: List[str] = []
@@ -6,6 +7,7 @@ def split_text(text:str, size:int, overlap:int) -> List[str]:
 	while start < n:
 		end = min(n, start+size)
 		chunks.append(text[start:end])
+		if end == n: break
 		start = end - overlap
 		if start < 0: start = 0
 	return [c.strip() for c in chunks if c.strip()]
@@ -18,5 +20,160 @@ def iter_split(text:str, size:int, overlap:int) -> Iterator[str]:
 		chunk = text[start:end].strip()
 		if chunk:
 			yield chunk
+		if end == n: break
 		start = end - overlap
 		if start < 0: start = 0
+
+# Contagem offline no estilo BPE (cl100k): palavras longas viram várias peças,
+# números em grupos de até 3 dígitos, cada pontuação conta 1 e cada caractere
+# de escrita sem espaços (CJK, kana, hangul, tailandês) conta 1. É uma
+# estimativa: superestima inglês, mas pode subestimar outras línguas (ex.:
+# palavras acentuadas); com limite estrito use CHUNK_TOKENIZER=tiktoken.
+_PIECE = re.compile(r'[^\W\d_]{1,5}|\d{1,3}|[^\w\s]')
+_UNSPACED = re.compile(r'[\u0e00-\u0e7f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+_SENTENCE = re.compile(r'(?<=[.!?…;:])\s+')
+
+def offline_tokens(text: str) -> int:
+	unspaced = len(_UNSPACED.findall(text))
+	if unspaced:
+		text = _UNSPACED.sub(' ', text)
+	return len(_PIECE.findall(text)) + unspaced
+
+def token_counter(name: str = 'offline') -> Callable[[str], int]:
+	"""`offline` (padrão, sem dependências) ou `tiktoken` (cl100k_base, contagem exata dos modelos de embedding da OpenAI)."""
+	if name == 'tiktoken':
+		import tiktoken  # type: ignore[import-not-found]
+		enc = tiktoken.get_encoding('cl100k_base')
+		return lambda text: len(enc.encode(text, disallowed_special=()))
+	return offline_tokens
+
+def iter_blocks(text: str) -> Iterator[Tuple[int, str]]:
+	"""(nível do heading ou 0, texto) por bloco: headings markdown (`#`) e parágrafos separados por linha em branco."""
+	para: List[str] = []
+	for line in text.splitlines():
+		m = _HEADING.match(line)
+		if m or not line.strip():
+			if para:
+				yield 0, '\n'.join(para)
+				para = []
+			if m:
+				yield len(m.group(1)), m.group(2)
+			continue
+		para.append(line.strip())
+	if para:
+		yield 0, '\n'.join(para)
+
+def _cut(word: str, size: int, count: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+	# "palavra" maior que o chunk (minificado, base64, URL longa, CJK): prefixos de até
+	# `size` tokens. Cada token tem ao menos 1 caractere, então `size` caracteres
+	# sempre cabem; daí dobra e faz busca binária pelo maior prefixo que cabe
+	while word:
+		lo = hi = min(size, len(word))
+		while hi < len(word):
+			hi = min(2 * hi, len(word))
+			if count(word[:hi]) > size:
+				break
+			lo = hi
+		while hi - lo > 1:
+			mid = (lo + hi) // 2
+			if count(word[:mid]) <= size:
+				lo = mid
+			else:
+				hi = mid
+		lo = max(lo, 1)
+		yield word[:lo], count(word[:lo])
+		word = word[lo:]
+
+def _pieces(block: str, size: int, count: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+	# bloco maior que o chunk: frases; frase maior que o chunk: janelas de palavras;
+	# palavra maior que o chunk: cortada por caracteres (_cut)
+	for sent in _SENTENCE.split(block):
+		n = count(sent)
+		if n <= size:
+			yield sent, n
+			continue
+		words: List[str] = []
+		acc = 0
+		for word in sent.split():
+			n = count(word)
+			for w, t in (_cut(word, size, count) if n > size else [(word, n)]):
+				if words and acc + t > size:
+					yield ' '.join(words), acc
+					words, acc = [], 0
+				words.append(w)
+				acc += t
+		if words:
+			yield ' '.join(words), acc
+
+def _common(a: List[str], b: List[str]) -> List[str]:
+	i = 0
+	while i < min(len(a), len(b)) and a[i] == b[i]:
+		i += 1
+	return a[:i]
+
+def iter_sections(text: str) -> Iterator[Tuple[int, str, List[str]]]:
+	"""(nível, heading, parágrafos) por seção; o trecho antes do primeiro heading tem nível 0."""
+	level, title, paras = 0, '', []
+	for lv, block in iter_blocks(text):
+		if lv:
+			if title or paras:
+				yield level, title, paras
+			level, title, paras = lv, block, []
+		else:
+			paras.append(block)
+	if title or paras:
+		yield level, title, paras
+
+def iter_chunks(text: str, size: int, overlap: int = 0, count: Callable[[str], int] = offline_tokens, min_size: int | None = None) -> Iterator[Tuple[str, List[str]]]:
+	"""Chunks de até `size` tokens alinhados a headings, parágrafos e frases.
+
+	Gera (texto, caminho de headings). Uma seção que cabe inteira no espaço
+	restante entra no chunk corrente (o caminho vira o prefixo comum); se não
+	cabe e o chunk já tem `min_size` tokens (padrão size/2), ele é fechado e a
+	seção começa um chunk novo. Parágrafo que não cabe é quebrado em frases (e
+	frase gigante em palavras); só uma palavra maior que `size` sozinha (texto
+	sem espaços) é cortada por caracteres. `overlap` repete
+	as últimas frases (até esse número de tokens) no início do chunk seguinte
+	da mesma seção.
+	"""
+	min_size = size // 2 if min_size is None else min_size
+	path: List[str] = []
+	levels: List[int] = []
+	parts: List[Tuple[str, int, str]] = []  # (peça, tokens, separador antes dela) do chunk corrente
+	tokens = 0
+	chunk_path: List[str] = []
+	def emit() -> Iterator[Tuple[str, List[str]]]:
+		if parts:
+			yield parts[0][0] + ''.join(sep + p for p, _, sep in parts[1:]), chunk_path
+	for level, title, paras in iter_sections(text):
+		if level:
+			while levels and levels[-1] >= level:
+				levels.pop(); path.pop()
+			levels.append(level); path.append(title)
+		blocks = (['#' * level + ' ' + title] if level else []) + paras
+		pieces: List[Tuple[str, int, str]] = []
+		for block in blocks:
+			n = count(block)
+			if n <= size:
+				pieces.append((block, n, '\n\n'))
+			else:
+				pieces.extend((p, t, ' ' if i else '\n\n') for i, (p, t) in enumerate(_pieces(block, size, count)))
+		if parts and tokens + sum(t for _, t, _ in pieces) > size and tokens >= min_size:
+			yield from emit()
+			parts, tokens = [], 0
+		for piece, t, sep in pieces:
+			if parts and tokens + t > size:
+				yield from emit()
+				keep: List[Tuple[str, int, str]] = []
+				acc = 0
+				for part in reversed(parts):
+					if part[0].startswith('#') or acc + part[1] > overlap or acc + part[1] + t > size:
+						break
+					keep.insert(0, part); acc += part[1]
+				parts, tokens = keep, acc
+				chunk_path = list(path)
+			chunk_path = _common(chunk_path, path) if parts else list(path)
+			parts.append((piece, t, sep))
+			tokens += t
+	yield from emit()
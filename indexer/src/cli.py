@@ -1,40 +1,61 @@
-import argparse, sys
-from typing import List, Dict, Any
+import argparse, sys, os, itertools
+from typing import List, Dict, Any, Iterable
 from .config import settings  # type: ignore[attr-defined]
-from .crawl_site import crawl  # type: ignore[attr-defined]
-from .ingest_docs import ingest_local  # type: ignore[attr-defined]
+from .crawl_site import iter_crawl  # type: ignore[attr-defined]
+from .ingest_docs import iter_local  # type: ignore[attr-defined]
 from .build_index import build  # type: ignore[attr-defined]
-from .export_crawl import export_docs  # type: ignore[attr-defined]
-from .utils import logger  # type: ignore[attr-defined]
+from .export_crawl import iter_export  # type: ignore[attr-defined]
+from .utils import logger, prefetch  # type: ignore[attr-defined]
+from . import metrics  # type: ignore[attr-defined]
 
 def main():
 	parser = argparse.ArgumentParser(description='Indexer CLI')
-	parser.add_argument('--mode', choices=['rebuild','append'], default='rebuild')
+	parser.add_argument('--mode', choices=['rebuild','append','sync'], default='rebuild', help='sync: só re-indexa docs novos/alterados e remove os ausentes')
 	parser.add_argument('--no-crawl', action='store_true')
 	parser.add_argument('--no-docs', action='store_true')
 	parser.add_argument('-v','--verbose', action='store_true', help='Ativa logs detalhados')
+	parser.add_argument('--resume', action='store_true', help='Continua o último build de OUT_DIR (interrompido ou morto) a partir do último lote commitado, no modo original')
 	parser.add_argument('--export-crawl', action='store_true', help='Salva cada página crawleada em arquivos .txt no INPUT_DIR antes de indexar')
 	args = parser.parse_args()
 	if args.verbose:
 		logger.setLevel('DEBUG')  # type: ignore[arg-type]
 		logger.debug('Verbose ON')
-	site_docs: List[Dict[str, Any]] = []
+	# METRICS_FILE: métricas por etapa regravadas durante o job; PROFILE_DIR: profile por amostragem do job inteiro
+	exporter = metrics.Exporter.from_env()
+	profile_dir = os.getenv('PROFILE_DIR')
+	sampler = metrics.Sampler(float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000).start() if profile_dir else None
+	if exporter:
+		exporter.start()
+	try:
+		run(args)
+	finally:
+		logger.info(f"Etapas: {metrics.summary()}")
+		if exporter:
+			exporter.stop()
+		if sampler and profile_dir:
+			path = sampler.stop().write(metrics.profile_path(profile_dir, 'build'))
+			logger.info(f"Profile: {sampler.samples} amostras em {path}")
+
+def run(args: argparse.Namespace):
+	# docs fluem como iterador até o build: chunking/embedding começam enquanto o
+	# crawl ainda roda e a memória fica limitada pelos buffers, não pelo corpus
+	sources: List[Iterable[Dict[str, Any]]] = []
 	if not args.no_crawl:
 		logger.info('Iniciando crawl...')
-		site_docs = crawl()
-		logger.info(f'Crawl coletou {len(site_docs)} docs')
-		if args.export_crawl and site_docs:
-			export_docs(site_docs)
-	local_docs: List[Dict[str, Any]] = []
+		site_docs: Iterable[Dict[str, Any]] = iter_crawl()
+		if args.export_crawl:
+			site_docs = iter_export(site_docs)
+		sources.append(prefetch(site_docs, int(os.getenv('DOC_PREFETCH', '16'))))
 	if not args.no_docs:
-		logger.info('Ingerindo docs locais...')
-		local_docs = ingest_local()
-		logger.info(f'Docs locais: {len(local_docs)}')
-	all_docs: List[Dict[str, Any]] = site_docs + local_docs
-	if not all_docs:
+		sources.append(iter_local())
+	all_docs = itertools.chain.from_iterable(sources)
+	first = next(all_docs, None)
+	if first is None:
 		logger.error('Nenhum documento encontrado.')
 		sys.exit(1)
-	build(all_docs, args.mode)
+	# sync só remove docs ausentes das fontes que foram de fato listadas nesta execução
+	prune_sources = [s for s, skipped in (('site', args.no_crawl), ('doc', args.no_docs)) if not skipped]
+	build(itertools.chain([first], all_docs), args.mode, prune_sources, resume=args.resume)
 
 if __name__ == '__main__':
 	main()
@@ -24,10 +24,22 @@ class Settings(BaseSettings):  # type: ignore[misc]
 	CRAWL_MAX_PAGES: int = 200
 	CRAWL_MAX_PAGE_CHARS: int = 60000
 	CRAWL_SAME_DOMAIN_ONLY: bool = True
+	CRAWL_CONCURRENCY: int = 8
+	CRAWL_PER_HOST: int = 4
+	CRAWL_DELAY_MS: int = 0
+	CRAWL_RESPECT_ROBOTS: bool = True
+	CRAWL_USE_SITEMAP: bool = True
+	CRAWL_PARSER: str = "auto"  # auto|lxml|html.parser
 	CHUNK_SIZE_CHARS: int = 1400
 	CHUNK_OVERLAP_CHARS: int = 160
+	CHUNKER: str = "structured"  # structured (headings/parágrafos/frases, por tokens) | chars (janelas de CHUNK_SIZE_CHARS)
+	CHUNK_SIZE_TOKENS: int = 350
+	CHUNK_OVERLAP_TOKENS: int = 0
+	CHUNK_TOKENIZER: str = "offline"  # offline | tiktoken (cl100k_base, se instalado)
 	MAX_PDF_PAGES: int = 20
 	MAX_PDF_BYTES: int = 5000000  # ~5MB
+	EXTRACT_WORKERS: int = 0  # 0 = os.cpu_count(); 1 = serial, sem pool
+	EXTRACT_TIMEOUT_S: int = 60
 
 	# Pydantic v2 style
 	if 'SettingsConfigDict' in globals() and SettingsConfigDict is not None:  # type: ignore[name-defined]
@@ -0,0 +1,86 @@
+import os, json, time, sqlite3, threading
+from typing import List, Dict, Any, Set
+from .utils import sha1
+
+class CrawlCache:
+	"""Cache persistente do crawl por URL (SQLite).
+
+	Guarda ETag / Last-Modified, o texto extraído e os links da página, para
+	que um 304 num re-crawl reaproveite o documento sem baixar nem parsear.
+	`changed` acumula as URLs cujo conteúdo mudou (ou é novo) nesta execução.
+	"""
+	def __init__(self, path: str):
+		self.path = path
+		self._lock = threading.Lock()
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute('PRAGMA journal_mode=WAL')
+		self._db.execute('''CREATE TABLE IF NOT EXISTS pages (
+			url TEXT PRIMARY KEY,
+			etag TEXT,
+			last_modified TEXT,
+			title TEXT,
+			text TEXT,
+			links TEXT,
+			sha1 TEXT,
+			fetched_at REAL,
+			changed_at REAL
+		)''')
+		self._db.commit()
+		self.changed: Set[str] = set()
+		self.not_modified = 0
+		self.fetched = 0
+
+	@classmethod
+	def from_env(cls, out_dir: str) -> 'CrawlCache | None':
+		if os.getenv('CRAWL_CACHE', '1').lower() in ('0', 'false', 'no'):
+			return None
+		return cls(os.getenv('CRAWL_CACHE_PATH') or os.path.join(out_dir, 'crawl_cache.sqlite'))
+
+	def get(self, url: str) -> Dict[str, Any] | None:
+		with self._lock:
+			row = self._db.execute('SELECT etag, last_modified, title, text, links, sha1 FROM pages WHERE url=?', (url,)).fetchone()
+		if row is None:
+			return None
+		etag, last_modified, title, text, links, digest = row
+		return {'etag': etag, 'last_modified': last_modified, 'title': title, 'text': text, 'links': json.loads(links or '[]'), 'sha1': digest}
+
+	def conditional_headers(self, cached: Dict[str, Any] | None) -> Dict[str, str]:
+		headers: Dict[str, str] = {}
+		if cached:
+			if cached.get('etag'):
+				headers['If-None-Match'] = cached['etag']
+			if cached.get('last_modified'):
+				headers['If-Modified-Since'] = cached['last_modified']
+		return headers
+
+	def hit(self, url: str):
+		"""304: conteúdo igual ao cache."""
+		with self._lock:
+			self.not_modified += 1
+			self._db.execute('UPDATE pages SET fetched_at=? WHERE url=?', (time.time(), url))
+			self._db.commit()
+
+	def store(self, url: str, etag: str | None, last_modified: str | None, title: str, text: str, links: List[str],
+			previous: Dict[str, Any] | None = None, digest: str | None = None):
+		digest = digest or sha1(text)
+		now = time.time()
+		changed = previous is None or previous.get('sha1') != digest
+		with self._lock:
+			self.fetched += 1
+			if changed:
+				self.changed.add(url)
+			self._db.execute('''INSERT INTO pages(url, etag, last_modified, title, text, links, sha1, fetched_at, changed_at)
+				VALUES (?,?,?,?,?,?,?,?,?)
+				ON CONFLICT(url) DO UPDATE SET etag=excluded.etag, last_modified=excluded.last_modified,
+					title=excluded.title, text=excluded.text, links=excluded.links, sha1=excluded.sha1,
+					fetched_at=excluded.fetched_at, changed_at=CASE WHEN pages.sha1=excluded.sha1 THEN pages.changed_at ELSE excluded.changed_at END''',
+				(url, etag, last_modified, title, text, json.dumps(links), digest, now, now))
+			self._db.commit()
+
+	def stats(self) -> str:
+		return f"{self.not_modified} não modificadas (304), {self.fetched} baixadas, {len(self.changed)} novas/alteradas"
+
+	def close(self):
+		with self._lock:
+			self._db.close()
@@ -1,87 +1,301 @@
-import requests, re, os
+import requests, re, os, time, threading, hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
 from bs4 import BeautifulSoup  # type: ignore[import-not-found]
+from requests.adapters import HTTPAdapter  # type: ignore[import-not-found]
+from urllib3.util.retry import Retry  # type: ignore[import-not-found]
 from urllib.parse import urljoin, urlparse
 from .config import settings
 from .utils import logger
+from .crawl_cache import CrawlCache
+from . import metrics
+
+USER_AGENT = 'every-bot-indexer/1.0'
 
 def clean(text:str):
 	text = re.sub(r'\s+',' ',text)
 	return text.strip()
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple, Deque
+
+def normalize_url(url: str) -> str:
+	# "http://host" e "http://host/" são a mesma página
+	p = urlparse(url)
+	return p._replace(path='/').geturl() if not p.path else url
+
+def html_parser() -> str:
+	"""Backend do BeautifulSoup: CRAWL_PARSER=auto usa lxml (C) se instalado."""
+	choice = getattr(settings, 'CRAWL_PARSER', 'auto')
+	if choice != 'auto':
+		return choice
+	try:
+		import lxml  # type: ignore[import-not-found]  # noqa: F401
+		return 'lxml'
+	except ImportError:
+		return 'html.parser'
+
+def make_session(pool_size: int) -> requests.Session:
+	# keep-alive compartilhado entre as threads (uma conexão por worker e host)
+	s = requests.Session()
+	retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=('GET', 'HEAD'))
+	adapter = HTTPAdapter(pool_connections=max(4, pool_size), pool_maxsize=max(4, pool_size), max_retries=retry)
+	s.mount('http://', adapter)
+	s.mount('https://', adapter)
+	s.headers['User-Agent'] = USER_AGENT
+	return s
+
+class HostLimiter:
+	"""No máximo `per_host` requests simultâneos e `delay` s entre inícios por host."""
+	def __init__(self, per_host: int, delay: float):
+		self.per_host = max(1, per_host)
+		self.delay = delay
+		self._lock = threading.Lock()
+		self._sems: Dict[str, threading.Semaphore] = {}
+		self._next: Dict[str, float] = {}
+		self._delays: Dict[str, float] = {}
+
+	def set_delay(self, host: str, delay: float):
+		with self._lock:
+			self._delays[host] = max(self.delay, delay)
+
+	@contextmanager
+	def slot(self, url: str) -> Iterator[None]:
+		host = urlparse(url).netloc
+		with self._lock:
+			sem = self._sems.setdefault(host, threading.Semaphore(self.per_host))
+		with sem:
+			with self._lock:
+				delay = self._delays.get(host, self.delay)
+				now = time.monotonic()
+				at = max(now, self._next.get(host, 0.0))
+				self._next[host] = at + delay
+			if at > now:
+				time.sleep(at - now)
+			yield
+
+class Robots:
+	"""robots.txt por host (baixado uma vez, na primeira URL do host)."""
+	def __init__(self, session: requests.Session, limiter: HostLimiter):
+		self.session = session
+		self.limiter = limiter
+		self._parsers: Dict[str, RobotFileParser | None] = {}
+
+	def _parser(self, url: str) -> RobotFileParser | None:
+		p = urlparse(url)
+		if p.netloc in self._parsers:
+			return self._parsers[p.netloc]
+		rp: RobotFileParser | None = None
+		try:
+			r = self.session.get(f"{p.scheme}://{p.netloc}/robots.txt", timeout=10)
+			if r.status_code == 200:
+				rp = RobotFileParser()
+				rp.parse(r.text.splitlines())
+				delay = rp.crawl_delay(USER_AGENT)
+				if delay:
+					self.limiter.set_delay(p.netloc, float(delay))
+		except Exception as e:
+			logger.debug(f"robots.txt indisponível em {p.netloc}: {e}")
+		self._parsers[p.netloc] = rp
+		return rp
+
+	def allowed(self, url: str) -> bool:
+		rp = self._parser(url)
+		return rp is None or rp.can_fetch(USER_AGENT, url)
+
+	def sitemaps(self, url: str) -> List[str]:
+		rp = self._parser(url)
+		return list(rp.site_maps() or []) if rp is not None else []
+
+def sitemap_urls(session: requests.Session, sitemaps: List[str], limit: int) -> List[str]:
+	"""URLs de página listadas nos sitemaps (segue sitemap index)."""
+	out: List[str] = []
+	todo: Deque[str] = deque(sitemaps)
+	visited = set()
+	while todo and len(out) < limit:
+		sm = todo.popleft()
+		if sm in visited:
+			continue
+		visited.add(sm)
+		try:
+			r = session.get(sm, timeout=10)
+			if r.status_code != 200:
+				continue
+			root = ElementTree.fromstring(r.content)
+		except Exception as e:
+			logger.debug(f"Sitemap inválido {sm}: {e}")
+			continue
+		nested = root.tag.endswith('sitemapindex')
+		for el in root.iter():
+			if el.tag.endswith('loc') and el.text:
+				loc = el.text.strip()
+				if nested:
+					todo.append(loc)
+				elif len(out) < limit:
+					out.append(loc)
+	return out
+
+def fetch_pdf(session: requests.Session, limiter: HostLimiter, url: str, input_dir: str, cache: CrawlCache | None = None):
+	# Download PDF into INPUT_DIR for later ingestion
+	fname = url.split('/')[-1] or 'file.pdf'
+	local_path = os.path.join(input_dir, fname)
+	exists = os.path.exists(local_path)
+	if exists and cache is None:
+		logger.debug(f"PDF already downloaded: {local_path}")
+		return
+	cached = cache.get(url) if cache is not None and exists else None
+	with limiter.slot(url):
+		if cached is None:
+			try:
+				head = session.head(url, timeout=10, allow_redirects=True)
+				sz = int(head.headers.get('Content-Length','0'))
+				limit = getattr(settings,'MAX_PDF_BYTES',5_000_000)
+				if sz and sz > limit:
+					logger.debug(f"Skip large PDF {sz}B > {limit}: {url}")
+					return
+			except Exception:
+				pass
+		with metrics.stage('crawl_pdf', 1):
+			r_pdf = session.get(url, timeout=20, headers=cache.conditional_headers(cached) if cache is not None else None)
+	if r_pdf.status_code==304 and cache is not None:
+		metrics.event('crawl_not_modified')
+		cache.hit(url)
+		logger.debug(f"PDF não modificado: {url}")
+	elif r_pdf.status_code==200:
+		with open(local_path,'wb') as f: f.write(r_pdf.content)
+		logger.debug(f"PDF baixado: {local_path}")
+		if cache is not None:
+			cache.store(url, r_pdf.headers.get('ETag'), r_pdf.headers.get('Last-Modified'), fname, '', [], cached, digest=hashlib.sha1(r_pdf.content).hexdigest())
+	else:
+		metrics.event('crawl_http_error')
+		logger.debug(f"Falha download PDF status {r_pdf.status_code}: {url}")
+
+def fetch_page(session: requests.Session, limiter: HostLimiter, url: str, parser: str, max_chars: int, cache: CrawlCache | None = None) -> Tuple[Dict[str, Any] | None, List[str]]:
+	logger.debug(f"Fetch: {url}")
+	cached = cache.get(url) if cache is not None else None
+	with limiter.slot(url), metrics.stage('crawl_fetch', 1):
+		r = session.get(url, timeout=10, headers=cache.conditional_headers(cached) if cache is not None else None)
+	if r.status_code==304 and cache is not None and cached is not None:
+		# conteúdo inalterado: reaproveita texto e links do cache sem parsear
+		metrics.event('crawl_not_modified')
+		cache.hit(url)
+		return {'title':cached['title'],'url':url,'text':cached['text'],'etag':cached['etag'],'last_modified':cached['last_modified'],'changed':False}, cached['links']
+	if r.status_code!=200:
+		metrics.event('crawl_http_error')
+		return None, []
+	t0 = time.perf_counter()
+	soup=BeautifulSoup(r.text, parser)
+	raw_title = soup.title.string if soup.title and soup.title.string else url
+	title = raw_title.strip()
+	# collect text but cap to avoid giant pages
+	parts: List[str] = []
+	acc = 0
+	# headings viram linhas `#`/`##`/`###` e cada bloco um parágrafo: o chunker usa essa estrutura
+	for h in soup.find_all(['h1','h2','h3','p','li']):
+		seg = clean(h.get_text(' ',strip=True))
+		if not seg:
+			continue
+		parts.append('#' * int(h.name[1]) + ' ' + seg if h.name[0] == 'h' else seg)
+		acc += len(seg)
+		if acc > max_chars:
+			logger.debug(f"Truncate page text at {acc} chars {url}")
+			break
+	text = '\n\n'.join(parts)
+	links = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)]
+	metrics.observe('crawl_parse', time.perf_counter() - t0, 1)
+	etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+	changed = True
+	if cache is not None:
+		cache.store(url, etag, last_modified, title, text, links, cached)
+		changed = url in cache.changed
+	return {'title':title,'url':url,'text':text,'etag':etag,'last_modified':last_modified,'changed':changed}, links
 
 def crawl() -> List[Dict[str, Any]]:
-	start = settings.BASE_URL.rstrip('/')
+	return list(iter_crawl())
+
+def iter_crawl() -> Iterator[Dict[str, Any]]:
+	"""Crawl como gerador: cada página é entregue assim que é baixada/parseada."""
+	start = normalize_url(settings.BASE_URL.rstrip('/'))
 	seen=set([start])
-	out: List[Dict[str, Any]] = []
-	q=[start]
+	collected = 0
+	q: Deque[str] = deque([start])
 	domain = urlparse(start).netloc
 	max_pages = int(getattr(settings, 'CRAWL_MAX_PAGES', 200))
 	input_dir = settings.INPUT_DIR
 	os.makedirs(input_dir, exist_ok=True)
 	max_chars = int(getattr(settings,'CRAWL_MAX_PAGE_CHARS',60000))
+	concurrency = max(1, int(getattr(settings, 'CRAWL_CONCURRENCY', 8)))
 	skip_patterns = [
 		'/tags/', '/categories/', '/profile/'
 	]
-	while q and len(out) < max_pages:
-		url = q.pop(0)
-		try:
-			if any(sp in url for sp in skip_patterns):
-				logger.debug(f"Skip pattern {url}")
-				continue
-			# Skip (or size-check) PDF URLs early
-			if url.lower().endswith('.pdf'):
-				# Download PDF into INPUT_DIR for later ingestion
-				fname = url.split('/')[-1] or 'file.pdf'
-				local_path = os.path.join(input_dir, fname)
-				if os.path.exists(local_path):
-					logger.debug(f"PDF already downloaded: {local_path}")
-					continue
-				try:
-					head = requests.head(url, timeout=10, allow_redirects=True, headers={'User-Agent':'every-bot-indexer/1.0'})
-					sz = int(head.headers.get('Content-Length','0'))
-					limit = getattr(settings,'MAX_PDF_BYTES',5_000_000)
-					if sz and sz > limit:
-						logger.debug(f"Skip large PDF {sz}B > {limit}: {url}")
+	parser = html_parser()
+	session = make_session(concurrency)
+	limiter = HostLimiter(int(getattr(settings, 'CRAWL_PER_HOST', 4)), int(getattr(settings, 'CRAWL_DELAY_MS', 0)) / 1000)
+	robots = Robots(session, limiter) if getattr(settings, 'CRAWL_RESPECT_ROBOTS', True) else None
+	# ETag/Last-Modified por URL: re-crawls viram requests condicionais (304 = sem download/parse)
+	cache = CrawlCache.from_env(settings.OUT_DIR)
+
+	def enqueue(href: str):
+		if settings.CRAWL_SAME_DOMAIN_ONLY and urlparse(href).netloc!=domain: return
+		if '#' in href: return
+		href = normalize_url(href)
+		if href not in seen:
+			seen.add(href); q.append(href)
+
+	if getattr(settings, 'CRAWL_USE_SITEMAP', True):
+		sitemaps = (robots.sitemaps(start) if robots else []) or [urljoin(start, '/sitemap.xml')]
+		seeded = sitemap_urls(session, sitemaps, max_pages * 4)
+		for u in seeded:
+			enqueue(u)
+		if seeded:
+			logger.info(f"Sitemap: {len(seeded)} URLs semeadas")
+
+	inflight: Dict[Future, Tuple[str, str]] = {}  # type: ignore[type-arg]
+	pages_inflight = 0
+	try:
+		with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawl') as pool:
+			while q or inflight:
+				# frontier FIFO (BFS); no máximo 2x concurrency fetches pendentes
+				while q and len(inflight) < concurrency * 2 and collected + pages_inflight < max_pages:
+					url = q.popleft()
+					if any(sp in url for sp in skip_patterns):
+						logger.debug(f"Skip pattern {url}")
+						continue
+					if robots is not None and not robots.allowed(url):
+						logger.debug(f"Bloqueado por robots.txt: {url}")
 						continue
-				except Exception:
-					pass
-				try:
-					r_pdf = requests.get(url, timeout=20, headers={'User-Agent':'every-bot-indexer/1.0'})
-					if r_pdf.status_code==200:
-						with open(local_path,'wb') as f: f.write(r_pdf.content)
-						logger.debug(f"PDF baixado: {local_path}")
+					if url.lower().endswith('.pdf'):
+						inflight[pool.submit(fetch_pdf, session, limiter, url, input_dir, cache)] = (url, 'pdf')
 					else:
-						logger.debug(f"Falha download PDF status {r_pdf.status_code}: {url}")
-				except Exception as e:
-					logger.debug(f"Erro download PDF {url}: {e}")
-				continue
-			logger.debug(f"Fetch: {url}")
-			r=requests.get(url,timeout=10, headers={'User-Agent':'every-bot-indexer/1.0'})
-			if r.status_code!=200: continue
-			soup=BeautifulSoup(r.text,'html.parser')
-			raw_title = soup.title.string if soup.title and soup.title.string else url
-			title = raw_title.strip()
-			# collect text but cap to avoid giant pages
-			from typing import List as _List
-			parts: _List[str] = []
-			acc = 0
-			for h in soup.find_all(['h1','h2','h3','p','li']):
-				seg = h.get_text(' ',strip=True)
-				parts.append(seg)
-				acc += len(seg)
-				if acc > max_chars:
-					logger.debug(f"Truncate page text at {acc} chars {url}")
+						inflight[pool.submit(fetch_page, session, limiter, url, parser, max_chars, cache)] = (url, 'page')
+						pages_inflight += 1
+				if not inflight:
 					break
-			main = ' '.join(parts)
-			out.append({'title':title,'url':url,'text':clean(main)})
-			for a in soup.find_all('a',href=True):
-				href = urljoin(url,a['href'])
-				if settings.CRAWL_SAME_DOMAIN_ONLY and urlparse(href).netloc!=domain: continue
-				if '#' in href: continue
-				if href not in seen:
-					seen.add(href); q.append(href)
-		except Exception as e:
-			logger.warning(f"Falha {url}: {e}")
-	logger.info(f"Crawl coletou {len(out)} páginas")
-	return out
+				done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+				for fut in done:
+					url, kind = inflight.pop(fut)
+					if kind == 'page':
+						pages_inflight -= 1
+					try:
+						res = fut.result()
+					except Exception as e:
+						logger.warning(f"Falha {url}: {e}")
+						continue
+					if kind != 'page':
+						continue
+					doc, links = res
+					if doc is None or collected >= max_pages:
+						continue
+					collected += 1
+					for href in links:
+						enqueue(href)
+					yield doc
+	finally:
+		# também roda se o consumidor parar de iterar antes do fim
+		session.close()
+		if cache is not None:
+			logger.info(f"Crawl cache: {cache.stats()}")
+			cache.close()
+	logger.info(f"Crawl coletou {collected} páginas")
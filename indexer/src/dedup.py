@@ -0,0 +1,100 @@
+"""Descarte de chunks duplicados antes do embedding.
+
+Exato: o `sha1` do texto do chunk (o mesmo gravado em `meta_record`).
+Quase-duplicado: MinHash sobre shingles de `DEDUP_SHINGLE` palavras
+(tokenizador do BM25) com LSH em bandas; todos os chunks mantidos que caem no
+mesmo balde de alguma banda são candidatos, confirmados pela fração de hashes
+iguais (≈ Jaccard dos shingles) ≥ `DEDUP_THRESHOLD`. Pega paginação, versões
+de impressão e rodapés repetidos que o crawler traz de várias páginas.
+
+`match` devolve o dono do chunk repetido (o build usa (url, chunk_id)) e grava
+em `dedup_of` de quais chunks de outros docs cada doc depende, para
+re-indexá-lo quando um deles mudar ou sumir (ver build_index).
+
+Memória: `DEDUP_PERMS` hashes de 16 bits por chunk mantido + uma entrada de
+balde por banda e chunk.
+"""
+import os, zlib, numpy as np  # type: ignore[import-not-found]
+from typing import Any, Dict, List, Set
+from .lexical import tokenize
+
+class Deduper:
+	def __init__(self, threshold: float = 0.85, perms: int = 64, bands: int = 8, rows: int = 4, shingle: int = 3, seed: int = 1):
+		if bands * rows > perms:
+			raise ValueError(f'DEDUP_BANDS×DEDUP_ROWS ({bands}×{rows}) maior que DEDUP_PERMS ({perms})')
+		self.threshold = threshold
+		self.bands, self.rows, self.shingle = bands, rows, shingle
+		rng = np.random.default_rng(seed)
+		# hashing multiply-shift: (a·h + b) mod 2^64, a ímpar; só os 16 bits altos do mínimo ficam guardados
+		self._a = rng.integers(1, 2**63, perms, dtype='uint64') | np.uint64(1)
+		self._b = rng.integers(0, 2**63, perms, dtype='uint64')
+		self._exact: Dict[bytes, Any] = {}  # sha1 -> dono
+		self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+		self._sigs = np.empty((1024, perms), dtype='uint16')
+		self._owners: List[Any] = []  # dono de cada linha de _sigs
+		self.kept = 0
+		self.exact = 0
+		self.near = 0
+		self.saved_tokens = 0
+
+	@classmethod
+	def from_env(cls) -> 'Deduper | None':
+		if os.getenv('DEDUP', '1').lower() in ('0', 'false', 'no'):
+			return None
+		return cls(float(os.getenv('DEDUP_THRESHOLD', '0.85')), int(os.getenv('DEDUP_PERMS', '64')),
+			int(os.getenv('DEDUP_BANDS', '8')), int(os.getenv('DEDUP_ROWS', '4')), int(os.getenv('DEDUP_SHINGLE', '3')))
+
+	def signature(self, text: str) -> np.ndarray | None:
+		"""MinHash (uint16 × perms) dos shingles de palavras; None para texto sem palavras."""
+		tokens = tokenize(text)
+		if not tokens:
+			return None
+		h = np.array([zlib.crc32(t.encode('utf-8')) for t in tokens], dtype='uint64')
+		k = min(self.shingle, len(h))
+		sh = h[:len(h) - k + 1].copy()
+		with np.errstate(over='ignore'):
+			for i in range(1, k):  # hash do shingle: combinação polinomial dos hashes das palavras
+				sh = sh * np.uint64(0x100000001B3) + h[i:len(h) - k + 1 + i]
+			mins = (self._a[:, None] * sh[None, :] + self._b[:, None]).min(axis=1)
+		return (mins >> np.uint64(48)).astype('uint16')
+
+	def match(self, text: str, digest: str, tokens: int = 0, owner: Any = '') -> Any:
+		"""Dono do chunk já mantido que `text` (sha1 `digest`) repete, exato ou quase; None = chunk novo, registrado com `owner`."""
+		key = bytes.fromhex(digest)
+		found = self._exact.get(key)
+		if found is not None:
+			self.exact += 1
+			self.saved_tokens += tokens
+			return found
+		sig = self.signature(text)
+		keys: List[bytes] = []
+		if sig is not None:
+			seen: Set[int] = set()
+			for band, buckets in enumerate(self._buckets):
+				bkey = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+				keys.append(bkey)
+				for other in buckets.get(bkey, ()):
+					if other in seen:
+						continue
+					seen.add(other)
+					if np.count_nonzero(self._sigs[other] == sig) >= self.threshold * len(sig):
+						self.near += 1
+						self.saved_tokens += tokens
+						return self._owners[other]
+		self._exact[key] = owner
+		if sig is not None:
+			if self.kept == len(self._sigs):
+				self._sigs = np.concatenate([self._sigs, np.empty_like(self._sigs)])
+			self._sigs[self.kept] = sig
+			self._owners.append(owner)
+			for buckets, bkey in zip(self._buckets, keys):
+				buckets.setdefault(bkey, []).append(self.kept)
+			self.kept += 1
+		return None
+
+	def is_duplicate(self, text: str, digest: str, tokens: int = 0) -> bool:
+		"""True se `text` repete um chunk já mantido; senão registra o chunk."""
+		return self.match(text, digest, tokens) is not None
+
+	def stats(self) -> Dict[str, int]:
+		return {'exact': self.exact, 'near': self.near, 'saved_tokens': self.saved_tokens}
@@ -0,0 +1,115 @@
+import os, time, sqlite3, threading
+import numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Tuple
+from .utils import sha1
+
+class EmbedCache:
+	"""Cache persistente de embeddings endereçado por (modelo, sha1 do texto).
+
+	SQLite com o vetor em float32 como BLOB. Quando o total de bytes passa de
+	`max_bytes`, remove os menos usados recentemente até ~90% do limite.
+	"""
+	def __init__(self, path: str, max_bytes: int):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+		self._lock = threading.Lock()
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute('PRAGMA journal_mode=WAL')
+		self._db.execute('''CREATE TABLE IF NOT EXISTS emb (
+			model TEXT NOT NULL,
+			sha1 TEXT NOT NULL,
+			vec BLOB NOT NULL,
+			last_used REAL NOT NULL,
+			PRIMARY KEY (model, sha1)
+		)''')
+		self._db.execute('CREATE INDEX IF NOT EXISTS emb_last_used ON emb(last_used)')
+		self._db.commit()
+		row = self._db.execute('SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM emb').fetchone()
+		self.total_bytes = int(row[0])
+
+	@classmethod
+	def from_env(cls, out_dir: str) -> 'EmbedCache | None':
+		if os.getenv('EMBED_CACHE', '1').lower() in ('0', 'false', 'no'):
+			return None
+		path = os.getenv('EMBED_CACHE_PATH') or os.path.join(out_dir, 'embed_cache.sqlite')
+		max_mb = float(os.getenv('EMBED_CACHE_MAX_MB', '2048'))
+		return cls(path, int(max_mb * 1_000_000))
+
+	def get_many(self, model: str, keys: List[str]) -> Dict[str, List[float]]:
+		if not keys:
+			return {}
+		found: Dict[str, List[float]] = {}
+		with self._lock:
+			uniq = list(dict.fromkeys(keys))
+			for i in range(0, len(uniq), 500):
+				part = uniq[i:i+500]
+				marks = ','.join('?' * len(part))
+				for k, blob in self._db.execute(f'SELECT sha1, vec FROM emb WHERE model=? AND sha1 IN ({marks})', [model, *part]):
+					found[k] = np.frombuffer(blob, dtype='<f4').tolist()
+			if found:
+				now = time.time()
+				self._db.executemany('UPDATE emb SET last_used=? WHERE model=? AND sha1=?', [(now, model, k) for k in found])
+				self._db.commit()
+		return found
+
+	def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+		if not items:
+			return
+		now = time.time()
+		rows = [(model, k, np.asarray(v, dtype='<f4').tobytes(), now) for k, v in items]
+		with self._lock:
+			for r in rows:
+				cur = self._db.execute('INSERT OR IGNORE INTO emb(model, sha1, vec, last_used) VALUES (?,?,?,?)', r)
+				if cur.rowcount:
+					self.total_bytes += len(r[2])
+			self._db.commit()
+			if self.total_bytes > self.max_bytes:
+				self._evict()
+
+	def _evict(self):
+		target = int(self.max_bytes * 0.9)
+		while self.total_bytes > target:
+			batch = self._db.execute('SELECT model, sha1, LENGTH(vec) FROM emb ORDER BY last_used LIMIT 1000').fetchall()
+			if not batch:
+				self.total_bytes = 0
+				break
+			self._db.executemany('DELETE FROM emb WHERE model=? AND sha1=?', [(m, k) for m, k, _ in batch])
+			self.total_bytes -= sum(n for _, _, n in batch)
+			self.evicted += len(batch)
+		self._db.commit()
+
+	def wrap(self, embed_fn, model: str):  # type: ignore[no-untyped-def]
+		"""Embedder que consulta o cache e só envia os misses para `embed_fn`."""
+		def cached(texts: List[str]) -> List[List[float]]:
+			keys = [sha1(t) for t in texts]
+			found = self.get_many(model, keys)
+			# um request por texto distinto ausente (duplicatas no lote saem de graça)
+			miss_idx: List[int] = []
+			pending = set()
+			for i, k in enumerate(keys):
+				if k not in found and k not in pending:
+					pending.add(k)
+					miss_idx.append(i)
+			with self._lock:
+				self.hits += len(texts) - len(miss_idx)
+				self.misses += len(miss_idx)
+			if miss_idx:
+				new = embed_fn([texts[i] for i in miss_idx])
+				self.put_many(model, [(keys[i], v) for i, v in zip(miss_idx, new)])
+				for i, v in zip(miss_idx, new):
+					found[keys[i]] = v
+			return [found[k] for k in keys]
+		return cached
+
+	def stats(self) -> str:
+		total = self.hits + self.misses
+		rate = (100.0 * self.hits / total) if total else 0.0
+		return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit), {self.evicted} removidos, {self.total_bytes/1_000_000:.1f}MB"
+
+	def close(self):
+		with self._lock:
+			self._db.close()
@@ -0,0 +1,202 @@
+import os, re, time, zlib, random, threading
+import numpy as np  # type: ignore[import-not-found]
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Callable, Iterator, Tuple, Deque
+import openai  # type: ignore[import-not-found]
+from openai import OpenAI  # type: ignore[import-not-found]
+from .config import settings
+from .utils import logger
+from . import metrics
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+Sink = Callable[[List[Dict[str, Any]], np.ndarray], None]
+
+OFFLINE_DIM = 1536
+RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+_client: OpenAI | None = None
+_client_lock = threading.Lock()
+
+def _get_client() -> OpenAI:
+	global _client
+	with _client_lock:
+		if _client is None:
+			# retries ficam a cargo de Backoff.call (cooldown compartilhado)
+			_client = OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+	return _client
+
+_WORD = re.compile(r'\w+')
+
+def hash_embed(texts: List[str], dim: int = OFFLINE_DIM) -> np.ndarray:
+	"""Embedding determinístico por feature hashing (palavras + bigramas, sinal pelo hash), normalizado.
+
+	Textos com palavras em comum ficam próximos, então a busca sobre ele tem
+	resultados com sentido (benchmarks, testes); texto sem palavras vira um
+	vetor pseudo-aleatório fixo em vez de zero.
+	"""
+	out = np.zeros((len(texts), dim), dtype='float32')
+	for i, text in enumerate(texts):
+		words = _WORD.findall(text.casefold())
+		feats = words + [a + ' ' + b for a, b in zip(words, words[1:])] or [text]
+		h = np.array([zlib.crc32(f.encode('utf-8')) for f in feats], dtype='int64')
+		np.add.at(out[i], h % dim, np.where((h // dim) & 1, 1.0, -1.0).astype('float32'))
+		norm = np.linalg.norm(out[i])
+		if norm:
+			out[i] /= norm
+	return out
+
+def offline_embed(texts: List[str]) -> List[List[float]]:
+	# Offline/testing mode (sem chamadas externas): hash_embed com OFFLINE_EMBED_DIM dimensões;
+	# OFFLINE_EMBED_LATENCY_MS simula a latência de rede por request
+	latency_ms = float(os.getenv('OFFLINE_EMBED_LATENCY_MS', '0') or 0)
+	if latency_ms:
+		time.sleep(latency_ms / 1000)
+	return hash_embed(texts, int(os.getenv('OFFLINE_EMBED_DIM', str(OFFLINE_DIM)))).tolist()
+
+def openai_embed(texts: List[str]) -> List[List[float]]:
+	resp = _get_client().embeddings.create(model=settings.EMBEDDING_MODEL, input=texts)
+	return [d.embedding for d in resp.data]
+
+def default_embed_fn() -> EmbedFn:
+	return offline_embed if os.getenv('OFFLINE_EMBED') else openai_embed
+
+def embed_model_name() -> str:
+	# chave do cache: vetores offline nunca se misturam com os do modelo real
+	return f"offline-hash-{os.getenv('OFFLINE_EMBED_DIM', str(OFFLINE_DIM))}" if os.getenv('OFFLINE_EMBED') else settings.EMBEDDING_MODEL
+
+def estimate_tokens(text: str) -> int:
+	# ~4 chars/token para texto latino; evita depender de tokenizer no indexer
+	return len(text) // 4 + 1
+
+def iter_batches(texts: List[str], max_items: int, max_tokens: int) -> Iterator[Tuple[int, int]]:
+	"""Fatia `texts` em intervalos [i, j) respeitando itens e tokens por request."""
+	start = 0
+	tokens = 0
+	for i, t in enumerate(texts):
+		n = estimate_tokens(t)
+		if i > start and (i - start >= max_items or tokens + n > max_tokens):
+			yield start, i
+			start, tokens = i, 0
+		tokens += n
+	if start < len(texts):
+		yield start, len(texts)
+
+def _retry_after(e: Exception) -> float | None:
+	resp = getattr(e, 'response', None)
+	headers = getattr(resp, 'headers', None)
+	if not headers:
+		return None
+	try:
+		if headers.get('retry-after-ms'):
+			return float(headers['retry-after-ms']) / 1000
+		if headers.get('retry-after'):
+			return float(headers['retry-after'])
+	except (TypeError, ValueError):
+		return None
+	return None
+
+class Backoff:
+	"""Backoff exponencial com jitter e cooldown global.
+
+	Um 429 em qualquer worker pausa todos até o fim do Retry-After (ou do
+	backoff calculado), em vez de cada thread martelar a API sozinha.
+	"""
+	def __init__(self, max_retries: int = 6, base: float = 1.0, cap: float = 60.0):
+		self.max_retries = max_retries
+		self.base = base
+		self.cap = cap
+		self._lock = threading.Lock()
+		self._cooldown_until = 0.0
+
+	def _wait_cooldown(self):
+		with self._lock:
+			delay = self._cooldown_until - time.monotonic()
+		if delay > 0:
+			time.sleep(delay)
+
+	def call(self, fn: EmbedFn, texts: List[str]) -> List[List[float]]:
+		attempt = 0
+		while True:
+			self._wait_cooldown()
+			try:
+				return fn(texts)
+			except RETRYABLE as e:
+				attempt += 1
+				if attempt > self.max_retries:
+					raise
+				metrics.event('embed_retry')
+				delay = _retry_after(e)
+				if delay is None:
+					delay = min(self.cap, self.base * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+				logger.warning(f"Embedding falhou ({type(e).__name__}), tentativa {attempt}/{self.max_retries}; aguardando {delay:.1f}s")
+				if isinstance(e, openai.RateLimitError):
+					with self._lock:
+						self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+				else:
+					time.sleep(delay)
+
+class EmbedPipeline:
+	"""Embeddings concorrentes com no máximo `max_inflight` lotes pendentes.
+
+	`submit` fatia os textos em lotes (itens + orçamento de tokens) e os
+	enfileira no pool; os resultados são entregues a `sink` sempre na ordem de
+	submissão (ordem de chunk_id), assim que o lote mais antigo termina.
+	"""
+	def __init__(self, sink: Sink, embed_fn: EmbedFn | None = None, concurrency: int = 4,
+			batch_size: int = 32, max_tokens: int = 100_000, max_inflight: int | None = None,
+			backoff: Backoff | None = None):
+		self.sink = sink
+		self.embed_fn = embed_fn or default_embed_fn()
+		self.batch_size = max(1, batch_size)
+		self.max_tokens = max(1, max_tokens)
+		self.max_inflight = max_inflight or max(1, concurrency) * 2
+		self.backoff = backoff or Backoff()
+		self.pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='embed')
+		self.pending: Deque[Tuple[List[Dict[str, Any]], Future]] = deque()  # type: ignore[type-arg]
+		self.batches = 0
+
+	@classmethod
+	def from_env(cls, sink: Sink, embed_fn: EmbedFn | None = None) -> 'EmbedPipeline':
+		return cls(
+			sink,
+			embed_fn=embed_fn,
+			concurrency=int(os.getenv('EMBED_CONCURRENCY', '4')),
+			batch_size=int(os.getenv('EMBED_BATCH', '32')),
+			max_tokens=int(os.getenv('EMBED_MAX_TOKENS', '100000')),
+			backoff=Backoff(max_retries=int(os.getenv('EMBED_MAX_RETRIES', '6'))),
+		)
+
+	def submit(self, texts: List[str], metas: List[Dict[str, Any]]):
+		for i, j in iter_batches(texts, self.batch_size, self.max_tokens):
+			fut = self.pool.submit(self._embed, texts[i:j])
+			self.pending.append((metas[i:j], fut))
+			self.batches += 1
+			self._drain(block=len(self.pending) > self.max_inflight)
+
+	def _embed(self, texts: List[str]) -> List[List[float]]:
+		with metrics.stage('embed', len(texts)):
+			return self.backoff.call(self.embed_fn, texts)
+
+	def _drain(self, block: bool):
+		while self.pending and (block or self.pending[0][1].done()):
+			metas, fut = self.pending.popleft()
+			if not fut.done():
+				# backpressure: o chunking fica parado esperando a API
+				with metrics.stage('embed_wait'):
+					fut.exception()
+			vecs = np.array(fut.result(), dtype='float32')
+			self.sink(metas, vecs)
+			block = len(self.pending) > self.max_inflight
+
+	def flush(self):
+		"""Espera todos os lotes pendentes e entrega em ordem."""
+		while self.pending:
+			self._drain(block=True)
+
+	def close(self, cancel: bool = False):
+		if cancel:
+			for _, fut in self.pending:
+				fut.cancel()
+			self.pending.clear()
+		self.pool.shutdown(wait=True)
@@ -1,24 +1,36 @@
 import os, hashlib
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from .config import settings
 from .utils import slugify, logger
 
+def export_doc(base: str, d: Dict[str, Any]) -> bool:
+    text = d.get('text','').strip()
+    if not text:
+        return False
+    title_part = slugify(d.get('title') or '')
+    h = hashlib.sha1(text.encode('utf-8','ignore')).hexdigest()[:10]
+    fname = f"{title_part}-{h}.txt"
+    path = os.path.join(base, fname)
+    if os.path.exists(path):
+        return False
+    with open(path,'w',encoding='utf-8') as f:
+        f.write(text)
+    return True
+
 def export_docs(docs: List[Dict[str, Any]]) -> int:
+    base = settings.INPUT_DIR
+    os.makedirs(base, exist_ok=True)
+    count = sum(1 for d in docs if export_doc(base, d))
+    logger.info(f"Exportou {count} arquivos de crawl para {base}")
+    return count
+
+def iter_export(docs: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Exporta cada doc ao passar e o repassa adiante (uso em pipeline streaming)."""
     base = settings.INPUT_DIR
     os.makedirs(base, exist_ok=True)
     count = 0
     for d in docs:
-        text = d.get('text','').strip()
-        if not text:
-            continue
-        title_part = slugify(d.get('title') or '')
-        h = hashlib.sha1(text.encode('utf-8','ignore')).hexdigest()[:10]
-        fname = f"{title_part}-{h}.txt"
-        path = os.path.join(base, fname)
-        if os.path.exists(path):
-            continue
-        with open(path,'w',encoding='utf-8') as f:
-            f.write(text)
-        count += 1
+        if export_doc(base, d):
+            count += 1
+        yield d
     logger.info(f"Exportou {count} arquivos de crawl para {base}")
-    return count
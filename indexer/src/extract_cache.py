@@ -0,0 +1,49 @@
+import os, sqlite3, threading
+from typing import Tuple
+
+class ExtractCache:
+	"""Texto extraído por arquivo, válido enquanto (path, mtime, size) não mudar."""
+	def __init__(self, path: str):
+		self.path = path
+		self._lock = threading.Lock()
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._db.execute('PRAGMA journal_mode=WAL')
+		self._db.execute('''CREATE TABLE IF NOT EXISTS files (
+			path TEXT PRIMARY KEY,
+			mtime REAL NOT NULL,
+			size INTEGER NOT NULL,
+			text TEXT NOT NULL
+		)''')
+		self._db.commit()
+		self.hits = 0
+		self.misses = 0
+
+	@classmethod
+	def from_env(cls, out_dir: str) -> 'ExtractCache | None':
+		if os.getenv('EXTRACT_CACHE', '1').lower() in ('0', 'false', 'no'):
+			return None
+		return cls(os.getenv('EXTRACT_CACHE_PATH') or os.path.join(out_dir, 'extract_cache.sqlite'))
+
+	@staticmethod
+	def key(path: str) -> Tuple[str, float, int]:
+		st = os.stat(path)
+		return os.path.abspath(path), st.st_mtime, st.st_size
+
+	def get(self, path: str, mtime: float, size: int) -> str | None:
+		with self._lock:
+			row = self._db.execute('SELECT text FROM files WHERE path=? AND mtime=? AND size=?', (path, mtime, size)).fetchone()
+			if row is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			return row[0]
+
+	def put(self, path: str, mtime: float, size: int, text: str):
+		with self._lock:
+			self._db.execute('INSERT OR REPLACE INTO files(path, mtime, size, text) VALUES (?,?,?,?)', (path, mtime, size, text))
+			self._db.commit()
+
+	def close(self):
+		with self._lock:
+			self._db.close()
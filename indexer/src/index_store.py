@@ -0,0 +1,538 @@
+import os, json, time, shutil, numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Any, Iterator, Tuple
+from .utils import logger
+from . import ann, quant
+from .lexical import BM25Builder, BM25_FILES
+
+MANIFEST_FILE = 'manifest.json'
+# exports versionados: snapshots/<versão>/ + CURRENT com o nome da versão servida
+SNAPSHOTS_DIR = 'snapshots'
+CURRENT_FILE = 'CURRENT'
+# campos filtráveis na bridge (facets.npy: um código int32 por linha e campo)
+FACETS = ('tenant', 'source', 'url')
+# arquivos append-only; após uma compactação a geração N usa "<nome>.N"
+FILES = {
+	'vec': 'vectors.f32',    # float32 cru, uma linha por chunk
+	'ids': 'ids.i64',        # chunk_id (int64) de cada linha
+	'meta': 'meta.jsonl',    # um registro de metadados por linha
+	'docs': 'docs.jsonl',    # log de estado por documento (fingerprint + chunk_ids)
+	'deleted': 'deleted.i64',  # tombstones (chunk_ids removidos)
+}
+
+def _fsync_write(path: str, data: bytes):
+	tmp = path + '.tmp'
+	with open(tmp, 'wb') as f:
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp, path)
+
+def _fsync_path(path: str):
+	fd = os.open(path, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+def current_dir(out_dir: str) -> str:
+	"""Diretório do export servido: `snapshots/<CURRENT>`, ou o próprio OUT_DIR (layout sem snapshots)."""
+	try:
+		with open(os.path.join(out_dir, CURRENT_FILE), 'r') as f:
+			version = f.read().strip()
+	except FileNotFoundError:
+		return out_dir
+	return os.path.join(out_dir, SNAPSHOTS_DIR, version)
+
+def new_version() -> str:
+	# ordem lexicográfica = ordem cronológica (usada na poda)
+	ns = time.time_ns()
+	return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(ns // 10**9))}.{ns % 10**9:09d}"
+
+def prune_snapshots(out_dir: str, keep: int):
+	"""Remove snapshots antigos, mantendo os `keep` mais recentes e sempre o corrente.
+
+	Processos que ainda mapeiam um snapshot removido continuam lendo (unlink não
+	invalida o mmap); só novas cargas passam a usar o corrente.
+	"""
+	base = os.path.join(out_dir, SNAPSHOTS_DIR)
+	if keep <= 0 or not os.path.isdir(base):
+		return
+	current = os.path.basename(current_dir(out_dir))
+	for name in sorted(os.listdir(base), reverse=True)[keep:]:
+		if name != current:
+			shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+def remove_stale(dest: str, names: List[str], replaces: List[Tuple[str, str]]):
+	"""Remove de `dest` os `names` que este export não regravou.
+
+	Sem snapshots o export reusa OUT_DIR: um arquivo opcional de um export
+	anterior (p.ex. EXPORT_QUANT desligado depois) ficaria ao lado de vetores
+	com outro número de linhas.
+	"""
+	written = {final for _, final in replaces}
+	for name in names:
+		path = os.path.join(dest, name)
+		if path not in written and os.path.exists(path):
+			os.remove(path)
+
+def facet_codes(columns: Dict[str, List[str]]) -> Tuple[Dict[str, List[str]], np.ndarray]:
+	"""Valores distintos (ordenados) de cada campo e a matriz linhas x campos de códigos.
+
+	O código é a posição do valor na lista ordenada, então um prefixo de URL vira
+	um intervalo contíguo de códigos na bridge.
+	"""
+	n = len(columns[FACETS[0]])
+	values: Dict[str, List[str]] = {}
+	codes = np.empty((n, len(FACETS)), dtype='int32')
+	for j, field in enumerate(FACETS):
+		uniq, inv = np.unique(np.array(columns[field], dtype=object), return_inverse=True) if n else (np.empty(0, dtype=object), np.empty(0, dtype='int64'))
+		values[field] = [str(v) for v in uniq]
+		codes[:, j] = inv
+	return values, codes
+
+def write_strings(path: str, values: List[str], suffix: str = '.tmp') -> List[Tuple[str, str]]:
+	"""`<path>.bin` (strings UTF-8 concatenadas) + `<path>.offsets.npy` (N+1 offsets).
+
+	Mesmo layout de chunks.jsonl: a bridge lê via mmap, sem montar uma lista de
+	str por worker. Devolve os pares (tmp, final) dos os.replace do export.
+	"""
+	data = [v.encode('utf-8') for v in values]
+	offsets = np.zeros(len(data) + 1, dtype='int64')
+	np.cumsum([len(b) for b in data], out=offsets[1:])
+	with open(path + '.bin' + suffix, 'wb') as f:
+		f.write(b''.join(data))
+	with open(path + '.offsets.npy' + suffix, 'wb') as f:
+		np.save(f, offsets)
+	return [(path + '.bin' + suffix, path + '.bin'), (path + '.offsets.npy' + suffix, path + '.offsets.npy')]
+
+class IndexWriter:
+	"""Índice append-only em OUT_DIR.
+
+	Cada flush só anexa as linhas novas (vetores, ids, metadados) e depois
+	regrava o pequeno `manifest.json`, que é o ponto de commit: ao reabrir,
+	bytes além do que o manifest registra (flush interrompido no meio) são
+	descartados. Documentos concluídos entram em `docs.jsonl` no mesmo commit
+	do seu último chunk; remoções viram tombstones. `finalize()` exporta uma
+	vez os arquivos lidos pela bridge (vectors.npy, chunks.jsonl, index.faiss...)
+	só com as linhas vivas.
+	"""
+	def __init__(self, out_dir: str, mode: str, resume: bool = False):
+		self.out_dir = out_dir
+		self.manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+		self.files: Dict[str, str] = dict(FILES)
+		self.sizes: Dict[str, int] = {k: 0 for k in FILES}
+		self.gen = 0
+		self.dim: int | None = None
+		self.count = 0
+		self.next_id = 0
+		self.tracked_from = 0  # ids menores vieram de meta.json legado (sem docs.jsonl)
+		self.deleted_count = 0
+		self.docs: Dict[str, Dict[str, Any]] = {}
+		self._pending_docs: List[Tuple[int, Dict[str, Any], List[int]]] = []
+		self._last_written_id = -1
+		# build corrente: id, modo, primeiro chunk_id e se terminou (vai no manifest a cada commit)
+		self.run: Dict[str, Any] = {}
+		self.resumed: Dict[str, Dict[str, Any]] = {}  # docs já commitados pelo build retomado
+		self.partial: Dict[str, List[Tuple[int, str]]] = {}  # url -> (chunk_id, sha1) commitados de doc incompleto
+		if resume and os.path.exists(self.manifest_path):
+			self._recover(resume=True)
+		elif mode == 'rebuild':
+			self._reset()
+		elif os.path.exists(self.manifest_path):
+			self._recover()
+		elif os.path.exists(os.path.join(out_dir, 'meta.json')) and os.path.exists(os.path.join(out_dir, 'vectors.npy')):
+			self._reset()
+			self._import_legacy()
+		else:
+			self._reset()
+		if not self.run:
+			self.run = {'id': new_version(), 'mode': mode, 'first_id': self.next_id, 'done': False}
+			self.commit()
+		self.mode: str = self.run['mode']
+
+	def path(self, key: str) -> str:
+		return os.path.join(self.out_dir, self.files[key])
+
+	def _reset(self):
+		bases = tuple(FILES.values()) + (MANIFEST_FILE,)
+		for name in os.listdir(self.out_dir):
+			if name.startswith(bases):
+				os.remove(os.path.join(self.out_dir, name))
+		for key in FILES:
+			open(self.path(key), 'wb').close()
+
+	def _recover(self, resume: bool = False):
+		with open(self.manifest_path, 'r') as f:
+			m = json.load(f)
+		if resume:
+			# manifest anterior ao registro de build: trata todo o índice como o build a retomar
+			self.run = m.get('run') or {'id': None, 'mode': 'append', 'first_id': int(m.get('tracked_from', 0)), 'done': False}
+		self.dim = m.get('dim')
+		self.count = int(m.get('count', 0))
+		self.gen = int(m.get('gen', 0))
+		self.files.update(m.get('files', {}))
+		self.sizes.update({k: int(v) for k, v in m.get('sizes', {}).items()})
+		self.next_id = int(m.get('next_id', self.count))
+		self.tracked_from = int(m.get('tracked_from', 0))
+		if 'sizes' not in m:
+			# manifest da primeira versão (só vectors.f32 + meta.jsonl, chunk_id = linha)
+			self.sizes.update({'vec': int(m.get('vec_bytes', 0)), 'meta': int(m.get('meta_bytes', 0))})
+			ids = np.arange(self.count, dtype='<i8').tobytes()
+			with open(self.path('ids'), 'wb') as f: f.write(ids)
+			self.sizes['ids'] = len(ids)
+			self.tracked_from = self.count
+		for key in FILES:
+			path, size = self.path(key), self.sizes[key]
+			if not os.path.exists(path):
+				if size:
+					raise RuntimeError(f"Arquivo ausente para manifest existente: {path}")
+				open(path, 'wb').close()
+				continue
+			actual = os.path.getsize(path)
+			if actual < size:
+				raise RuntimeError(f"{path} menor que o commit do manifest ({actual} < {size})")
+			if actual > size:
+				logger.warning(f"Descartando {actual - size} bytes não commitados de {path}")
+				with open(path, 'r+b') as f:
+					f.truncate(size)
+		self.deleted_count = self.sizes['deleted'] // 8
+		self._last_written_id = self.next_id - 1
+		with open(self.path('docs'), 'r', encoding='utf-8') as f:
+			for line in f:
+				self._apply_doc(json.loads(line))
+		logger.info(f"Índice existente com {self.count} chunks ({self.deleted_count} removidos, {len(self.docs)} docs)")
+		if resume:
+			self.resumed = {k: e for k, e in self.docs.items() if self.run['id'] is None or e.get('run') == self.run['id']}
+		self._sweep_orphans(self.run['first_id'] if resume else None)
+
+	def _apply_doc(self, entry: Dict[str, Any]):
+		if entry.get('deleted'):
+			self.docs.pop(entry['doc'], None)
+		else:
+			self.docs[entry['doc']] = entry
+
+	def _sweep_orphans(self, keep_from: int | None = None):
+		"""Chunks commitados de um doc que não chegou a ser concluído (crash no meio).
+
+		Viram tombstones, exceto com `keep_from` (resume): os do build retomado
+		(chunk_id >= keep_from) ficam em `self.partial` para o build reaproveitar
+		sem re-embedding os que ainda baterem com o novo chunking.
+		"""
+		if self.count == 0 or self.next_id <= self.tracked_from:
+			return
+		ids = self.ids()
+		tracked = ids[ids >= self.tracked_from]
+		known = [c for e in self.docs.values() for c in e.get('chunks', [])]
+		dead = np.concatenate([np.asarray(known, dtype='int64'), self.deleted_ids()])
+		orphans = tracked[~np.isin(tracked, dead)]
+		if keep_from is not None and orphans.size:
+			keep = set(orphans[orphans >= keep_from].tolist())
+			orphans = orphans[orphans < keep_from]
+			if keep:
+				for cid, line in zip(ids.tolist(), self.iter_meta_lines()):
+					if cid in keep:
+						m = json.loads(line)
+						self.partial.setdefault(m['url'], []).append((cid, m['sha1']))
+		if orphans.size:
+			logger.warning(f"Removendo {orphans.size} chunks órfãos de docs incompletos")
+			self._write_deleted(orphans.tolist())
+			self.commit()
+
+	def iter_run_meta(self) -> Iterator[Dict[str, Any]]:
+		"""Metadados dos chunks vivos já commitados pelo build corrente (sem os de `partial`)."""
+		if not self.count:
+			return
+		ids = self.ids()
+		skip = [c for part in self.partial.values() for c, _ in part]
+		mask = self.live_mask() & (ids >= self.run['first_id']) & ~np.isin(ids, np.asarray(skip, dtype='int64'))
+		for keep, line in zip(mask, self.iter_meta_lines()):
+			if keep:
+				yield json.loads(line)
+
+	def drop_partial(self):
+		"""Tombstones dos chunks de docs incompletos que o build retomado não reaproveitou."""
+		ids = [c for part in self.partial.values() for c, _ in part]
+		self.partial = {}
+		if ids:
+			self._write_deleted(ids)
+
+	def finish_run(self):
+		self.run['done'] = True
+		self.commit()
+
+	def _import_legacy(self):
+		logger.info('Migrando meta.json/vectors.npy para layout append-only')
+		with open(os.path.join(self.out_dir, 'meta.json'), 'r') as f:
+			meta = json.load(f)
+		vecs = np.load(os.path.join(self.out_dir, 'vectors.npy'), mmap_mode='r')
+		ids = list(range(len(meta)))
+		for i, m in zip(ids, meta):
+			m['chunk_id'] = str(i)
+		self._append_rows(meta, np.asarray(vecs, dtype='float32'))
+		self.tracked_from = self.next_id
+		self.commit()
+
+	def _append_bytes(self, key: str, data: bytes):
+		if not data:
+			return
+		with open(self.path(key), 'ab') as f:
+			f.write(data)
+			f.flush()
+			os.fsync(f.fileno())
+		self.sizes[key] += len(data)
+
+	def _append_rows(self, new_meta: List[Dict[str, Any]], new_vecs: np.ndarray):
+		if len(new_meta) != new_vecs.shape[0]:
+			raise ValueError(f"meta ({len(new_meta)}) e vetores ({new_vecs.shape[0]}) com tamanhos diferentes")
+		if self.dim is None:
+			self.dim = int(new_vecs.shape[1])
+		elif new_vecs.shape[1] != self.dim:
+			raise ValueError(f"Dimensão {new_vecs.shape[1]} difere do índice existente ({self.dim})")
+		ids = np.array([int(m['chunk_id']) for m in new_meta], dtype='<i8')
+		self._append_bytes('vec', np.ascontiguousarray(new_vecs, dtype='<f4').tobytes())
+		self._append_bytes('ids', ids.tobytes())
+		self._append_bytes('meta', ''.join(json.dumps(m, ensure_ascii=False) + '\n' for m in new_meta).encode('utf-8'))
+		self.count += len(new_meta)
+		if ids.size:
+			self._last_written_id = max(self._last_written_id, int(ids.max()))
+			self.next_id = max(self.next_id, self._last_written_id + 1)
+
+	def _write_deleted(self, chunk_ids: List[int]):
+		self._append_bytes('deleted', np.asarray(chunk_ids, dtype='<i8').tobytes())
+		self.deleted_count += len(chunk_ids)
+
+	def _flush_docs(self, force: bool = False):
+		ready = [p for p in self._pending_docs if force or p[0] <= self._last_written_id]
+		if not ready:
+			return
+		self._pending_docs = [p for p in self._pending_docs if not (force or p[0] <= self._last_written_id)]
+		drop = [c for _, _, d in ready for c in d]
+		if drop:
+			self._write_deleted(drop)
+		self._append_bytes('docs', ''.join(json.dumps(e, ensure_ascii=False) + '\n' for _, e, _ in ready).encode('utf-8'))
+		for _, e, _ in ready:
+			self._apply_doc(e)
+
+	def commit(self):
+		_fsync_write(self.manifest_path, json.dumps({
+			'dim': self.dim,
+			'count': self.count,
+			'next_id': self.next_id,
+			'tracked_from': self.tracked_from,
+			'gen': self.gen,
+			'files': self.files,
+			'sizes': self.sizes,
+			'run': self.run,
+		}).encode('utf-8'))
+
+	def append(self, new_meta: List[Dict[str, Any]], new_vecs: np.ndarray):
+		"""Anexa um lote e faz commit; custo proporcional ao lote, não ao índice."""
+		self._append_rows(new_meta, new_vecs)
+		self._flush_docs()
+		self.commit()
+
+	def doc_done(self, key: str, entry: Dict[str, Any], last_chunk_id: int = -1, drop: List[int] | None = None):
+		"""Registra o estado de um doc; entra no commit que persistir `last_chunk_id`.
+
+		`drop` (chunks da versão anterior) vira tombstone no mesmo commit, então
+		um crash nunca deixa o doc sem nenhuma das duas versões.
+		"""
+		self._pending_docs.append((last_chunk_id, {**entry, 'doc': key, 'run': self.run['id']}, list(drop or [])))
+
+	def doc_removed(self, key: str):
+		prev = self.docs.get(key)
+		self._pending_docs.append((-1, {'doc': key, 'deleted': True}, list(prev.get('chunks', [])) if prev else []))
+
+	def vectors(self) -> np.ndarray:
+		if not self.count or self.dim is None:
+			return np.empty((0, self.dim or 0), dtype='float32')
+		return np.memmap(self.path('vec'), dtype='<f4', mode='r', shape=(self.count, self.dim))
+
+	def ids(self) -> np.ndarray:
+		if not self.count:
+			return np.empty(0, dtype='int64')
+		return np.fromfile(self.path('ids'), dtype='<i8', count=self.count)
+
+	def deleted_ids(self) -> np.ndarray:
+		if not self.deleted_count:
+			return np.empty(0, dtype='int64')
+		return np.fromfile(self.path('deleted'), dtype='<i8', count=self.deleted_count)
+
+	def live_mask(self) -> np.ndarray:
+		return ~np.isin(self.ids(), self.deleted_ids())
+
+	def iter_meta_lines(self) -> Iterator[str]:
+		with open(self.path('meta'), 'r', encoding='utf-8') as f:
+			for _ in range(self.count):
+				yield f.readline().rstrip('\n')
+
+	def compact(self, block: int = 65536):
+		"""Regrava os arquivos sem as linhas removidas numa nova geração."""
+		mask = self.live_mask()
+		gen = self.gen + 1
+		files = {k: f"{v}.{gen}" for k, v in FILES.items()}
+		paths = {k: os.path.join(self.out_dir, v) for k, v in files.items()}
+		vecs = self.vectors()
+		ids = self.ids()
+		with open(paths['vec'], 'wb') as fv, open(paths['ids'], 'wb') as fi, open(paths['meta'], 'wb') as fm:
+			lines = self.iter_meta_lines()
+			for i in range(0, self.count, block):
+				m = mask[i:i+block]
+				fv.write(np.ascontiguousarray(vecs[i:i+block][m], dtype='<f4').tobytes())
+				fi.write(ids[i:i+block][m].tobytes())
+				for keep in m:
+					line = next(lines)
+					if keep:
+						fm.write((line + '\n').encode('utf-8'))
+			for f in (fv, fi, fm):
+				f.flush(); os.fsync(f.fileno())
+		with open(paths['docs'], 'wb') as fd:
+			fd.write(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in self.docs.values()).encode('utf-8'))
+			fd.flush(); os.fsync(fd.fileno())
+		open(paths['deleted'], 'wb').close()
+		old = [self.path(k) for k in FILES]
+		removed = int((~mask).sum())
+		self.files, self.gen = files, gen
+		self.sizes = {k: os.path.getsize(p) for k, p in paths.items()}
+		self.count -= removed
+		self.deleted_count = 0
+		self.commit()
+		for p in old:
+			os.remove(p)
+		logger.info(f"Compactação: {removed} chunks removidos, {self.count} restantes")
+
+	def finalize(self, block: int = 65536):
+		"""Exporta os arquivos da bridge numa única passada linear sobre as linhas vivas.
+
+		vectors.npy (+ vectors.f16.npy com EXPORT_F16=1) + norms.npy, ids.npy,
+		chunks.jsonl + chunks.offsets.npy, index.faiss + index.json (fábrica INDEX_FACTORY,
+		ver ann.py), as representações de EXPORT_QUANT (ver quant.py) e, por
+		compatibilidade, meta.json (EXPORT_META_JSON=0 desliga).
+
+		Com EXPORT_SNAPSHOTS=1 (padrão) o export vai para um diretório novo
+		`snapshots/<versão>/` e só fica visível quando `CURRENT` é regravado
+		(os.replace atômico) depois de tudo em disco; a bridge nunca vê um export
+		pela metade. Ficam os `SNAPSHOT_KEEP` (3) mais recentes.
+		"""
+		self._flush_docs(force=True)
+		self.commit()
+		ratio = float(os.getenv('COMPACT_RATIO', '0.2'))
+		if self.deleted_count and self.deleted_count > ratio * max(self.count, 1):
+			self.compact(block)
+		if not self.count or self.dim is None:
+			logger.warning('Sem chunks para exportar')
+			return
+		mask = self.live_mask()
+		live = int(mask.sum())
+		vecs = self.vectors()
+		ids = self.ids()
+		snapshots = os.getenv('EXPORT_SNAPSHOTS', '1').lower() not in ('0', 'false', 'no')
+		version = new_version() if snapshots else ''
+		dest = os.path.join(self.out_dir, SNAPSHOTS_DIR, version) if snapshots else self.out_dir
+		os.makedirs(dest, exist_ok=True)
+		npy_tmp = os.path.join(dest, 'vectors.npy.tmp')
+		ids_tmp = os.path.join(dest, 'ids.npy.tmp')
+		norms_tmp = os.path.join(dest, 'norms.npy.tmp')
+		out = np.lib.format.open_memmap(npy_tmp, mode='w+', dtype='float32', shape=(live, self.dim))
+		out_ids = np.lib.format.open_memmap(ids_tmp, mode='w+', dtype='int64', shape=(live,))
+		# normas prontas: os workers da bridge mapeiam o arquivo em vez de varrer os vetores na carga
+		out_norms = np.lib.format.open_memmap(norms_tmp, mode='w+', dtype='float32', shape=(live,))
+		pos = 0
+		for i in range(0, self.count, block):
+			m = mask[i:i+block]
+			part = np.ascontiguousarray(vecs[i:i+block][m], dtype='float32')
+			out[pos:pos+len(part)] = part
+			out_ids[pos:pos+len(part)] = ids[i:i+block][m]
+			out_norms[pos:pos+len(part)] = np.sqrt((part * part).sum(axis=1))
+			pos += len(part)
+		out.flush(); out_ids.flush(); out_norms.flush()
+		del out_norms
+		# ID-mapped: o índice devolve chunk_id estável, não a posição da linha
+		replaces = ann.write_index(dest, out, np.asarray(out_ids), os.getenv('INDEX_FACTORY', 'Flat'))
+		replaces += quant.write_quant(dest, out, quant.parse_kinds(os.getenv('EXPORT_QUANT', '')))
+		del out, out_ids
+		f16_tmp = os.path.join(dest, 'vectors.f16.npy.tmp')
+		export_f16 = os.getenv('EXPORT_F16', '0').lower() not in ('0', 'false', 'no')
+		if export_f16:
+			# cópia half-precision para a bridge com VECTORS_DTYPE=float16 (mmap direto)
+			src = np.load(npy_tmp, mmap_mode='r')
+			out16 = np.lib.format.open_memmap(f16_tmp, mode='w+', dtype='float16', shape=(live, self.dim))
+			for i in range(0, live, block):
+				out16[i:i+block] = src[i:i+block]
+			out16.flush()
+			del out16, src
+		# chunks.jsonl + offsets: a bridge decodifica só as linhas do top-k (mmap)
+		chunks_tmp = os.path.join(dest, 'chunks.jsonl.tmp')
+		offsets_tmp = os.path.join(dest, 'chunks.offsets.npy.tmp')
+		offsets = np.empty(live + 1, dtype='int64')
+		export_json = os.getenv('EXPORT_META_JSON', '1').lower() not in ('0', 'false', 'no')
+		meta_tmp = os.path.join(dest, 'meta.json.tmp')
+		fj = open(meta_tmp, 'w', encoding='utf-8') if export_json else None
+		columns: Dict[str, List[str]] = {f: [] for f in FACETS}
+		# BM25 na mesma passada sobre os chunks vivos (postings em disco, ver lexical.py)
+		export_bm25 = os.getenv('EXPORT_BM25', '1').lower() not in ('0', 'false', 'no')
+		bm25 = BM25Builder(dest, float(os.getenv('BM25_K1', '1.2')), float(os.getenv('BM25_B', '0.75'))) if export_bm25 else None
+		try:
+			with open(chunks_tmp, 'wb') as fc:
+				pos = 0
+				row = 0
+				for keep, line in zip(mask, self.iter_meta_lines()):
+					if not keep:
+						continue
+					data = (line + '\n').encode('utf-8')
+					offsets[row] = pos
+					fc.write(data)
+					pos += len(data)
+					if fj is not None:
+						fj.write((',' if row else '[') + line)
+					rec = json.loads(line)
+					for f in FACETS:
+						columns[f].append(str(rec.get(f) or ''))
+					if bm25 is not None:
+						bm25.add(row, str(rec.get('text') or ''))
+					row += 1
+				offsets[row] = pos
+			if fj is not None:
+				fj.write(']' if row else '[]')
+		finally:
+			if fj is not None:
+				fj.close()
+		with open(offsets_tmp, 'wb') as fo:
+			np.save(fo, offsets)
+		if bm25 is not None:
+			replaces += bm25.finish(live)
+		# tenant/source/url por linha: filtros aplicados dentro da busca na bridge
+		values, codes = facet_codes(columns)
+		del columns
+		# URLs distintas (uma por página) em tabela mmap; tenant/source são poucos e ficam no json
+		replaces += write_strings(os.path.join(dest, 'facets.url'), values.pop('url'))
+		facets_tmp = os.path.join(dest, 'facets.npy.tmp')
+		facets_json_tmp = os.path.join(dest, 'facets.json.tmp')
+		with open(facets_tmp, 'wb') as fo:
+			np.save(fo, codes)
+		with open(facets_json_tmp, 'w', encoding='utf-8') as f:
+			json.dump({'fields': list(FACETS), 'values': values}, f, ensure_ascii=False)
+		optional = list(quant.QUANT_FILES.values()) + [quant.REPORT_FILE]
+		optional += ([] if export_f16 else ['vectors.f16.npy']) + ([] if export_bm25 else list(BM25_FILES)) + ([] if export_json else ['meta.json'])
+		remove_stale(dest, optional, replaces)
+		os.replace(npy_tmp, os.path.join(dest, 'vectors.npy'))
+		if export_f16:
+			os.replace(f16_tmp, os.path.join(dest, 'vectors.f16.npy'))
+		os.replace(ids_tmp, os.path.join(dest, 'ids.npy'))
+		os.replace(norms_tmp, os.path.join(dest, 'norms.npy'))
+		for tmp, final in replaces:
+			os.replace(tmp, final)
+		os.replace(chunks_tmp, os.path.join(dest, 'chunks.jsonl'))
+		os.replace(offsets_tmp, os.path.join(dest, 'chunks.offsets.npy'))
+		os.replace(facets_tmp, os.path.join(dest, 'facets.npy'))
+		os.replace(facets_json_tmp, os.path.join(dest, 'facets.json'))
+		if export_json:
+			os.replace(meta_tmp, os.path.join(dest, 'meta.json'))
+		if snapshots:
+			for name in os.listdir(dest):
+				_fsync_path(os.path.join(dest, name))
+			_fsync_path(dest)
+			_fsync_write(os.path.join(self.out_dir, CURRENT_FILE), version.encode('utf-8'))
+			_fsync_path(self.out_dir)
+			prune_snapshots(self.out_dir, int(os.getenv('SNAPSHOT_KEEP', '3')))
+			logger.info(f"Snapshot {version} publicado ({live} chunks)")
@@ -1,11 +1,14 @@
-import os, glob
+import os, glob, time, signal, threading, multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
 from .config import settings
 from .utils import logger
-from .utils import logger
+from .extract_cache import ExtractCache
+from . import metrics
 from pypdf import PdfReader  # type: ignore[import-not-found]
 import docx  # type: ignore[import-not-found]
 import markdown  # type: ignore[import-not-found]
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 
 def read_file(path:str)->str:
 	ext=os.path.splitext(path)[1].lower()
@@ -37,20 +40,147 @@ def read_file(path:str)->str:
 		d=docx.Document(path)  # type: ignore[attr-defined]
 		paras: List[str] = []
 		for p in d.paragraphs:  # type: ignore[attr-defined]
-			paras.append(getattr(p, 'text', ''))  # type: ignore[arg-type]
-		return '\n'.join(paras)
+			text = getattr(p, 'text', '')
+			style = getattr(getattr(p, 'style', None), 'name', '') or ''
+			level = style[8:] if style.startswith('Heading ') else ''
+			# estilos "Heading N" viram headings markdown para o chunker
+			paras.append('#' * min(int(level), 6) + ' ' + text if level.isdigit() and text.strip() else text)
+		return '\n\n'.join(paras)
 	return ''
 
+# formatos caros de parsear vão para o pool de processos; texto puro é lido inline
+POOL_EXTS = ('.pdf', '.docx')
+
+class ExtractTimeout(BaseException):
+	# BaseException: read_file engole Exception ao ler PDFs
+	pass
+
+def _raise_timeout(signum, frame):  # type: ignore[no-untyped-def]
+	raise ExtractTimeout()
+
+def extract(path: str, timeout: int) -> Tuple[str, str, float, str]:
+	"""read_file com limite de tempo por arquivo (SIGALRM no processo que executa)."""
+	t0 = time.perf_counter()
+	use_alarm = timeout > 0 and hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+	if use_alarm:
+		prev = signal.signal(signal.SIGALRM, _raise_timeout)
+		signal.alarm(timeout)
+	status = 'ok'
+	try:
+		text = read_file(path)
+	except ExtractTimeout:
+		text, status = '', 'timeout'
+	except Exception as e:
+		logger.debug(f"error reading {path}: {e}")
+		text, status = '', 'error'
+	finally:
+		if use_alarm:
+			signal.alarm(0)
+			signal.signal(signal.SIGALRM, prev)
+	return path, text, time.perf_counter() - t0, status
+
+class ExtractStats:
+	def __init__(self):
+		self.by_ext: Dict[str, Dict[str, float]] = defaultdict(lambda: {'files': 0, 'secs': 0.0, 'max': 0.0, 'cached': 0, 'timeouts': 0, 'errors': 0})
+
+	def add(self, ext: str, secs: float, status: str):
+		s = self.by_ext[ext or '?']
+		s['files'] += 1
+		s['secs'] += secs
+		s['max'] = max(s['max'], secs)
+		if status == 'timeout': s['timeouts'] += 1
+		if status == 'error': s['errors'] += 1
+		# tempo medido no processo do pool; aqui só é registrado
+		metrics.observe('extract', secs, 1)
+		if status != 'ok': metrics.event(f'extract_{status}')
+
+	def cached(self, ext: str):
+		self.by_ext[ext or '?']['cached'] += 1
+		metrics.event('extract_cached')
+
+	def summary(self) -> str:
+		return '; '.join(
+			f"{ext}: {int(s['files'])} extraídos em {s['secs']:.2f}s (máx {s['max']:.2f}s), {int(s['cached'])} do cache"
+			+ (f", {int(s['timeouts'])} timeouts" if s['timeouts'] else '') + (f", {int(s['errors'])} erros" if s['errors'] else '')
+			for ext, s in sorted(self.by_ext.items()))
+
 def ingest_local()->List[Dict[str, Any]]:
+	return list(iter_local())
+
+def iter_local()->Iterator[Dict[str, Any]]:
+	"""Lê os arquivos de INPUT_DIR sob demanda, entregando cada doc assim que fica pronto.
+
+	PDF/DOCX são extraídos num pool de processos (EXTRACT_WORKERS, timeout de
+	EXTRACT_TIMEOUT_S por arquivo); o texto fica em cache por (path, mtime, size).
+	A ordem de saída é a de término, não a do diretório.
+	"""
 	base = settings.INPUT_DIR
 	if not os.path.isdir(base):
 		logger.info("Sem pasta input")
-		return []
-	docs: List[Dict[str, Any]] = []
-	for path in glob.glob(os.path.join(base,'**/*'), recursive=True):
-		if os.path.isdir(path): continue
-		text=read_file(path)
-		if not text.strip(): continue
-		docs.append({'title':os.path.basename(path),'url':path,'text':text})
-	logger.info(f"Ingest docs: {len(docs)} arquivos")
-	return docs
+		return
+	workers = int(settings.EXTRACT_WORKERS) or os.cpu_count() or 1
+	timeout = int(settings.EXTRACT_TIMEOUT_S)
+	cache = ExtractCache.from_env(settings.OUT_DIR)
+	stats = ExtractStats()
+	count = 0
+	# spawn: o processo pai tem threads (prefetch, pipeline de embeddings) e fork herdaria locks
+	pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+	pending: Dict[Future, Tuple[float, int]] = {}  # type: ignore[type-arg]
+
+	def to_doc(path: str, text: str, mtime: float, size: int) -> Dict[str, Any] | None:
+		nonlocal count
+		if not text.strip(): return None
+		count += 1
+		return {'title':os.path.basename(path),'url':path,'text':text,'mtime':mtime,'size':size}
+
+	def finish(res: Tuple[str, str, float, str], mtime: float, size: int) -> Dict[str, Any] | None:
+		path, text, secs, status = res
+		stats.add(os.path.splitext(path)[1].lower(), secs, status)
+		if status == 'timeout':
+			logger.warning(f"Timeout ({timeout}s) extraindo {path}; ignorado")
+		elif cache is not None and status == 'ok':
+			cache.put(os.path.abspath(path), mtime, size, text)
+		return to_doc(path, text, mtime, size)
+
+	def drain(block_all: bool) -> Iterator[Dict[str, Any]]:
+		while pending:
+			done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+			for fut in done:
+				mtime, size = pending.pop(fut)
+				try:
+					doc = finish(fut.result(), mtime, size)
+				except Exception as e:
+					logger.warning(f"Falha extração: {e}")
+					continue
+				if doc: yield doc
+			if not block_all and len(pending) < workers * 2:
+				return
+
+	try:
+		for path in glob.iglob(os.path.join(base,'**/*'), recursive=True):
+			if os.path.isdir(path): continue
+			_, mtime, size = ExtractCache.key(path)
+			ext = os.path.splitext(path)[1].lower()
+			if cache is not None:
+				text = cache.get(os.path.abspath(path), mtime, size)
+				if text is not None:
+					stats.cached(ext)
+					doc = to_doc(path, text, mtime, size)
+					if doc: yield doc
+					continue
+			if pool is not None and ext in POOL_EXTS:
+				pending[pool.submit(extract, path, timeout)] = (mtime, size)
+				if len(pending) >= workers * 2:
+					yield from drain(block_all=False)
+			else:
+				doc = finish(extract(path, timeout), mtime, size)
+				if doc: yield doc
+		yield from drain(block_all=True)
+	finally:
+		if pool is not None:
+			pool.shutdown(wait=False, cancel_futures=True)
+		if cache is not None:
+			cache.close()
+	logger.info(f"Ingest docs: {count} arquivos")
+	if stats.by_ext:
+		logger.info(f"Extração: {stats.summary()}")
@@ -0,0 +1,121 @@
+"""Índice invertido BM25 exportado junto com os vetores (busca híbrida na bridge).
+
+`BM25Builder.add(linha, texto)` é chamado na passada do `finalize` sobre os
+chunks vivos; as postings (termo, linha, tf) vão para arquivos temporários em
+disco e no fim são reagrupadas por termo em blocos (counting sort), então a
+memória fica no vocabulário e não no número de postings. Arquivos gravados:
+- `bm25.vocab.bin` + `bm25.vocab.npy`: termos ordenados (utf-8, '\\n') e offsets
+- `bm25.offsets.npy`: início das postings de cada termo (V+1, df = diferença)
+- `bm25.rows.npy` (int32) + `bm25.impact.npy` (float16): linha e peso BM25 já
+  normalizado por tamanho (tf·(k1+1) / (tf + k1·(1-b+b·dl/avgdl))); na query
+  só falta multiplicar pelo idf
+- `bm25.json`: N, avgdl, k1, b e a versão do tokenizador
+
+O tokenizador precisa ser idêntico ao da bridge (faiss-bridge/src/lexical.py).
+"""
+import os, re, json, unicodedata, numpy as np  # type: ignore[import-not-found]
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+
+TOKENIZER = 'w-casefold-noaccent-v1'
+_WORD = re.compile(r'\w+')
+BM25_FILES = ('bm25.rows.npy', 'bm25.impact.npy', 'bm25.vocab.bin', 'bm25.vocab.npy', 'bm25.offsets.npy', 'bm25.json')
+
+def tokenize(text: str) -> List[str]:
+	"""Palavras (\\w+) em casefold e sem acentos: "Missão" == "missao"."""
+	text = unicodedata.normalize('NFKD', text.casefold())
+	text = ''.join(c for c in text if not unicodedata.combining(c))
+	return _WORD.findall(text)
+
+class BM25Builder:
+	def __init__(self, out_dir: str, k1: float = 1.2, b: float = 0.75, suffix: str = '.tmp'):
+		self.out_dir = out_dir
+		self.k1, self.b = k1, b
+		self.suffix = suffix
+		self.vocab: Dict[str, int] = {}
+		self.doclen = array('i')
+		self._spill = {k: open(os.path.join(out_dir, f'bm25.{k}.spill'), 'wb') for k in ('term', 'row', 'tf')}
+		self.postings = 0
+
+	def add(self, row: int, text: str):
+		"""Postings da linha `row` (linhas chegam em ordem crescente)."""
+		tokens = tokenize(text)
+		while len(self.doclen) <= row:
+			self.doclen.append(0)
+		self.doclen[row] = len(tokens)
+		if not tokens:
+			return
+		counts = Counter(tokens)
+		terms = array('i', [self.vocab.setdefault(t, len(self.vocab)) for t in counts])
+		self._spill['term'].write(terms.tobytes())
+		self._spill['row'].write(array('i', [row]).tobytes() * len(counts))
+		self._spill['tf'].write(array('H', [min(c, 65535) for c in counts.values()]).tobytes())
+		self.postings += len(counts)
+
+	def _path(self, name: str) -> str:
+		return os.path.join(self.out_dir, name)
+
+	def finish(self, n_rows: int, block: int = 8_000_000) -> List[Tuple[str, str]]:
+		"""Grava os arquivos como `<nome><suffix>` e devolve os pares (tmp, final)."""
+		for f in self._spill.values():
+			f.close()
+		while len(self.doclen) < n_rows:
+			self.doclen.append(0)
+		dl = np.frombuffer(self.doclen, dtype='int32').astype('float32') if n_rows else np.empty(0, dtype='float32')
+		avgdl = float(dl.sum(dtype='float64') / n_rows) if n_rows and dl.sum() else 1.0
+		norm = self.k1 * (1 - self.b + self.b * dl / avgdl)
+		# ids na ordem de chegada -> ids na ordem lexicográfica (bisect na bridge)
+		terms_sorted = sorted(self.vocab)
+		remap = np.empty(len(self.vocab), dtype='int32')
+		for new_id, t in enumerate(terms_sorted):
+			remap[self.vocab[t]] = new_id
+		df = np.zeros(len(terms_sorted), dtype='int64')
+		if self.postings:
+			terms = np.memmap(self._path('bm25.term.spill'), dtype='int32', mode='r')
+			for i in range(0, self.postings, block):
+				df += np.bincount(remap[terms[i:i+block]], minlength=len(df))
+			del terms
+		offsets = np.zeros(len(terms_sorted) + 1, dtype='int64')
+		np.cumsum(df, out=offsets[1:])
+		if self.postings:
+			self._scatter(remap, offsets, norm, block)
+		else:
+			for name, dtype in (('bm25.rows.npy', 'int32'), ('bm25.impact.npy', 'float16')):
+				with open(self._path(name + self.suffix), 'wb') as f:
+					np.save(f, np.empty(0, dtype=dtype))
+		for k in ('term', 'row', 'tf'):
+			os.remove(self._path(f'bm25.{k}.spill'))
+		data = '\n'.join(terms_sorted).encode('utf-8')
+		starts = np.zeros(len(terms_sorted) + 1, dtype='int64')
+		if terms_sorted:
+			np.cumsum([len(t.encode('utf-8')) + 1 for t in terms_sorted], out=starts[1:])
+		with open(self._path('bm25.vocab.bin' + self.suffix), 'wb') as f:
+			f.write(data + b'\n' if data else b'')
+		for name, arr in (('bm25.vocab.npy', starts), ('bm25.offsets.npy', offsets)):
+			with open(self._path(name + self.suffix), 'wb') as f:
+				np.save(f, arr)
+		with open(self._path('bm25.json' + self.suffix), 'w', encoding='utf-8') as f:
+			json.dump({'tokenizer': TOKENIZER, 'n': n_rows, 'avgdl': avgdl, 'k1': self.k1, 'b': self.b, 'terms': len(terms_sorted), 'postings': self.postings}, f)
+		return [(self._path(n + self.suffix), self._path(n)) for n in BM25_FILES]
+
+	def _scatter(self, remap: np.ndarray, offsets: np.ndarray, norm: np.ndarray, block: int):
+		# counting sort estável por termo, em blocos: as linhas de cada termo saem crescentes
+		rows_out = np.lib.format.open_memmap(self._path('bm25.rows.npy' + self.suffix), mode='w+', dtype='int32', shape=(self.postings,))
+		impact_out = np.lib.format.open_memmap(self._path('bm25.impact.npy' + self.suffix), mode='w+', dtype='float16', shape=(self.postings,))
+		terms = np.memmap(self._path('bm25.term.spill'), dtype='int32', mode='r')
+		rows = np.memmap(self._path('bm25.row.spill'), dtype='int32', mode='r')
+		tfs = np.memmap(self._path('bm25.tf.spill'), dtype='uint16', mode='r')
+		cursor = offsets[:-1].copy()
+		for i in range(0, self.postings, block):
+			t = remap[terms[i:i+block]]
+			order = np.argsort(t, kind='stable')
+			ts = t[order]
+			pos = cursor[ts] + (np.arange(len(ts)) - np.searchsorted(ts, ts, side='left'))
+			r = np.asarray(rows[i:i+block])[order]
+			tf = np.asarray(tfs[i:i+block], dtype='float32')[order]
+			rows_out[pos] = r
+			impact_out[pos] = tf * (self.k1 + 1) / (tf + norm[r])
+			cursor += np.bincount(ts, minlength=len(cursor))
+		rows_out.flush(); impact_out.flush()
+		del rows_out, impact_out, terms, rows, tfs
@@ -0,0 +1,88 @@
+"""Timers e contadores por etapa do indexer, no formato de texto do Prometheus.
+
+`stage('embed', items=n)` mede um trecho (histograma `indexer_stage_seconds`
++ contador de itens); `event('crawl_not_modified')` conta ocorrências. Como
+o indexer é um job batch, não há servidor: `Exporter` regrava METRICS_FILE
+(atômico, formato do textfile collector do node_exporter) a cada
+METRICS_INTERVAL_S e no fim, e `summary()` vira uma linha de log por etapa.
+
+Os tipos (Counter, Histogram, Registry, ...) e o `Sampler` vêm do pacote
+compartilhado `promtext`, o mesmo da bridge: com PROFILE_DIR o CLI grava as
+pilhas do build inteiro em PROFILE_DIR/*.folded (flamegraph.pl / speedscope);
+sem PROFILE_DIR a thread não existe.
+"""
+import os, time, threading
+from contextlib import contextmanager
+from typing import Iterator
+from promtext import Registry, Sampler, profile_path  # type: ignore[import-not-found]
+
+# segundos; de um chunk (~0.1ms) a um PDF grande ou ao export final
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('indexer_stage_seconds', 'Duração de cada execução da etapa', ('stage',), STAGE_BUCKETS)
+STAGE_ITEMS = REGISTRY.counter('indexer_stage_items_total', 'Itens processados por etapa (páginas, arquivos, chunks)', ('stage',))
+EVENTS = REGISTRY.counter('indexer_events_total', 'Ocorrências contadas (304, timeouts, retries, ...)', ('event',))
+STARTED = time.time()
+REGISTRY.gauge('indexer_start_time_seconds', 'Início do processo (epoch)', lambda: [((), STARTED)])
+REGISTRY.gauge('indexer_last_update_seconds', 'Última gravação das métricas (epoch); parada = job travado', lambda: [((), time.time())])
+
+def observe(name: str, secs: float, items: int = 0):
+	STAGE_SECONDS.observe(secs, name)
+	if items:
+		STAGE_ITEMS.inc(items, name)
+
+@contextmanager
+def stage(name: str, items: int = 0) -> Iterator[None]:
+	t0 = time.perf_counter()
+	try:
+		yield
+	finally:
+		observe(name, time.perf_counter() - t0, items)
+
+def event(name: str, n: int = 1):
+	EVENTS.inc(n, name)
+
+def summary() -> str:
+	"""`etapa: N× total (média), itens` para cada etapa medida, na ordem de primeira ocorrência."""
+	parts = []
+	for (name,) in STAGE_SECONDS.keys():
+		n, total = STAGE_SECONDS.count(name), STAGE_SECONDS.total(name)
+		items = STAGE_ITEMS.value(name)
+		parts.append(f"{name}: {n}× {total:.2f}s (média {total / n * 1000:.1f}ms)" + (f", {int(items)} itens" if items else ''))
+	events = ', '.join(f"{k[0]}={int(v)}" for k, v in sorted(EVENTS.items()))
+	return '; '.join(parts) + (f" | {events}" if events else '')
+
+class Exporter:
+	"""Regrava `path` a cada `interval` segundos numa thread e uma última vez em `stop()`."""
+	def __init__(self, path: str, interval: float = 15):
+		self.path = path
+		self.interval = interval
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+
+	@classmethod
+	def from_env(cls) -> 'Exporter | None':
+		path = os.getenv('METRICS_FILE')
+		return cls(path, float(os.getenv('METRICS_INTERVAL_S', '15'))) if path else None
+
+	def write(self):
+		tmp = self.path + '.tmp'
+		os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+		with open(tmp, 'w', encoding='utf-8') as f:
+			f.write(REGISTRY.render())
+		os.replace(tmp, self.path)  # o coletor nunca lê um arquivo pela metade
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			self.write()
+
+	def start(self) -> 'Exporter':
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stop.set()
+		if self._thread.is_alive():
+			self._thread.join()
+		self.write()
@@ -0,0 +1,153 @@
+"""Representações compactas dos vetores para a 1ª etapa da bridge (VECTORS_QUANT).
+
+`EXPORT_QUANT` (lista separada por vírgula de float16, int8, binary) grava no
+export, ao lado de vectors.npy:
+	float16 -> vectors.sqfp16.faiss  (faiss IndexScalarQuantizer QT_fp16)
+	int8    -> vectors.sq8.faiss     (QT_8bit, faixa treinada por dimensão)
+	binary  -> vectors.bin.npy       (sinal de cada dimensão em packbits)
+
+A bridge busca a shortlist na representação compacta e reordena os
+QUANT_RESCORE melhores pelo cosine exato em vectors.npy. `quant_report.json`
+(QUANT_REPORT=1, padrão quando há EXPORT_QUANT) traz, por tipo, bytes,
+recall@k só da etapa compacta, recall@k após rescore para alguns tamanhos de
+shortlist e latência p50, contra a busca exata em float32.
+
+Relatório avulso sobre um OUT_DIR já exportado:
+	python -m indexer.src.quant --kinds float16,int8,binary
+"""
+import os, json, math, time, argparse, faiss, numpy as np  # type: ignore[import-not-found]
+from typing import List, Dict, Any, Tuple
+from .utils import logger
+from .ann import sample_rows, exact_top_k
+
+QUANT_FILES = {'float16': 'vectors.sqfp16.faiss', 'int8': 'vectors.sq8.faiss', 'binary': 'vectors.bin.npy'}
+REPORT_FILE = 'quant_report.json'
+RESCORE_GRID = (10, 20, 50, 100, 200, 500)
+
+def parse_kinds(value: str) -> List[str]:
+	kinds = [k.strip() for k in value.split(',') if k.strip()]
+	bad = [k for k in kinds if k not in QUANT_FILES]
+	if bad:
+		raise ValueError(f"EXPORT_QUANT inválido: {', '.join(bad)} (use {', '.join(QUANT_FILES)})")
+	return kinds
+
+def pack_signs(vectors: np.ndarray, block: int = 65536) -> np.ndarray:
+	out = np.empty((vectors.shape[0], (vectors.shape[1] + 7) // 8), dtype='uint8')
+	for i in range(0, vectors.shape[0], block):
+		out[i:i+block] = np.packbits(np.asarray(vectors[i:i+block]) > 0, axis=1)
+	return out
+
+def build_sq(vectors: np.ndarray, kind: str, block: int = 65536) -> Any:
+	qtype = faiss.ScalarQuantizer.QT_fp16 if kind == 'float16' else faiss.ScalarQuantizer.QT_8bit
+	index = faiss.IndexScalarQuantizer(vectors.shape[1], qtype, faiss.METRIC_INNER_PRODUCT)
+	rows = sample_rows(vectors.shape[0], int(os.getenv('QUANT_TRAIN_SAMPLE', '100000')))
+	index.train(np.ascontiguousarray(vectors[rows], dtype='float32'))
+	for i in range(0, vectors.shape[0], block):
+		index.add(np.ascontiguousarray(vectors[i:i+block], dtype='float32'))
+	return index
+
+def build(vectors: np.ndarray, kind: str) -> Tuple[Any, np.ndarray | None]:
+	"""(índice SQ, None) para float16/int8 ou (None, códigos packbits) para binary."""
+	if kind == 'binary':
+		return None, pack_signs(vectors)
+	return build_sq(vectors, kind), None
+
+def shortlist(index: Any, codes: np.ndarray | None, q: np.ndarray, r: int) -> np.ndarray:
+	if codes is not None:
+		return faiss.knn_hamming(np.packbits(q > 0, axis=1), codes, r)[1]
+	return index.search(q, r)[1]
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+	k = truth.shape[1]
+	return float(np.mean([len(set(a[:k]) & set(b)) / k for a, b in zip(found.tolist(), truth.tolist())]))
+
+def _timed(fn, q: np.ndarray) -> Tuple[np.ndarray, float]:
+	# uma query por vez, como na bridge; devolve (linhas, p50 em ms)
+	fn(q[:1])  # warmup
+	rows, lat = [], []
+	for j in range(len(q)):
+		t = time.perf_counter()
+		rows.append(fn(q[j:j+1])[0])
+		lat.append((time.perf_counter() - t) * 1000)
+	return np.array(rows), round(float(np.percentile(lat, 50)), 3)
+
+def evaluate(vectors: np.ndarray, kinds: List[str], k: int = 10, n_queries: int = 200, built: Dict[str, Tuple[Any, np.ndarray | None]] | None = None) -> Dict[str, Any]:
+	"""recall@k, bytes e latência de cada representação, com e sem rescore exato.
+
+	Queries são linhas do próprio export com ruído gaussiano (mesmo critério de
+	ann.evaluate); o baseline é o top-k exato em float32.
+	"""
+	n, dim = vectors.shape
+	rng = np.random.default_rng(1)
+	q = np.asarray(vectors[sample_rows(n, n_queries, seed=1)], dtype='float32')
+	q += rng.standard_normal(q.shape, dtype=np.float32) * (0.5 / math.sqrt(dim))
+	q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-9
+	k = min(k, n)
+	truth = exact_top_k(vectors, q, k)
+	_, exact_p50 = _timed(lambda x: exact_top_k(vectors, x, k), q[:min(len(q), 20)])
+	report: Dict[str, Any] = {'k': k, 'queries': len(q), 'count': n, 'dim': dim,
+		'float32': {'bytes': int(n * dim * 4), 'p50_ms': exact_p50}, 'kinds': {}}
+	for kind in kinds:
+		index, codes = (built or {}).get(kind) or build(vectors, kind)
+		nbytes = int(codes.nbytes) if codes is not None else int(index.sa_code_size()) * n
+		compact, p50 = _timed(lambda x: shortlist(index, codes, x, k), q)
+		points = []
+		for r in [r for r in RESCORE_GRID if k <= r <= n] or [n]:
+			def rescored(x: np.ndarray) -> np.ndarray:
+				rows = shortlist(index, codes, x, r)[0]
+				rows = np.sort(rows[rows >= 0])
+				sims = np.asarray(vectors[rows], dtype='float32') @ x[0]
+				return rows[np.lexsort((rows, -sims))[:k]][None]
+			found, rp50 = _timed(rescored, q)
+			points.append({'rescore': r, 'recall': round(_recall(found, truth), 4), 'p50_ms': rp50})
+		report['kinds'][kind] = {'bytes': nbytes, 'ratio': round(n * dim * 4 / max(nbytes, 1), 1),
+			'recall': round(_recall(compact, truth), 4), 'p50_ms': p50, 'rescored': points}
+	return report
+
+def write_quant(out_dir: str, vectors: np.ndarray, kinds: List[str], suffix: str = '.tmp') -> List[Tuple[str, str]]:
+	"""Grava os arquivos de `kinds` (+ quant_report.json) como `<nome><suffix>`.
+
+	Devolve os pares (tmp, final) para os os.replace do export, como
+	ann.write_index.
+	"""
+	pairs: List[Tuple[str, str]] = []
+	built: Dict[str, Tuple[Any, np.ndarray | None]] = {}
+	for kind in kinds:
+		t0 = time.perf_counter()
+		index, codes = built[kind] = build(vectors, kind)
+		path = os.path.join(out_dir, QUANT_FILES[kind])
+		if codes is not None:
+			with open(path + suffix, 'wb') as f:
+				np.save(f, codes)
+		else:
+			faiss.write_index(index, path + suffix)
+		pairs.append((path + suffix, path))
+		logger.info(f"Quant {kind}: {os.path.getsize(path + suffix)/1e6:.1f}MB em {time.perf_counter()-t0:.1f}s")
+	if kinds and os.getenv('QUANT_REPORT', '1').lower() not in ('0', 'false', 'no'):
+		report = evaluate(vectors, kinds, int(os.getenv('ANN_REPORT_K', '10')), built=built)
+		for kind, rep in report['kinds'].items():
+			best = ', '.join(f"R={p['rescore']}: {p['recall']}" for p in rep['rescored'])
+			logger.info(f"Quant {kind}: {rep['ratio']}x menor, recall@{report['k']} {rep['recall']} sem rescore; com rescore {best}")
+		rpath = os.path.join(out_dir, REPORT_FILE)
+		with open(rpath + suffix, 'w', encoding='utf-8') as f:
+			json.dump(report, f, indent=1)
+		pairs.append((rpath + suffix, rpath))
+	return pairs
+
+def main():
+	ap = argparse.ArgumentParser(description='recall@k x memória x latência das representações compactas sobre o vectors.npy exportado')
+	ap.add_argument('--dir', default=None, help='OUT_DIR (padrão: settings.OUT_DIR)')
+	ap.add_argument('--kinds', default='float16,int8,binary')
+	ap.add_argument('-k', type=int, default=10)
+	ap.add_argument('--queries', type=int, default=200)
+	args = ap.parse_args()
+	if args.dir is None:
+		from .config import settings
+		args.dir = settings.OUT_DIR
+	from .index_store import current_dir
+	args.dir = current_dir(args.dir)
+	vectors = np.load(os.path.join(args.dir, 'vectors.npy'), mmap_mode='r')
+	print(json.dumps(evaluate(vectors, parse_kinds(args.kinds), args.k, args.queries), indent=1))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,81 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest  # type: ignore[import-not-found]
+from .config import settings  # type: ignore[attr-defined]
+from . import crawl_site  # type: ignore[attr-defined]
+
+PAGES = {
+	'/': '<html><title>Home</title><body><h1>Home</h1><a href="/a">a</a><a href="/privado/x">x</a><a href="/tags/t">t</a></body></html>',
+	'/a': '<html><title>A</title><body><p>Página A</p><a href="/">home</a><a href="/b">b</a></body></html>',
+	'/b': '<html><title>B</title><body><p>Página B</p></body></html>',
+	'/orfa': '<html><title>Orfa</title><body><p>Só no sitemap</p></body></html>',
+	'/privado/x': '<html><title>X</title><body><p>bloqueada</p></body></html>',
+}
+
+class _Handler(BaseHTTPRequestHandler):
+	hits: list = []  # type: ignore[type-arg]
+
+	def do_GET(self):  # type: ignore[no-untyped-def]
+		_Handler.hits.append(self.path)
+		host = self.headers.get('Host')
+		if self.path == '/robots.txt':
+			body = f"User-agent: *\nDisallow: /privado/\nSitemap: http://{host}/sitemap.xml\n"
+			ctype = 'text/plain'
+		elif self.path == '/sitemap.xml':
+			body = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><url><loc>http://{host}/orfa</loc></url></urlset>'
+			ctype = 'application/xml'
+		elif self.path in PAGES:
+			body, ctype = PAGES[self.path], 'text/html'
+			etag = '"%x"' % (hash(body) & 0xffffffff)
+			if self.headers.get('If-None-Match') == etag:
+				self.send_response(304); self.end_headers(); return
+		else:
+			self.send_response(404); self.end_headers(); return
+		data = body.encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', ctype)
+		self.send_header('Content-Length', str(len(data)))
+		if ctype == 'text/html':
+			self.send_header('ETag', etag)
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, *args):  # type: ignore[no-untyped-def]
+		pass
+
+@pytest.fixture
+def site(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	srv = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+	t = threading.Thread(target=srv.serve_forever, daemon=True)
+	t.start()
+	_Handler.hits = []
+	monkeypatch.setattr(settings, 'BASE_URL', f"http://127.0.0.1:{srv.server_address[1]}")
+	monkeypatch.setattr(settings, 'INPUT_DIR', str(tmp_path / 'input'))
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path / 'out'))
+	yield settings.BASE_URL
+	srv.shutdown()
+
+def test_crawl_local_site_respects_robots_and_sitemap(site):  # type: ignore[no-untyped-def]
+	docs = crawl_site.crawl()
+	titles = sorted(d['title'] for d in docs)
+	assert titles == ['A', 'B', 'Home', 'Orfa']
+	assert '/privado/x' not in _Handler.hits
+	assert '/tags/t' not in _Handler.hits
+	assert _Handler.hits.count('/a') == 1
+
+def test_crawl_max_pages(site, monkeypatch):  # type: ignore[no-untyped-def]
+	monkeypatch.setattr(settings, 'CRAWL_MAX_PAGES', 2)
+	assert len(crawl_site.crawl()) == 2
+
+def test_recrawl_uses_conditional_requests(site):  # type: ignore[no-untyped-def]
+	first = {d['url']: d for d in crawl_site.crawl()}
+	assert all(d['changed'] for d in first.values())
+	PAGES['/b'] = PAGES['/b'].replace('Página B', 'Página B v2')
+	try:
+		second = {d['url']: d for d in crawl_site.crawl()}
+	finally:
+		PAGES['/b'] = PAGES['/b'].replace('Página B v2', 'Página B')
+	assert second.keys() == first.keys()
+	changed = sorted(u.rsplit('/', 1)[-1] for u, d in second.items() if d['changed'])
+	assert changed == ['b']
+	assert second[site + '/a']['text'] == first[site + '/a']['text']
@@ -0,0 +1,71 @@
+import time, random
+import httpx  # type: ignore[import-not-found]
+import numpy as np  # type: ignore[import-not-found]
+import openai  # type: ignore[import-not-found]
+from .embedding import EmbedPipeline, Backoff, iter_batches  # type: ignore[attr-defined]
+
+def _slow_embed(texts):  # type: ignore[no-untyped-def]
+	# stand-in offline: latência aleatória para embaralhar a ordem de término
+	time.sleep(random.uniform(0.001, 0.02))
+	return [[float(t), 1.0] for t in texts]
+
+def test_pipeline_preserves_chunk_order_and_bounds_inflight():  # type: ignore[no-untyped-def]
+	got = []
+	def sink(metas, vecs):  # type: ignore[no-untyped-def]
+		got.extend(zip([m['chunk_id'] for m in metas], vecs[:, 0].tolist()))
+	p = EmbedPipeline(sink, embed_fn=_slow_embed, concurrency=8, batch_size=3, max_inflight=4)
+	texts = [str(i) for i in range(100)]
+	for i in range(0, 100, 10):
+		p.submit(texts[i:i+10], [{'chunk_id': t} for t in texts[i:i+10]])
+		assert len(p.pending) <= 4
+	p.flush(); p.close()
+	assert [c for c, _ in got] == texts
+	assert [v for _, v in got] == [float(t) for t in texts]
+
+def test_iter_batches_token_budget():  # type: ignore[no-untyped-def]
+	texts = ['x' * 400] * 5  # ~101 tokens cada
+	assert list(iter_batches(texts, 10, 250)) == [(0, 2), (2, 4), (4, 5)]
+	assert list(iter_batches(['x' * 4000], 10, 5)) == [(0, 1)]  # texto maior que o orçamento vai sozinho
+
+def test_backoff_retries_rate_limit_with_retry_after():  # type: ignore[no-untyped-def]
+	calls = []
+	resp = httpx.Response(429, headers={'retry-after-ms': '10'}, request=httpx.Request('POST', 'http://x'))
+	def flaky(texts):  # type: ignore[no-untyped-def]
+		calls.append(time.monotonic())
+		if len(calls) < 3:
+			raise openai.RateLimitError('rate limited', response=resp, body=None)
+		return [[1.0] for _ in texts]
+	assert Backoff(max_retries=5).call(flaky, ['a']) == [[1.0]]
+	assert len(calls) == 3
+	assert calls[2] - calls[0] >= 0.02
+
+def test_embed_cache_only_sends_misses_and_evicts(tmp_path):  # type: ignore[no-untyped-def]
+	from .embed_cache import EmbedCache  # type: ignore[attr-defined]
+	sent = []
+	def fake(texts):  # type: ignore[no-untyped-def]
+		sent.extend(texts)
+		return [[float(len(t))] * 4 for t in texts]
+	cache = EmbedCache(str(tmp_path / 'c.sqlite'), max_bytes=10_000)
+	fn = cache.wrap(fake, 'm')
+	assert fn(['a', 'bb', 'a']) == [[1.0] * 4, [2.0] * 4, [1.0] * 4]
+	assert sent == ['a', 'bb']
+	assert fn(['bb', 'ccc']) == [[2.0] * 4, [3.0] * 4]
+	assert sent == ['a', 'bb', 'ccc']
+	assert (cache.hits, cache.misses) == (2, 3)
+	cache.wrap(fake, 'outro')(['a'])  # outro modelo não reaproveita
+	assert sent[-1] == 'a'
+	cache.close()
+	small = EmbedCache(str(tmp_path / 'c.sqlite'), max_bytes=40)
+	small.wrap(fake, 'm')(['dddd'])
+	assert small.evicted > 0 and small.total_bytes <= 40
+
+def test_hash_embed_is_deterministic_and_not_degenerate():  # type: ignore[no-untyped-def]
+	import numpy as np  # type: ignore[import-not-found]
+	from .embedding import hash_embed  # type: ignore[attr-defined]
+	from .bench_suite import compare  # type: ignore[attr-defined]
+	v = hash_embed(['plano pro anual', 'plano pro mensal', 'receita de bolo', ''], 64)
+	assert np.allclose(np.linalg.norm(v, axis=1), 1) and np.array_equal(v, hash_embed(['plano pro anual', 'plano pro mensal', 'receita de bolo', ''], 64))
+	sims = v @ v.T
+	assert sims[0, 1] > sims[0, 2]
+	rows = {name: status for name, *_, status in compare({'search_p50_ms': 2.0, 'search_qps': 100, 'bridge_load_s': 0.01}, {'search_p50_ms': 1.0, 'search_qps': 150, 'bridge_load_s': 0.005}, 0.25)}
+	assert rows == {'search_p50_ms': 'PIOROU', 'search_qps': 'PIOROU', 'bridge_load_s': 'ok'}
@@ -15,8 +15,382 @@ def test_crawl_and_build_monkeypatch(monkeypatch):  # type: ignore[no-untyped-de
 	monkeypatch.setattr('indexer.src.crawl_site.crawl', fake_crawl)
 	docs = fake_crawl()
 	build(docs, 'rebuild')
-	out_dir = settings.OUT_DIR
-	assert os.path.exists(out_dir)
+	from .index_store import current_dir  # type: ignore[attr-defined]
+	assert os.path.exists(settings.OUT_DIR)
+	out_dir = current_dir(settings.OUT_DIR)
 	with open(os.path.join(out_dir,'meta.json'),'r') as f:
 		meta = json.load(f)
 	assert len(meta) > 0
+	# layout compacto da bridge: uma linha por chunk + offsets (N+1)
+	import numpy as np  # type: ignore[import-not-found]
+	offsets = np.load(os.path.join(out_dir,'chunks.offsets.npy'))
+	with open(os.path.join(out_dir,'chunks.jsonl'),'rb') as f:
+		data = f.read()
+	assert len(offsets) == len(meta) + 1 and offsets[-1] == len(data)
+	assert json.loads(data[offsets[-2]:offsets[-1]]) == meta[-1]
+
+def test_append_only_layout_recovers_uncommitted_tail(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import numpy as np  # type: ignore[import-not-found]
+	from .index_store import IndexWriter  # type: ignore[attr-defined]
+	out = str(tmp_path)
+	w = IndexWriter(out, 'rebuild')
+	w.doc_done('a', {'chunks': [0]}, 0)
+	w.append([{'chunk_id': '0', 'text': 'a'}], np.ones((1, 4), dtype='float32'))
+	w.doc_done('b', {'chunks': [1]}, 1)
+	w.append([{'chunk_id': '1', 'text': 'b'}], np.zeros((1, 4), dtype='float32'))
+	# simula crash no meio de um flush: bytes anexados sem commit no manifest
+	with open(w.path('vec'), 'ab') as f: f.write(b'\0' * 16)
+	with open(w.path('meta'), 'ab') as f: f.write(b'{"chunk_id": "2"')
+	w2 = IndexWriter(out, 'append')
+	assert w2.count == 2
+	assert os.path.getsize(w2.path('vec')) == 2 * 4 * 4
+	w2.doc_done('c', {'chunks': [2]}, 2)
+	w2.append([{'chunk_id': '2', 'text': 'c'}], np.ones((1, 4), dtype='float32'))
+	monkeypatch.setenv('EXPORT_SNAPSHOTS', '0')  # export direto em OUT_DIR (layout sem snapshots)
+	np.save(os.path.join(out, 'vectors.f16.npy'), np.zeros((2, 4), dtype='float16'))  # sobra de um export com EXPORT_F16=1
+	w2.finalize()
+	assert not os.path.exists(os.path.join(out, 'vectors.f16.npy'))
+	with open(os.path.join(out, 'meta.json'), 'r') as f:
+		assert [m['chunk_id'] for m in json.load(f)] == ['0', '1', '2']
+	assert np.load(os.path.join(out, 'vectors.npy')).shape == (3, 4)
+	assert os.path.exists(os.path.join(out, 'bm25.json'))
+	# re-export sem BM25 nem meta.json: os arquivos do export anterior saem de OUT_DIR
+	monkeypatch.setenv('EXPORT_BM25', '0')
+	monkeypatch.setenv('EXPORT_META_JSON', '0')
+	w2.finalize()
+	assert not [f for f in os.listdir(out) if f.startswith('bm25.') or f == 'meta.json']
+
+def test_sync_mode_only_reembeds_changed_docs(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setenv('SNAPSHOT_KEEP','1')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path))
+	embedded = []
+	def fake_embed(texts):  # type: ignore[no-untyped-def]
+		embedded.extend(texts)
+		return [[1.0, 0.0] for _ in texts]
+	monkeypatch.setattr('indexer.src.embedding.offline_embed', fake_embed)
+	docs = [
+		{'title':'A','url':'http://x/a','text':'alpha'},
+		{'title':'B','url':'http://x/b','text':'beta'},
+		{'title':'C','url':'http://x/c','text':'gamma'},
+	]
+	build(docs, 'sync')
+	assert embedded == ['alpha', 'beta', 'gamma']
+	embedded.clear()
+	build([{'title':'A','url':'http://x/a','text':'alpha'}, {'title':'B','url':'http://x/b','text':'beta 2'}, {'title':'D','url':'http://x/d','text':'delta'}], 'sync')
+	assert embedded == ['beta 2', 'delta']
+	from .index_store import current_dir  # type: ignore[attr-defined]
+	# cada build publica um snapshot novo; o anterior foi podado (SNAPSHOT_KEEP=1)
+	assert os.listdir(os.path.join(str(tmp_path), 'snapshots')) == [os.path.basename(current_dir(str(tmp_path)))]
+	with open(os.path.join(current_dir(str(tmp_path)),'meta.json'),'r') as f:
+		meta = json.load(f)
+	assert sorted(m['text'] for m in meta) == ['alpha', 'beta 2', 'delta']
+	assert len({m['chunk_id'] for m in meta}) == 3
+
+def test_sync_reindexes_doc_cut_by_max_chunks(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path))
+	monkeypatch.setattr(settings, 'CHUNKER', 'chars')
+	monkeypatch.setattr(settings, 'CHUNK_SIZE_CHARS', 10)
+	monkeypatch.setattr(settings, 'CHUNK_OVERLAP_CHARS', 0)
+	monkeypatch.setattr('indexer.src.embedding.offline_embed', lambda texts: [[1.0, 0.0] for _ in texts])
+	from .index_store import current_dir  # type: ignore[attr-defined]
+	def texts():  # type: ignore[no-untyped-def]
+		with open(os.path.join(current_dir(str(tmp_path)), 'meta.json')) as f:
+			return [m['text'] for m in json.load(f)]
+	doc = {'title': 'A', 'url': 'http://x/a', 'text': 'aaaaaaaaa bbbbbbbbb ccccccccc'}
+	monkeypatch.setenv('MAX_CHUNKS', '2')
+	build([doc], 'sync')
+	assert len(texts()) == 2
+	monkeypatch.delenv('MAX_CHUNKS')
+	build([doc], 'sync')
+	# mesmo fingerprint, mas o doc foi cortado: o sync seguinte completa os chunks
+	assert len(texts()) == 3 and ''.join(texts()).replace(' ', '') == doc['text'].replace(' ', '')
+	build([doc], 'sync')
+	assert len(texts()) == 3
+
+def test_build_drops_exact_and_near_duplicate_chunks(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path))
+	embedded = []
+	def fake_embed(texts):  # type: ignore[no-untyped-def]
+		embedded.extend(texts)
+		return [[1.0, 0.0] for _ in texts]
+	monkeypatch.setattr('indexer.src.embedding.offline_embed', fake_embed)
+	body = ' '.join(f'palavra{i}' for i in range(60))
+	build([
+		{'title':'P1','url':'http://x/lista?page=1','text': body + ' Página 1 de 3'},
+		{'title':'P1 impressão','url':'http://x/lista?page=1&print=1','text': body + ' Página 1 de 3'},
+		{'title':'P2','url':'http://x/lista?page=2','text': body + ' Página 2 de 3'},
+		{'title':'Outro','url':'http://x/outro','text':'conteúdo completamente diferente'},
+	], 'rebuild')
+	assert embedded == [body + ' Página 1 de 3', 'conteúdo completamente diferente']
+
+def test_sync_reindexes_docs_deduplicated_against_changed_or_removed_docs(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path))
+	embedded = []
+	def fake_embed(texts):  # type: ignore[no-untyped-def]
+		embedded.extend(texts)
+		return [[1.0, 0.0] for _ in texts]
+	monkeypatch.setattr('indexer.src.embedding.offline_embed', fake_embed)
+	from .index_store import current_dir  # type: ignore[attr-defined]
+	def texts():  # type: ignore[no-untyped-def]
+		with open(os.path.join(current_dir(str(tmp_path)), 'meta.json')) as f:
+			return sorted(m['text'] for m in json.load(f))
+	body = ' '.join(f'palavra{i}' for i in range(60))
+	a = {'title': 'A', 'url': 'http://x/a', 'text': body + ' rodapé A'}
+	b = {'title': 'B', 'url': 'http://x/b', 'text': body + ' rodapé B'}
+	a2 = {**a, 'text': 'texto novo de A'}
+	# A muda antes de B no crawl (B re-indexado na hora), depois de B (B adiado até o fim) ou some das fontes
+	for order in ([a2, b], [b, a2], [b]):
+		build([a, b], 'rebuild')
+		assert texts() == [a['text']]  # B é quase-cópia de A
+		embedded.clear()
+		build(order, 'sync')
+		assert texts() == sorted(d['text'] for d in order)
+		assert b['text'] in embedded
+
+def test_structured_chunker_respects_headings_sentences_and_budget():  # type: ignore[no-untyped-def]
+	from .chunking import iter_chunks, offline_tokens  # type: ignore[attr-defined]
+	frases = ' '.join(f'Frase {i} sobre planos e preços.' for i in range(40))
+	text = f"# Produto\n\nIntro curta.\n\n## Preços\n\n{frases}\n\n## Contato\n\nFale com a gente.\n\n### Endereço\n\nRua X, 123."
+	chunks = list(iter_chunks(text, 60))
+	assert all(offline_tokens(c) <= 60 for c, _ in chunks)
+	# só corta entre frases: todo chunk do meio da seção termina em ponto
+	assert all(c.endswith('.') for c, _ in chunks)
+	assert chunks[1] == ('Frase 5 sobre planos e preços. ' + ' '.join(f'Frase {i} sobre planos e preços.' for i in range(6, 11)), ['Produto', 'Preços'])
+	# seção que cabe inteira entra no chunk corrente (caminho = prefixo comum); a que não cabe abre um chunk
+	assert chunks[-2][0].endswith('Frase 39 sobre planos e preços.\n\n## Contato\n\nFale com a gente.') and chunks[-2][1] == ['Produto']
+	assert chunks[-1] == ('### Endereço\n\nRua X, 123.', ['Produto', 'Contato', 'Endereço'])
+	assert ' '.join(c for c, _ in chunks).count('Frase 39 ') == 1
+	# texto sem espaços (minificado, base64, CJK) é cortado por caracteres, sem passar do limite
+	for blob in ('x' * 50000, '漢字' * 5000, 'veja https://e.com/' + '/'.join(['ab'] * 4000) + ' fim.'):
+		pieces = list(iter_chunks(blob, 350))
+		assert all(offline_tokens(c) <= 350 for c, _ in pieces)
+		assert ''.join(c for c, _ in pieces).replace(' ', '') == blob.replace(' ', '')
+	assert offline_tokens('漢字' * 10) == 20
+
+def test_build_consumes_docs_lazily(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	import time
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setenv('STREAM_FLUSH','1')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path))
+	committed_when_pulled = []
+	def docs():  # type: ignore[no-untyped-def]
+		for i in range(5):
+			manifest = os.path.join(str(tmp_path), 'manifest.json')
+			count = json.load(open(manifest))['count'] if os.path.exists(manifest) else 0
+			committed_when_pulled.append(count)
+			time.sleep(0.05)
+			yield {'title': f'd{i}', 'url': f'http://x/{i}', 'text': f'documento {i}'}
+	build(docs(), 'rebuild')
+	# os primeiros docs já estavam persistidos antes do gerador chegar ao fim
+	assert committed_when_pulled[-1] >= 3
+
+def test_iter_local_caches_extraction_and_times_out(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import time
+	from . import ingest_docs  # type: ignore[attr-defined]
+	inp = tmp_path / 'in'
+	inp.mkdir()
+	(inp / 'a.txt').write_text('texto a')
+	(inp / 'slow.txt').write_text('texto lento')
+	monkeypatch.setattr(settings, 'INPUT_DIR', str(inp))
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path / 'out'))
+	monkeypatch.setattr(settings, 'EXTRACT_WORKERS', 1)
+	monkeypatch.setattr(settings, 'EXTRACT_TIMEOUT_S', 1)
+	real_read = ingest_docs.read_file
+	def read(path):  # type: ignore[no-untyped-def]
+		if path.endswith('slow.txt'):
+			time.sleep(5)
+		return real_read(path)
+	monkeypatch.setattr(ingest_docs, 'read_file', read)
+	t0 = time.perf_counter()
+	docs = list(ingest_docs.iter_local())
+	assert time.perf_counter() - t0 < 4
+	assert [d['title'] for d in docs] == ['a.txt']
+	# segunda passada: a.txt vem do cache; o timeout não foi cacheado e é tentado de novo
+	calls = []
+	monkeypatch.setattr(ingest_docs, 'read_file', lambda path: calls.append(path) or 'texto lento')
+	docs = list(ingest_docs.iter_local())
+	assert sorted(d['title'] for d in docs) == ['a.txt', 'slow.txt']
+	assert [os.path.basename(p) for p in calls] == ['slow.txt']
+
+def test_finalize_ann_factory_trains_and_tunes(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import numpy as np  # type: ignore[import-not-found]
+	import faiss  # type: ignore[import-not-found]
+	from .index_store import IndexWriter  # type: ignore[attr-defined]
+	monkeypatch.setenv('INDEX_FACTORY', 'IVF{nlist},Flat')
+	monkeypatch.setenv('ANN_TARGET_RECALL', '0.9')
+	rng = np.random.default_rng(0)
+	centers = rng.standard_normal((20, 16)).astype('float32')
+	x = centers[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, 16)).astype('float32')
+	x /= np.linalg.norm(x, axis=1, keepdims=True)
+	w = IndexWriter(str(tmp_path), 'rebuild')
+	w.doc_done('a', {'chunks': list(range(2000))}, 1999)
+	w.append([{'chunk_id': str(i), 'text': str(i)} for i in range(2000)], x)
+	w.finalize()
+	from .index_store import current_dir  # type: ignore[attr-defined]
+	snap = current_dir(str(tmp_path))
+	with open(os.path.join(snap, 'index.json')) as f:
+		info = json.load(f)
+	with open(os.path.join(snap, 'ann_report.json')) as f:
+		report = json.load(f)
+	assert info['factory'].startswith('IVF') and info['params'] == report['chosen']
+	chosen = [p for p in report['points'] if p['nprobe'] == info['params']['nprobe']][0]
+	assert chosen['recall'] >= 0.9
+	index = faiss.read_index(os.path.join(snap, 'index.faiss'))
+	assert faiss.extract_index_ivf(index).nprobe == info['params']['nprobe']
+	assert index.search(x[7:8], 1)[1][0][0] == 7  # labels = chunk_id
+	assert np.load(os.path.join(snap, 'ids.npy')).tolist() == list(range(2000))
+	# layout compartilhado entre workers: normas prontas e URLs em tabela mmap, fora do facets.json
+	assert np.allclose(np.load(os.path.join(snap, 'norms.npy')), 1, atol=1e-5)
+	with open(os.path.join(snap, 'facets.json')) as f:
+		assert 'url' not in json.load(f)['values']
+	assert np.load(os.path.join(snap, 'facets.url.offsets.npy')).tolist() == [0, 0]  # uma URL distinta: ''
+
+def test_finalize_exports_quantized_vectors_and_report(tmp_path, monkeypatch):  # type: ignore[no-untyped-def]
+	import numpy as np  # type: ignore[import-not-found]
+	import faiss  # type: ignore[import-not-found]
+	from .index_store import IndexWriter, current_dir  # type: ignore[attr-defined]
+	from .quant import QUANT_FILES  # type: ignore[attr-defined]
+	monkeypatch.setenv('EXPORT_QUANT', 'float16,int8,binary')
+	rng = np.random.default_rng(0)
+	x = rng.standard_normal((1500, 64)).astype('float32')
+	x /= np.linalg.norm(x, axis=1, keepdims=True)
+	w = IndexWriter(str(tmp_path), 'rebuild')
+	w.doc_done('a', {'chunks': list(range(1500))}, 1499)
+	w.append([{'chunk_id': str(i), 'text': str(i)} for i in range(1500)], x)
+	w.finalize()
+	snap = current_dir(str(tmp_path))
+	with open(os.path.join(snap, 'quant_report.json')) as f:
+		report = json.load(f)
+	kinds = report['kinds']
+	assert [kinds[k]['ratio'] for k in ('float16', 'int8', 'binary')] == [2.0, 4.0, 32.0]
+	assert kinds['float16']['recall'] >= 0.99 and kinds['int8']['recall'] >= 0.9
+	assert kinds['binary']['rescored'][-1]['recall'] > kinds['binary']['recall']  # rescore recupera o que o sinal perde
+	assert faiss.read_index(os.path.join(snap, 'vectors.sq8.faiss')).ntotal == 1500
+	assert np.load(os.path.join(snap, 'vectors.bin.npy')).shape == (1500, 8)
+	# sem snapshots o export reusa OUT_DIR: representações que saíram de EXPORT_QUANT são removidas
+	monkeypatch.setenv('EXPORT_SNAPSHOTS', '0')
+	flat = str(tmp_path / 'flat')
+	os.makedirs(flat)
+	w = IndexWriter(flat, 'rebuild')
+	w.doc_done('a', {'chunks': list(range(1500))}, 1499)
+	w.append([{'chunk_id': str(i), 'text': str(i)} for i in range(1500)], x)
+	w.finalize()
+	monkeypatch.setenv('EXPORT_QUANT', 'binary')
+	monkeypatch.setenv('QUANT_REPORT', '0')
+	w.finalize()
+	files = set(os.listdir(flat))
+	assert files & set(QUANT_FILES.values()) == {'vectors.bin.npy'} and 'quant_report.json' not in files
+
+def test_bm25_postings_match_bruteforce(tmp_path):  # type: ignore[no-untyped-def]
+	import math
+	import numpy as np  # type: ignore[import-not-found]
+	from .lexical import BM25Builder, tokenize  # type: ignore[attr-defined]
+	texts = ['Plano Every Pro X-200', 'o plano básico', '', 'MISSÃO: produtividade com o plano pro', 'x 200 x 200 código']
+	b = BM25Builder(str(tmp_path), k1=1.2, b=0.75, suffix='')
+	for row, t in enumerate(texts):
+		b.add(row, t)
+	b.finish(len(texts), block=3)  # vários blocos no counting sort
+	assert not list(tmp_path.glob('*.spill'))
+	info = json.loads((tmp_path / 'bm25.json').read_text())
+	vocab = (tmp_path / 'bm25.vocab.bin').read_bytes().decode().split('\n')[:-1]
+	assert vocab == sorted(vocab) and 'missao' in vocab and 'básico' not in vocab
+	offsets, rows, impact = (np.load(tmp_path / f'bm25.{n}.npy') for n in ('offsets', 'rows', 'impact'))
+	docs = [tokenize(t) for t in texts]
+	avgdl = sum(map(len, docs)) / len(docs)
+	assert math.isclose(info['avgdl'], avgdl)
+	for t, term in enumerate(vocab):
+		lo, hi = offsets[t], offsets[t+1]
+		expect = [(r, d.count(term)) for r, d in enumerate(docs) if term in d]
+		assert rows[lo:hi].tolist() == [r for r, _ in expect]
+		for (r, tf), got in zip(expect, impact[lo:hi]):
+			assert math.isclose(got, tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(docs[r]) / avgdl)), rel_tol=1e-3)
+
+def test_stage_metrics_cover_build_and_export_textfile(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	from . import metrics  # type: ignore[attr-defined]
+	monkeypatch.setenv('OFFLINE_EMBED','1')
+	monkeypatch.setenv('EMBED_CACHE','0')
+	monkeypatch.setattr(settings, 'OUT_DIR', str(tmp_path / 'out'))
+	before = {s: metrics.STAGE_SECONDS.count(s) for s in ('chunk', 'dedup', 'embed', 'persist', 'export')}
+	exporter = metrics.Exporter(str(tmp_path / 'indexer.prom'), interval=0.01).start()
+	build([{'title':'A','url':'http://x/a','text':'# Título\n\nPrimeiro parágrafo. Segunda frase.'},
+		{'title':'B','url':'http://x/b','text':'Outro documento qualquer.'}], 'rebuild')
+	exporter.stop()
+	assert all(metrics.STAGE_SECONDS.count(s) > n for s, n in before.items())
+	text = open(tmp_path / 'indexer.prom').read()
+	assert '# TYPE indexer_stage_seconds histogram' in text and 'indexer_stage_seconds_count{stage="embed"}' in text
+	assert 'indexer_stage_items_total{stage="persist"}' in text and 'persist:' in metrics.summary()
+
+def test_resume_after_kill_at_random_points(monkeypatch, tmp_path):  # type: ignore[no-untyped-def]
+	import random, multiprocessing
+	from . import index_store  # type: ignore[attr-defined]
+	from .bench_chunking import synthetic_docs  # type: ignore[attr-defined]
+	from .embedding import hash_embed  # type: ignore[attr-defined]
+	from .index_store import current_dir, MANIFEST_FILE  # type: ignore[attr-defined]
+	for k, v in {'OFFLINE_EMBED': '1', 'EMBED_CACHE': '0', 'EMBED_BATCH': '3', 'STREAM_FLUSH': '3', 'EMBED_CONCURRENCY': '2'}.items():
+		monkeypatch.setenv(k, v)
+	monkeypatch.setattr(settings, 'CHUNK_SIZE_TOKENS', 60)
+	texts = synthetic_docs(12, seed=3)
+	docs = [{'title': f'D{i}', 'url': f'http://x/{i}', 'text': t} for i, t in enumerate(texts + texts[:2])]
+	state = {'counts': {}, 'kill': None, 'log': ''}
+	def point(where):  # type: ignore[no-untyped-def]
+		n = state['counts'][where] = state['counts'].get(where, 0) + 1
+		if state['kill'] == (where, n):
+			os._exit(9)  # SIGKILL/OOM: sem finally, sem flush
+	def embed(batch):  # type: ignore[no-untyped-def]
+		point('embed')
+		with open(state['log'], 'a') as f:
+			f.write(''.join(t.replace('\n', ' ') + '\n' for t in batch))
+		return hash_embed(batch, 32)
+	append_bytes, fsync_write = index_store.IndexWriter._append_bytes, index_store._fsync_write
+	def killable_append(self, key, data):  # type: ignore[no-untyped-def]
+		append_bytes(self, key, data)
+		point('append')  # bytes no arquivo, manifest ainda sem o novo tamanho
+	def killable_fsync_write(path, data):  # type: ignore[no-untyped-def]
+		with open(path + '.tmp', 'wb') as f:
+			f.write(data[:len(data) // 2])
+		point('fsync')  # .tmp pela metade, antes do os.replace do manifest/CURRENT
+		fsync_write(path, data)
+	monkeypatch.setattr('indexer.src.embedding.offline_embed', embed)
+	monkeypatch.setattr(index_store.IndexWriter, '_append_bytes', killable_append)
+	monkeypatch.setattr(index_store, '_fsync_write', killable_fsync_write)
+	def chunks(out):  # type: ignore[no-untyped-def]
+		with open(os.path.join(current_dir(out), 'chunks.jsonl')) as f:
+			return sorted((m['url'], m['text']) for m in map(json.loads, f))
+	def committed(out):  # type: ignore[no-untyped-def]
+		with open(os.path.join(out, MANIFEST_FILE)) as f:
+			m = json.load(f)
+		with open(os.path.join(out, m['files']['meta']), 'rb') as f:
+			return {json.loads(l)['text'].replace('\n', ' ') for l in f.read(m['sizes']['meta']).splitlines()}
+	ref = str(tmp_path / 'ref')
+	monkeypatch.setattr(settings, 'OUT_DIR', ref)
+	state['log'] = str(tmp_path / 'ref.log')
+	build(docs, 'rebuild')
+	expected, totals = chunks(ref), dict(state['counts'])
+	assert totals['embed'] > 6 and totals['append'] > 6 and len(expected) == len(set(expected))
+	rng = random.Random(7)
+	# morte dentro do embed, entre gravar os dados e commitar o manifest e no meio da troca do manifest
+	for trial, where in enumerate(('embed', 'append', 'fsync', 'append')):
+		out = str(tmp_path / f'run{trial}')
+		monkeypatch.setattr(settings, 'OUT_DIR', out)
+		for attempt in range(4):
+			at = where if attempt == 0 else rng.choice(sorted(totals))
+			state.update(counts={}, kill=(at, rng.randint(1, totals[at] // 2)) if attempt < 2 else None, log=str(tmp_path / f'{trial}-{attempt}.log'))
+			before = committed(out) if attempt else set()
+			p = multiprocessing.get_context('fork').Process(target=build, args=(docs, 'rebuild'), kwargs={'resume': attempt > 0})
+			p.start(); p.join()
+			if os.path.exists(state['log']):
+				with open(state['log']) as f:
+					assert not before & set(f.read().splitlines())  # nada commitado é embedado de novo
+			if p.exitcode == 0:
+				break
+			assert p.exitcode == 9
+		assert attempt > 0 and chunks(out) == expected  # a 1ª tentativa sempre morre; o índice retomado = build limpo
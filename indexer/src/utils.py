@@ -1,10 +1,13 @@
-import hashlib, logging, os
+import hashlib, logging, os, queue, threading
 try:
 	import psutil  # type: ignore[import-not-found]
 except Exception:  # pragma: no cover
 	psutil = None  # type: ignore[assignment]
 from datetime import datetime, timezone
 import re
+from typing import Dict, Any, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger("indexer")
@@ -24,6 +27,21 @@ def meta_record(chunk_id:str, title:str, url:str, source:str, tenant:str, text:s
 		'text': text
 	}
 
+def doc_fingerprint(d: Dict[str, Any]) -> Dict[str, Any]:
+	"""Fingerprint de um doc: hash do conteúdo + ETag/mtime/size quando a fonte informa."""
+	fp: Dict[str, Any] = {'sha1': sha1(d.get('text') or ''), 'source': 'site' if d['url'].startswith('http') else 'doc'}
+	for k in ('etag', 'last_modified', 'mtime', 'size'):
+		if d.get(k) is not None:
+			fp[k] = d[k]
+	return fp
+
+def same_doc(prev: Dict[str, Any], fp: Dict[str, Any]) -> bool:
+	if fp.get('etag') and prev.get('etag') == fp['etag']:
+		return True
+	if fp.get('mtime') is not None and (prev.get('mtime'), prev.get('size')) == (fp['mtime'], fp.get('size')):
+		return True
+	return prev.get('sha1') == fp['sha1']
+
 def mem_mb():
 	if psutil is None:
 		return None
@@ -38,3 +56,47 @@ def slugify(text: str, max_len: int = 80) -> str:
 	text = re.sub(r'[\s_]+', '-', text)
 	text = re.sub(r'-{2,}', '-', text)
 	return text[:max_len].strip('-') or 'doc'
+
+class _PrefetchError:
+	def __init__(self, exc: BaseException):
+		self.exc = exc
+
+_DONE = object()
+
+def prefetch(items: Iterable[T], maxsize: int) -> Iterator[T]:
+	"""Consome `items` numa thread à parte, com no máximo `maxsize` itens à frente.
+
+	Permite que o produtor (crawl) continue trabalhando enquanto o consumidor
+	(chunking/embedding) processa, sem acumular o corpus inteiro em memória.
+	Exceções do produtor são relançadas no consumidor.
+	"""
+	q: queue.Queue = queue.Queue(maxsize=max(1, maxsize))  # type: ignore[type-arg]
+	stop = threading.Event()
+	def put(item: Any) -> bool:
+		while not stop.is_set():
+			try:
+				q.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+	def run():
+		try:
+			for item in items:
+				if not put(item):
+					return
+			put(_DONE)
+		except BaseException as e:  # noqa: BLE001
+			put(_PrefetchError(e))
+	t = threading.Thread(target=run, name='prefetch', daemon=True)
+	t.start()
+	try:
+		while True:
+			item = q.get()
+			if item is _DONE:
+				return
+			if isinstance(item, _PrefetchError):
+				raise item.exc
+			yield item
+	finally:
+		stop.set()
@@ -0,0 +1,188 @@
+"""Métricas no formato de exposição de texto do Prometheus (sem prometheus_client).
+
+Compartilhado entre o indexer e a faiss-bridge: as duas imagens instalam este
+pacote (`pip install promtext/`, ver os Dockerfiles); cada serviço só monta o
+seu `Registry` e as métricas em `<serviço>/src/metrics.py`.
+
+Contadores e histogramas com labels, thread-safe. `Registry.render()` gera o
+texto do `/metrics` (bridge) ou do arquivo do textfile collector (indexer);
+gauges são lidos na hora do render por callbacks.
+
+`Sampler` é o profiler por amostragem: uma thread que lê
+`sys._current_frames()` a cada `interval` e acumula pilhas no formato
+"collapsed" (uma linha `f1;f2;f3 N`, entrada direta de flamegraph.pl /
+speedscope). Só existe enquanto está ligado; desligado não custa nada.
+"""
+import os, sys, time, threading
+from collections import Counter as _Counter
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# segundos; padrão dos histogramas (os serviços passam `buckets` para outras faixas)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+	if not names:
+		return ''
+	esc = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+	return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, esc)) + '}'
+
+def _num(v: float) -> str:
+	return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class Counter:
+	def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+		self.name, self.doc, self.labelnames = name, doc, tuple(labels)
+		self._values: Dict[Tuple[str, ...], float] = {}
+		self._lock = threading.Lock()
+
+	def inc(self, amount: float = 1, *labels: str):
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+	def value(self, *labels: str) -> float:
+		return self._values.get(labels, 0)
+
+	def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+		with self._lock:
+			return list(self._values.items())
+
+	def render(self) -> List[str]:
+		out = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+		with self._lock:
+			out += [f'{self.name}{_labels(self.labelnames, k)} {_num(v)}' for k, v in sorted(self._values.items())]
+		return out
+
+class Histogram:
+	"""Histograma cumulativo (`_bucket{le=...}`, `_sum`, `_count`) por combinação de labels."""
+	def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+		self.name, self.doc, self.labelnames = name, doc, tuple(labels)
+		self.buckets = tuple(sorted(buckets))
+		self._series: Dict[Tuple[str, ...], List[float]] = {}  # contagens por bucket + [+Inf, soma]
+		self._lock = threading.Lock()
+
+	def observe(self, value: float, *labels: str):
+		with self._lock:
+			s = self._series.get(labels)
+			if s is None:
+				s = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+			for i, b in enumerate(self.buckets):
+				if value <= b:
+					s[i] += 1
+					break
+			else:
+				s[-2] += 1
+			s[-1] += value
+
+	def count(self, *labels: str) -> int:
+		s = self._series.get(labels)
+		return int(sum(s[:-1])) if s else 0
+
+	def total(self, *labels: str) -> float:
+		s = self._series.get(labels)
+		return s[-1] if s else 0.0
+
+	def keys(self) -> List[Tuple[str, ...]]:
+		with self._lock:
+			return list(self._series)
+
+	def render(self) -> List[str]:
+		out = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+		with self._lock:
+			series = sorted((k, list(v)) for k, v in self._series.items())
+		names = self.labelnames + ('le',)
+		for k, s in series:
+			acc = 0.0
+			for b, c in zip(self.buckets + (float('inf'),), s[:-1]):
+				acc += c
+				out.append(f"{self.name}_bucket{_labels(names, k + ('+Inf' if b == float('inf') else _num(b),))} {_num(acc)}")
+			out.append(f'{self.name}_sum{_labels(self.labelnames, k)} {repr(s[-1])}')
+			out.append(f'{self.name}_count{_labels(self.labelnames, k)} {_num(acc)}')
+		return out
+
+GaugeFn = Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]
+
+class Gauge:
+	"""Valor lido no scrape: `fn()` devolve pares (valores dos labels, valor)."""
+	def __init__(self, name: str, doc: str, fn: GaugeFn, labels: Sequence[str] = (), kind: str = 'gauge'):
+		self.name, self.doc, self.fn, self.labelnames, self.kind = name, doc, fn, tuple(labels), kind
+
+	def render(self) -> List[str]:
+		out = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} {self.kind}']
+		out += [f'{self.name}{_labels(self.labelnames, k)} {_num(v)}' for k, v in self.fn()]
+		return out
+
+class Registry:
+	def __init__(self):
+		self.metrics: List[Counter | Histogram | Gauge] = []
+
+	def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+		m = Counter(name, doc, labels)
+		self.metrics.append(m)
+		return m
+
+	def histogram(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+		m = Histogram(name, doc, labels, buckets)
+		self.metrics.append(m)
+		return m
+
+	def gauge(self, name: str, doc: str, fn: GaugeFn, labels: Sequence[str] = (), kind: str = 'gauge') -> Gauge:
+		m = Gauge(name, doc, fn, labels, kind)
+		self.metrics.append(m)
+		return m
+
+	def render(self) -> str:
+		lines: List[str] = []
+		for m in self.metrics:
+			lines += m.render()
+		return '\n'.join(lines) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class Sampler:
+	"""Profiler por amostragem de todas as threads do processo (menos a própria)."""
+	def __init__(self, interval: float = 0.005):
+		self.interval = interval
+		self.stacks: _Counter[str] = _Counter()
+		self.samples = 0
+		self._stop = threading.Event()
+		self._thread: threading.Thread | None = None
+
+	def _run(self):
+		me = threading.get_ident()
+		while not self._stop.wait(self.interval):
+			threads = {t.ident: t.name for t in threading.enumerate()}
+			for tid, frame in sys._current_frames().items():
+				if tid == me:
+					continue
+				names: List[str] = []
+				f = frame
+				while f is not None:
+					code = f.f_code
+					names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+					f = f.f_back
+				names.append(threads.get(tid, str(tid)))  # raiz da pilha: nome da thread (embed-0, asyncio_1, ...)
+				self.stacks[';'.join(reversed(names))] += 1
+			self.samples += 1
+
+	def start(self) -> 'Sampler':
+		self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> 'Sampler':
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+		return self
+
+	def collapsed(self) -> str:
+		return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+	def write(self, path: str) -> str:
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		with open(path, 'w', encoding='utf-8') as f:
+			f.write(self.collapsed())
+		return path
+
+def profile_path(directory: str, name: str) -> str:
+	return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}.folded")